@@ -0,0 +1,68 @@
+import json
+import math
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+def seeded_users(seed, limit=None):
+    """Non-staff users created by `manage.py seed_load --seed <seed>`, in creation order"""
+    from api.management.commands.seed_load import username_prefix
+
+    users = User.objects.filter(username__startswith=username_prefix(seed), is_staff=False).order_by('id')
+    return list(users[:limit] if limit else users)
+
+
+def access_token(user):
+    """A JWT for user, minted directly so benchmarks don't hammer login_user"""
+    return str(AccessToken.for_user(user))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(latencies_ms, elapsed_seconds, errors=0, queries=None):
+    """p50/p95/p99, throughput and error count for one endpoint or scenario"""
+    ordered = sorted(latencies_ms)
+    summary = {
+        'requests': len(ordered),
+        'errors': errors,
+        'p50_ms': percentile(ordered, 0.50),
+        'p95_ms': percentile(ordered, 0.95),
+        'p99_ms': percentile(ordered, 0.99),
+        'mean_ms': sum(ordered) / len(ordered) if ordered else None,
+        'throughput_rps': len(ordered) / elapsed_seconds if elapsed_seconds else None,
+    }
+    if queries is not None:
+        summary['queries_per_request'] = sum(queries) / len(queries) if queries else None
+    return summary
+
+
+def compare_to_baseline(results, baseline_path, threshold):
+    """
+    Compare results against a JSON file written by an earlier run.
+    Returns a list of human-readable regressions: p95 slower than baseline by more
+    than threshold (a fraction), more queries per request than before, or an endpoint
+    the baseline measured that this run skipped.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or previous.get('skipped'):
+            continue
+        if current.get('skipped'):
+            regressions.append(f"{name}: skipped ({current['skipped']}) but measured in the baseline")
+            continue
+        if previous.get('p95_ms') and current.get('p95_ms') and current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {current['p95_ms']:.1f}ms vs baseline {previous['p95_ms']:.1f}ms")
+        if (previous.get('queries_per_request') is not None and current.get('queries_per_request') is not None
+                and current['queries_per_request'] > previous['queries_per_request']):
+            regressions.append(f"{name}: {current['queries_per_request']:.1f} queries/request "
+                               f"vs baseline {previous['queries_per_request']:.1f}")
+    return regressions
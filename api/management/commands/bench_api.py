@@ -0,0 +1,248 @@
+import json
+import tempfile
+import time
+import uuid
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from api.loadtest import access_token, compare_to_baseline, seeded_users, summarize
+from api.management.commands.seed_load import TINY_PNG
+from authentication.models import Friendship
+from chat.models import MediaAttachment
+from groupchat.models import Group
+
+ENDPOINTS = [
+    'login_user', 'get_messages', 'send_message', 'send_message_with_media', 'serve_media',
+    'search_users', 'get_friends', 'get_user_groups', 'get_group_messages', 'admin_dashboard',
+]
+
+
+class Scenario:
+    """Builds the request for the i-th call to an endpoint from the seeded dataset"""
+
+    def __init__(self, password, users):
+        self.password = password
+        self.users = users
+        self.tokens = {user.id: access_token(user) for user in users}
+        user_ids = [user.id for user in users]
+
+        self.pairs = list(Friendship.objects.filter(sender_id__in=user_ids, status='ACCEPTED')
+                          .values_list('sender_id', 'receiver_id')[:1000])
+        self.attachments = list(MediaAttachment.objects.filter(message__sender_id__in=user_ids)
+                                .values_list('id', 'message__sender_id')[:1000])
+        self.groups = [
+            (group_id, member_id) for group_id, member_id in
+            Group.members.through.objects.filter(user_id__in=user_ids).values_list('group_id', 'user_id')[:1000]
+        ]
+        admin = User.objects.filter(is_staff=True, is_active=True).first()
+        self.admin_token = access_token(admin) if admin else None
+        self.search_term = users[0].username[:-1] if users else ''
+
+    def available(self, name):
+        if name in ('get_messages', 'send_message', 'send_message_with_media', 'get_friends'):
+            return bool(self.pairs)
+        if name == 'serve_media':
+            return bool(self.attachments)
+        if name in ('get_user_groups', 'get_group_messages'):
+            return bool(self.groups)
+        if name == 'admin_dashboard':
+            return self.admin_token is not None
+        return bool(self.users)
+
+    def request(self, name, i):
+        """Returns: (method, path, token, json_body or None, files or None)"""
+        if name == 'login_user':
+            # Rotate users so suspicious-activity checks don't lock anyone out
+            user = self.users[i % len(self.users)]
+            return 'POST', '/api/auth/login/', None, {'username': user.username, 'password': self.password}, None
+        if name == 'search_users':
+            return 'GET', f'/api/auth/search/?q={self.search_term}', self.tokens[self.users[i % len(self.users)].id], None, None
+        if name == 'admin_dashboard':
+            return 'GET', '/api/auth/admin/dashboard/', self.admin_token, None, None
+
+        if name in ('get_messages', 'send_message', 'send_message_with_media', 'get_friends'):
+            sender_id, receiver_id = self.pairs[i % len(self.pairs)]
+            token = self.tokens[sender_id]
+            if name == 'get_messages':
+                return 'GET', f'/api/chat/{receiver_id}/?limit=50', token, None, None
+            if name == 'send_message':
+                return 'POST', '/api/chat/send/', token, {'receiver': receiver_id, 'text': f'bench {i}'}, None
+            if name == 'send_message_with_media':
+                return 'POST', '/api/chat/send-with-media/', token, {'receiver': receiver_id, 'text': f'bench {i}'}, \
+                    {'media': ('bench.png', TINY_PNG, 'image/png')}
+            return 'GET', '/api/auth/friends/', token, None, None
+
+        if name == 'serve_media':
+            attachment_id, sender_id = self.attachments[i % len(self.attachments)]
+            # <img> tags pass the JWT in the query string, so the media view reads it from there
+            return 'GET', f'/api/chat/media/{attachment_id}/?auth_token={self.tokens[sender_id]}', None, None, None
+
+        group_id, member_id = self.groups[i % len(self.groups)]
+        if name == 'get_user_groups':
+            return 'GET', '/api/groupchat/groups/', self.tokens[member_id], None, None
+        return 'GET', f'/api/groupchat/groups/{group_id}/messages/', self.tokens[member_id], None, None
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    lines = []
+    for key, value in fields.items():
+        lines += [f'--{boundary}'.encode(), f'Content-Disposition: form-data; name="{key}"'.encode(), b'', str(value).encode()]
+    for key, (filename, content, content_type) in files.items():
+        lines += [f'--{boundary}'.encode(),
+                  f'Content-Disposition: form-data; name="{key}"; filename="{filename}"'.encode(),
+                  f'Content-Type: {content_type}'.encode(), b'', content]
+    lines += [f'--{boundary}--'.encode(), b'']
+    return b'\r\n'.join(lines), f'multipart/form-data; boundary={boundary}'
+
+
+class Command(BaseCommand):
+    help = "Benchmark the main API endpoints against data from seed_load and report latency percentiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=None,
+                            help="Base URL of a running server (runserver, daphne, ...); default runs in-process")
+        parser.add_argument('--seed', type=int, default=1, help="Dataset created by seed_load --seed")
+        parser.add_argument('--password', default='LoadTest123!', help="Password used by seed_load")
+        parser.add_argument('--users', type=int, default=200, help="Seeded users to spread requests over")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per endpoint")
+        parser.add_argument('--concurrency', type=int, default=1, help="Parallel requests (with --url only)")
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="Comma-separated endpoint names")
+        parser.add_argument('--output', default=None, help="Write results as JSON to this file")
+        parser.add_argument('--baseline', default=None, help="Compare against a JSON file from an earlier run")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Allowed p95 slowdown vs baseline (0.2 = 20%%)")
+        parser.add_argument('--fail-on-regression', action='store_true', help="Exit with an error on regressions")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(names) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        users = seeded_users(options['seed'], options['users'])
+        if not users:
+            raise CommandError(f"No seeded users; run `manage.py seed_load --seed {options['seed']}` first")
+        scenario = Scenario(options['password'], users)
+
+        with ExitStack() as stack:
+            if options['url']:
+                send = self.remote_sender(options['url'].rstrip('/'))
+            else:
+                # Files uploaded by send_message_with_media go to a scratch MEDIA_ROOT, removed afterwards
+                media_root = stack.enter_context(tempfile.TemporaryDirectory())
+                stack.enter_context(override_settings(MEDIA_ROOT=media_root))
+                send = self.local_sender()
+                if options['concurrency'] > 1:
+                    self.stdout.write("In-process runs are sequential; ignoring --concurrency")
+                    options['concurrency'] = 1
+            results = self.run_endpoints(names, scenario, send, options)
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if options['baseline']:
+            regressions = compare_to_baseline(results, options['baseline'], options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f"REGRESSION {regression}"))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS("No regressions against baseline"))
+            elif options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+
+    def run_endpoints(self, names, scenario, send, options):
+        """Warm up and measure each endpoint in turn"""
+        results = {}
+        skipped = []
+        for name in names:
+            if not scenario.available(name):
+                # Kept in the results so a baseline comparison notices the missing numbers
+                results[name] = {'skipped': "the dataset has nothing to exercise it"}
+                skipped.append(name)
+                self.stdout.write(self.style.WARNING(f"{name}: skipped, the dataset has nothing to exercise it"))
+                continue
+
+            for i in range(options['warmup']):
+                send(scenario.request(name, i))
+
+            offset = options['warmup']
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                samples = list(executor.map(
+                    lambda i: send(scenario.request(name, offset + i)), range(options['requests'])
+                ))
+            elapsed = time.perf_counter() - started
+
+            queries = [sample[2] for sample in samples] if not options['url'] else None
+            results[name] = summarize(
+                [sample[0] for sample in samples], elapsed,
+                errors=sum(1 for sample in samples if sample[1] >= 400), queries=queries
+            )
+            self.report(name, results[name])
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"WARNING: {len(skipped)} of {len(names)} requested endpoint(s) skipped: {', '.join(skipped)}"
+            ))
+        return results
+
+    def report(self, name, result):
+        line = (f"{name:<24} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+                f"p99 {result['p99_ms']:8.2f}ms  {result['throughput_rps']:8.1f} req/s  errors {result['errors']}")
+        if result.get('queries_per_request') is not None:
+            line += f"  queries/req {result['queries_per_request']:.1f}"
+        self.stdout.write(line)
+
+    def local_sender(self):
+        """Drive the app in-process through the test client, counting queries per request"""
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'testserver')
+
+        def send(request):
+            method, path, token, body, files = request
+            headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                if files:
+                    data = dict(body, **{key: SimpleUploadedFile(*value) for key, value in files.items()})
+                    response = client.post(path, data, **headers)
+                elif method == 'POST':
+                    response = client.post(path, json.dumps(body), content_type='application/json', **headers)
+                else:
+                    response = client.get(path, **headers)
+                latency = (time.perf_counter() - started) * 1000
+            return latency, response.status_code, len(queries)
+        return send
+
+    def remote_sender(self, base_url):
+        """Drive a running server over HTTP"""
+        def send(request):
+            method, path, token, body, files = request
+            headers = {'Authorization': f'Bearer {token}'} if token else {}
+            data = None
+            if files:
+                data, headers['Content-Type'] = _multipart(body, files)
+            elif body is not None:
+                data, headers['Content-Type'] = json.dumps(body).encode(), 'application/json'
+
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(base_url + path, data, headers, method=method)) as response:
+                    response.read()
+                    code = response.status
+            except urllib.error.HTTPError as e:
+                code = e.code
+            except urllib.error.URLError:
+                code = 599
+            return (time.perf_counter() - started) * 1000, code, None
+        return send
@@ -0,0 +1,226 @@
+import multiprocessing
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from authentication.models import Profile, Friendship, UserBlock
+from chat.encryption import cipher, encrypt_text
+from chat.models import Message, MediaAttachment
+from groupchat.models import Group, GroupMessage, GroupMediaAttachment
+
+# Distinct message texts encrypted once per process and reused for every row
+PAYLOAD_POOL_SIZE = 512
+WORDS = ("hey hi ok sure thanks lunch meeting tomorrow tonight call later done review "
+         "deploy build test photo link game movie weekend coffee").split()
+
+# A 1x1 PNG, encrypted once and shared by every seeded attachment
+TINY_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082'
+)
+
+# Set in each worker by _init_worker
+_state = {}
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the timestamps we generate instead of auto_now_add's 'now'"""
+    fields = [model._meta.get_field('timestamp') for model in models]
+    previous = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, previous):
+            field.auto_now_add = value
+
+
+def username_prefix(seed):
+    return f'load{seed}_'
+
+
+def friend_index(rng, sender, user_count, friends_per_user):
+    """A friend of user index `sender` under the ring layout used for friendships"""
+    return (sender + 1 + rng.randrange(friends_per_user)) % user_count
+
+
+def group_member_indexes(group, user_count, group_size):
+    return [(group * group_size + offset) % user_count for offset in range(group_size)]
+
+
+def _init_worker(seed, days, attachment_ratio):
+    rng = random.Random(seed)
+    _state.update(
+        user_ids=list(User.objects.filter(username__startswith=username_prefix(seed), is_staff=False)
+                      .order_by('id').values_list('id', flat=True)),
+        group_ids=list(Group.objects.filter(name__startswith=username_prefix(seed))
+                       .order_by('id').values_list('id', flat=True)),
+        payloads=[
+            encrypt_text(' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 30))))
+            for _ in range(PAYLOAD_POOL_SIZE)
+        ],
+        media=cipher.encrypt(TINY_PNG),
+        now=timezone.now(),
+        span=timedelta(days=days).total_seconds(),
+        attachment_ratio=attachment_ratio,
+    )
+
+
+def _timestamp(rng):
+    return _state['now'] - timedelta(seconds=rng.random() * _state['span'])
+
+
+def _attachments(model, messages, rng, upload_to):
+    return [
+        model(message=message, file=f'{upload_to}seed_load.png', file_type='image',
+              encrypted_data=_state['media'], original_filename='seed_load.png', timestamp=message.timestamp)
+        for message in messages if rng.random() < _state['attachment_ratio']
+    ]
+
+
+def _insert_chunk(task):
+    """Insert one chunk of 1:1 or group messages; runs in a worker process"""
+    kind, chunk, count, seed, friends_per_user, group_size = task
+    rng = random.Random(f'{seed}:{kind}:{chunk}')
+    user_ids, payloads = _state['user_ids'], _state['payloads']
+    user_count = len(user_ids)
+
+    with explicit_timestamps(Message, GroupMessage, MediaAttachment, GroupMediaAttachment):
+        if kind == 'direct':
+            rows = []
+            for _ in range(count):
+                sender = rng.randrange(user_count)
+                receiver = friend_index(rng, sender, user_count, friends_per_user)
+                if rng.random() < 0.5:
+                    sender, receiver = receiver, sender
+                rows.append(Message(sender_id=user_ids[sender], receiver_id=user_ids[receiver],
+                                    encrypted_text=rng.choice(payloads), timestamp=_timestamp(rng)))
+            messages = Message.objects.bulk_create(rows)
+            MediaAttachment.objects.bulk_create(_attachments(MediaAttachment, messages, rng, 'message_attachments/'))
+        else:
+            rows = []
+            for _ in range(count):
+                group = rng.randrange(len(_state['group_ids']))
+                sender = rng.choice(group_member_indexes(group, user_count, group_size))
+                rows.append(GroupMessage(group_id=_state['group_ids'][group], sender_id=user_ids[sender],
+                                         encrypted_text=rng.choice(payloads), timestamp=_timestamp(rng)))
+            messages = GroupMessage.objects.bulk_create(rows)
+            GroupMediaAttachment.objects.bulk_create(_attachments(GroupMediaAttachment, messages, rng, 'group_attachments/'))
+    return kind, count
+
+
+class Command(BaseCommand):
+    help = "Bulk-create a deterministic synthetic dataset (users, friends, blocks, messages, groups) for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--friends-per-user', type=int, default=10)
+        parser.add_argument('--blocks', type=int, default=100)
+        parser.add_argument('--messages', type=int, default=100000, help="1:1 messages between friends")
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--group-size', type=int, default=20)
+        parser.add_argument('--group-messages', type=int, default=100000)
+        parser.add_argument('--attachment-ratio', type=float, default=0.01,
+                            help="Fraction of messages that get an image attachment")
+        parser.add_argument('--days', type=int, default=365, help="Spread message timestamps over this many days")
+        parser.add_argument('--seed', type=int, default=1, help="Same seed, same dataset; also prefixes usernames")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk insert")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Insert processes (default: CPU count, 1 on SQLite)")
+        parser.add_argument('--password', default='LoadTest123!', help="Password for every seeded user")
+
+    def handle(self, *args, **options):
+        seed, prefix = options['seed'], username_prefix(options['seed'])
+        user_count = options['users']
+        friends_per_user = min(options['friends_per_user'], user_count - 1)
+        group_size = min(options['group_size'], user_count)
+        batch_size = options['batch_size']
+        if user_count < 2:
+            raise CommandError("--users must be at least 2")
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f"Users with prefix {prefix} already exist; pick another --seed")
+
+        workers = options['workers'] or (1 if connection.vendor == 'sqlite' else multiprocessing.cpu_count())
+        rng = random.Random(seed)
+        started = time.monotonic()
+
+        # Bulk inserts skip signals, so the friend and block caches fill lazily
+        password = make_password(options['password'])
+        users = User.objects.bulk_create(
+            [User(username=f'{prefix}{index}', email=f'{prefix}{index}@example.com', password=password)
+             for index in range(user_count)],
+            batch_size=batch_size
+        )
+        user_ids = list(User.objects.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True))
+        # Staff account for bench_api's admin_dashboard; kept out of the friend, group and message layout
+        admin = User.objects.create(username=f'{prefix}admin', email=f'{prefix}admin@example.com',
+                                    password=password, is_staff=True)
+        Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in user_ids + [admin.id]], batch_size=batch_size)
+        self.stdout.write(f"Created {len(users)} users and profiles, plus staff user {admin.username}")
+
+        # Ring layout: user i is friends with the next friends_per_user users
+        pairs = {
+            tuple(sorted((index, (index + offset) % user_count)))
+            for index in range(user_count) for offset in range(1, friends_per_user + 1)
+        }
+        friendships = [
+            Friendship(sender_id=user_ids[low], receiver_id=user_ids[high], status='ACCEPTED')
+            for low, high in sorted(pairs)
+        ]
+        Friendship.objects.bulk_create(friendships, batch_size=batch_size, ignore_conflicts=True)
+
+        blocks = {tuple(rng.sample(user_ids, 2)) for _ in range(options['blocks'])}
+        UserBlock.objects.bulk_create(
+            [UserBlock(blocker_id=blocker, blocked_id=blocked) for blocker, blocked in blocks],
+            batch_size=batch_size, ignore_conflicts=True
+        )
+        self.stdout.write(f"Created {len(friendships)} friendships and {len(blocks)} blocks")
+
+        if options['groups']:
+            Group.objects.bulk_create(
+                [Group(name=f'{prefix}group{index}', creator_id=user_ids[group_member_indexes(index, user_count, group_size)[0]])
+                 for index in range(options['groups'])],
+                batch_size=batch_size
+            )
+            group_ids = list(Group.objects.filter(name__startswith=prefix).order_by('id').values_list('id', flat=True))
+            Group.members.through.objects.bulk_create(
+                [Group.members.through(group_id=group_id, user_id=user_ids[member])
+                 for index, group_id in enumerate(group_ids)
+                 for member in set(group_member_indexes(index, user_count, group_size))],
+                batch_size=batch_size
+            )
+            self.stdout.write(f"Created {len(group_ids)} groups of {group_size}")
+
+        tasks = []
+        for kind, total in (('direct', options['messages']),
+                            ('group', options['group_messages'] if options['groups'] else 0)):
+            for chunk, start in enumerate(range(0, total, batch_size)):
+                tasks.append((kind, chunk, min(batch_size, total - start), seed, friends_per_user, group_size))
+
+        # Children must open their own database connections
+        connections.close_all()
+        init_args = (seed, options['days'], options['attachment_ratio'])
+        inserted = {'direct': 0, 'group': 0}
+        if workers > 1:
+            with multiprocessing.get_context('fork').Pool(workers, _init_worker, init_args) as pool:
+                for kind, count in pool.imap_unordered(_insert_chunk, tasks):
+                    inserted[kind] += count
+        else:
+            _init_worker(*init_args)
+            for task in tasks:
+                kind, count = _insert_chunk(task)
+                inserted[kind] += count
+
+        elapsed = time.monotonic() - started
+        total = inserted['direct'] + inserted['group']
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {inserted['direct']} messages and {inserted['group']} group messages "
+            f"with {workers} worker(s) in {elapsed:.1f}s ({total / max(elapsed, 0.001):,.0f} messages/s)"
+        ))
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import random
+import resource
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.loadtest import access_token, compare_to_baseline, seeded_users, summarize
+
+# Load-test frames carry their send time so receivers can measure delivery latency
+FRAME_PREFIX = 'lt'
+
+
+def rss_bytes():
+    """Resident memory of this process (falls back to peak RSS off Linux)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class CommunicatorTransport:
+    """Runs ChatConsumer in this process through the channels test communicator"""
+
+    def __init__(self, path):
+        from channels.testing import WebsocketCommunicator
+        from backend.asgi import application
+
+        self.communicator = WebsocketCommunicator(application, path, headers=[(b'origin', b'http://localhost')])
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        return connected
+
+    async def send(self, text):
+        await self.communicator.send_to(text_data=text)
+
+    async def receive(self, timeout):
+        """Next text frame, None on timeout; raises ConnectionError when the server closes"""
+        # receive_output() would cancel the consumer on a timeout, so wait on its queue directly
+        try:
+            output = await asyncio.wait_for(self.communicator.output_queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if output['type'] == 'websocket.close':
+            raise ConnectionError(output.get('code'))
+        return output.get('text')
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class WebsocketsTransport:
+    """Talks to a running ASGI server; needs the optional websockets package"""
+
+    def __init__(self, url):
+        self.url = url
+        self.socket = None
+
+    async def connect(self):
+        import websockets
+
+        try:
+            self.socket = await websockets.connect(self.url, origin='http://localhost')
+        except (OSError, websockets.WebSocketException):
+            return False
+        return True
+
+    async def send(self, text):
+        await self.socket.send(text)
+
+    async def receive(self, timeout):
+        import websockets
+
+        try:
+            return await asyncio.wait_for(self.socket.recv(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        except websockets.ConnectionClosed as e:
+            raise ConnectionError(e.code)
+
+    async def close(self):
+        await self.socket.close()
+
+
+class LoadClient:
+    def __init__(self, transport, index, room_size, receiver_id):
+        self.transport = transport
+        self.index = index
+        self.room_size = room_size
+        self.receiver_id = receiver_id
+        self.sent = 0
+        self.received = 0
+        self.resyncs = 0
+        self.closed_code = None
+        self.latencies = []
+
+    async def read(self, running):
+        while True:
+            try:
+                text = await self.transport.receive(0.5)
+            except ConnectionError as e:
+                self.closed_code = e.args[0] if e.args else None
+                return
+            if text is None:
+                if not running.is_set():
+                    return
+                continue
+
+            frame = json.loads(text)
+            if frame.get('resync'):
+                self.resyncs += 1
+            message = frame.get('message', '')
+            if message.startswith(FRAME_PREFIX + ':'):
+                self.received += 1
+                self.latencies.append((time.perf_counter() - float(message.rsplit(':', 1)[1])) * 1000)
+
+    async def write(self, rate, duration):
+        deadline = time.perf_counter() + duration
+        rng = random.Random(self.index)
+        # Stagger the first send so clients don't fire in lockstep
+        await asyncio.sleep(rng.random() / rate)
+        while time.perf_counter() < deadline and self.closed_code is None:
+            await self.transport.send(json.dumps({
+                'message': f'{FRAME_PREFIX}:{self.index}:{self.sent}:{time.perf_counter()}',
+                'receiver_id': self.receiver_id,
+            }))
+            self.sent += 1
+            await asyncio.sleep(rng.expovariate(rate))
+
+
+class Command(BaseCommand):
+    help = "Open many ChatConsumer sockets across rooms, send at a fixed rate and measure fan-out latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--room-size', type=int, default=10, help="Sockets per chat room")
+        parser.add_argument('--rate', type=float, default=0.5, help="Messages per second per socket")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds of sending")
+        parser.add_argument('--drain', type=float, default=5, help="Seconds to wait for late frames")
+        parser.add_argument('--connect-concurrency', type=int, default=100, help="Handshakes in flight at once")
+        parser.add_argument('--url', default=None,
+                            help="ws://host:port of a running ASGI server; default runs the consumer in-process")
+        parser.add_argument('--layer', choices=['configured', 'memory'], default='configured',
+                            help="In-process only: use CHANNEL_LAYERS as configured or force InMemoryChannelLayer")
+        parser.add_argument('--seed', type=int, default=1, help="Dataset created by seed_load --seed")
+        parser.add_argument('--output', default=None, help="Write results as JSON to this file")
+        parser.add_argument('--baseline', default=None, help="Compare against a JSON file from an earlier run")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Allowed p95 slowdown vs baseline")
+
+    def handle(self, *args, **options):
+        users = seeded_users(options['seed'])
+        if len(users) < 2:
+            raise CommandError(f"Not enough seeded users; run `manage.py seed_load --seed {options['seed']}` first")
+        if options['url']:
+            try:
+                import websockets  # noqa: F401
+            except ImportError:
+                raise CommandError("--url needs the websockets package")
+        elif options['layer'] == 'memory':
+            settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+        tokens = [access_token(user) for user in users]
+        result = asyncio.run(self.run(options, users, tokens))
+
+        self.stdout.write(
+            f"connections {result['connected']}/{options['connections']}  sent {result['sent']}  "
+            f"delivered {result['delivered']}/{result['expected']}  dropped {result['dropped']}  "
+            f"resyncs {result['resyncs']}  server closes {result['closed']}"
+        )
+        delivery = result['delivery']
+        if delivery['p50_ms'] is not None:
+            self.stdout.write(
+                f"delivery p50 {delivery['p50_ms']:.2f}ms  p95 {delivery['p95_ms']:.2f}ms  "
+                f"p99 {delivery['p99_ms']:.2f}ms  {delivery['throughput_rps']:.0f} frames/s"
+            )
+        if result['memory_per_connection_kb'] is not None:
+            self.stdout.write(f"server memory ~{result['memory_per_connection_kb']:.1f} KB per connection")
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(result, output_file, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['baseline']:
+            for regression in compare_to_baseline({'delivery': delivery},
+                                                  options['baseline'], options['threshold']):
+                self.stdout.write(self.style.ERROR(f"REGRESSION {regression}"))
+
+    async def run(self, options, users, tokens):
+        room_size = max(1, options['room_size'])
+        clients = []
+        for index in range(options['connections']):
+            room = index // room_size
+            user_index = index % len(users)
+            path = f"/ws/chat/load{room}/?token={tokens[user_index]}"
+            transport = WebsocketsTransport(options['url'].rstrip('/') + path) if options['url'] \
+                else CommunicatorTransport(path)
+            # The consumer fans out to the whole room regardless of receiver_id; addressing
+            # ourselves keeps seeded blocks from diverting frames and skewing the drop count
+            members = min(room_size, options['connections'] - room * room_size)
+            clients.append(LoadClient(transport, index, members, users[user_index].id))
+
+        memory_before = rss_bytes()
+        gate = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def connect(client):
+            async with gate:
+                return await client.transport.connect()
+
+        connected_flags = await asyncio.gather(*(connect(client) for client in clients))
+        connected = [client for client, ok in zip(clients, connected_flags) if ok]
+        memory_after = rss_bytes()
+
+        running = asyncio.Event()
+        running.set()
+        readers = [asyncio.create_task(client.read(running)) for client in connected]
+        started = time.perf_counter()
+        await asyncio.gather(*(client.write(options['rate'], options['duration']) for client in connected))
+
+        # Let in-flight frames arrive, then stop the readers
+        await asyncio.sleep(options['drain'])
+        running.clear()
+        await asyncio.gather(*readers)
+        elapsed = time.perf_counter() - started
+        await asyncio.gather(*(client.transport.close() for client in connected), return_exceptions=True)
+
+        sent = sum(client.sent for client in connected)
+        delivered = sum(client.received for client in connected)
+        # Every socket in a room receives every frame sent to the room, including its own
+        expected = sum(client.sent * client.room_size for client in connected)
+        latencies = [latency for client in connected for latency in client.latencies]
+        return {
+            'connected': len(connected),
+            'sent': sent,
+            'delivered': delivered,
+            'expected': expected,
+            'dropped': max(0, expected - delivered),
+            'resyncs': sum(client.resyncs for client in connected),
+            'closed': sum(1 for client in connected if client.closed_code is not None),
+            'delivery': summarize(latencies, elapsed),
+            'memory_per_connection_kb': (
+                (memory_after - memory_before) / len(connected) / 1024
+                if connected and not options['url'] else None
+            ),
+        }
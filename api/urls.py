@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import hello_world
+from .views import hello_world, database_stats
 
 urlpatterns = [
     path('hello/', hello_world),
+    path('admin/db-stats/', database_stats),
 ]
@@ -1,5 +1,34 @@
-from django.http import JsonResponse
+import hmac
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from backend import metrics as metrics_registry
+from backend.db import connection_stats
 
 def hello_world(request):
     response = JsonResponse({"message": "Hello, World!! Welcome to the Social Media Marketplace!"})
     return response
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def database_stats(request):
+    """Database connection and pool stats for the worker that serves the request"""
+    return Response(connection_stats())
+
+def metrics(request):
+    """Prometheus scrape endpoint for this worker's in-process metrics"""
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        return HttpResponse(status=404)
+
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = settings.DEBUG or request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    # Staff signed in to the admin can always look
+    if not allowed and not request.user.is_staff:
+        return HttpResponse(status=403)
+
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
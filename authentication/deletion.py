@@ -0,0 +1,230 @@
+import logging
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.utils import timezone
+from .models import (DeletionJob, Profile, Friendship, VerificationDocument, OTPVerification,
+                     LoginAttempt, Report, UserBlock)
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+
+def _batch_size():
+    return getattr(settings, 'DELETION_BATCH_SIZE', 1000)
+
+
+class DeletionCancelled(Exception):
+    """The target of a deletion job is no longer soft-deleted, so nothing more may be purged"""
+
+
+def is_pending(target_type, target_id):
+    """
+    True while a deletion of the target is queued, running or waiting for a retry.
+    This, not is_active, is what marks an account as deleted: unverified and locked-out
+    accounts are inactive too.
+    """
+    return DeletionJob.objects.filter(
+        target_type=target_type, target_id=target_id, status__in=DeletionJob.OPEN_STATUSES
+    ).exists()
+
+
+def schedule_user_deletion(user, requested_by=None):
+    """
+    Soft-delete a user: lock the account now and queue the purge.
+    Returns the (possibly already existing) DeletionJob.
+    """
+    with transaction.atomic():
+        # Inactive users can't log in or use their existing tokens
+        if user.is_active:
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+
+        job, _ = DeletionJob.objects.get_or_create(
+            target_type='USER',
+            target_id=user.id,
+            status__in=DeletionJob.OPEN_STATUSES,
+            defaults={'target_name': user.username, 'requested_by': requested_by, 'status': 'PENDING'}
+        )
+    return job
+
+
+def schedule_group_deletion(group, requested_by=None):
+    """
+    Soft-delete a group: hide it from every member now and queue the purge.
+    Returns the (possibly already existing) DeletionJob.
+    """
+    with transaction.atomic():
+        if group.deleted_at is None:
+            group.deleted_at = timezone.now()
+            group.save(update_fields=['deleted_at'])
+            # One DELETE on the membership table; listings and membership checks stop seeing the group
+            group.members.clear()
+
+        job, _ = DeletionJob.objects.get_or_create(
+            target_type='GROUP',
+            target_id=group.id,
+            status__in=DeletionJob.OPEN_STATUSES,
+            defaults={'target_name': group.name, 'requested_by': requested_by, 'status': 'PENDING'}
+        )
+    return job
+
+
+def _delete_files(storage_files):
+    """Remove blob files after the rows pointing at them are gone"""
+    deleted = 0
+    for field_file in storage_files:
+        try:
+            field_file.storage.delete(field_file.name)
+            deleted += 1
+        except Exception as e:
+            logger.error(f"Error deleting file {field_file.name}: {str(e)}")
+    return deleted
+
+
+def _check_target(job):
+    """Raise DeletionCancelled if the job's target has been brought back since it was queued"""
+    if job.target_type == 'USER':
+        restored = User.objects.filter(id=job.target_id, is_active=True)
+    else:
+        from groupchat.models import Group
+        restored = Group.objects.filter(id=job.target_id, deleted_at__isnull=True)
+    if restored.exists():
+        raise DeletionCancelled(f"{job.target_type.lower()} {job.target_id} is no longer deleted")
+
+
+def delete_in_batches(job, step, queryset, file_field=None):
+    """
+    Delete queryset in short transactions of DELETION_BATCH_SIZE rows,
+    recording progress on the job after every batch. The target is re-checked
+    before each batch so a restored account or group stops losing data.
+    """
+    job.current_step = step
+    job.save(update_fields=['current_step', 'updated_at'])
+
+    model = queryset.model
+    batch_size = _batch_size()
+    while True:
+        if file_field:
+            rows = list(queryset.only('pk', file_field)[:batch_size])
+            ids = [row.pk for row in rows]
+            files = [getattr(row, file_field) for row in rows if getattr(row, file_field)]
+        else:
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            files = []
+
+        if not ids:
+            break
+        _check_target(job)
+
+        # The progress is committed with the batch, so a retried job never counts a row twice
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(pk__in=ids).delete()
+            DeletionJob.objects.filter(pk=job.pk).update(
+                rows_deleted=models.F('rows_deleted') + deleted, updated_at=timezone.now()
+            )
+
+        # Files go only after the rows are committed, so a failed batch never loses data
+        if files:
+            DeletionJob.objects.filter(pk=job.pk).update(
+                files_deleted=models.F('files_deleted') + _delete_files(files), updated_at=timezone.now()
+            )
+        job.refresh_from_db(fields=['rows_deleted', 'files_deleted'])
+        logger.info(f"Deletion job {job.pk} ({step}): {job.rows_deleted} rows, {job.files_deleted} files deleted")
+
+
+def purge_group(job):
+    """Delete a queued group's messages and attachments in batches, then the group itself"""
+    from groupchat.models import Group, GroupMessage, GroupMediaAttachment, GroupReadCursor, GroupMessageArchive
+
+    group_id = job.target_id
+    delete_in_batches(job, 'group attachments',
+                      GroupMediaAttachment.objects.filter(message__group_id=group_id), 'file')
+    delete_in_batches(job, 'group messages', GroupMessage.objects.filter(group_id=group_id))
+    delete_in_batches(job, 'group archives', GroupMessageArchive.objects.filter(group_id=group_id))
+    delete_in_batches(job, 'group read cursors', GroupReadCursor.objects.filter(group_id=group_id))
+    delete_in_batches(job, 'group', Group.objects.filter(id=group_id))
+
+
+def purge_user(job):
+    """Delete a queued user's data in batches, biggest tables first, then the user row"""
+    from chat.models import Message, MediaAttachment, MessageArchive
+    from groupchat.models import Group, GroupMessage, GroupMediaAttachment, GroupReadCursor, GroupMessageArchive
+
+    user_id = job.target_id
+
+    # Groups the user created go with them, same as the old CASCADE
+    for group_id in Group.objects.filter(creator_id=user_id).values_list('id', flat=True):
+        delete_in_batches(job, f'group {group_id} attachments',
+                          GroupMediaAttachment.objects.filter(message__group_id=group_id), 'file')
+        delete_in_batches(job, f'group {group_id} messages', GroupMessage.objects.filter(group_id=group_id))
+        delete_in_batches(job, f'group {group_id} archives', GroupMessageArchive.objects.filter(group_id=group_id))
+        delete_in_batches(job, f'group {group_id}', Group.objects.filter(id=group_id))
+
+    delete_in_batches(job, 'chat attachments', MediaAttachment.objects.filter(
+        models.Q(message__sender_id=user_id) | models.Q(message__receiver_id=user_id)), 'file')
+    delete_in_batches(job, 'chat messages', Message.objects.filter(
+        models.Q(sender_id=user_id) | models.Q(receiver_id=user_id)))
+    delete_in_batches(job, 'chat archives', MessageArchive.objects.filter(
+        models.Q(user_low_id=user_id) | models.Q(user_high_id=user_id)))
+    delete_in_batches(job, 'group attachments',
+                      GroupMediaAttachment.objects.filter(message__sender_id=user_id), 'file')
+    delete_in_batches(job, 'group messages', GroupMessage.objects.filter(sender_id=user_id))
+    delete_in_batches(job, 'group read cursors', GroupReadCursor.objects.filter(user_id=user_id))
+
+    # LoginAttempt has no foreign key, so CASCADE never cleaned these up
+    if job.target_name:
+        delete_in_batches(job, 'login attempts', LoginAttempt.objects.filter(username=job.target_name))
+
+    delete_in_batches(job, 'friendships', Friendship.objects.filter(
+        models.Q(sender_id=user_id) | models.Q(receiver_id=user_id)))
+    delete_in_batches(job, 'blocks', UserBlock.objects.filter(
+        models.Q(blocker_id=user_id) | models.Q(blocked_id=user_id)))
+    delete_in_batches(job, 'reports', Report.objects.filter(
+        models.Q(reporter_id=user_id) | models.Q(reported_user_id=user_id)), 'evidence_screenshot')
+    delete_in_batches(job, 'otps', OTPVerification.objects.filter(user_id=user_id))
+    delete_in_batches(job, 'verification documents',
+                      VerificationDocument.objects.filter(user_id=user_id), 'document_file')
+    delete_in_batches(job, 'profile', Profile.objects.filter(user_id=user_id), 'profile_picture')
+
+    # Whatever is left is small enough for a normal cascade
+    delete_in_batches(job, 'user', User.objects.filter(id=user_id))
+
+
+def run_job(job):
+    """Run one deletion job to completion, recording failures on the job"""
+    job.status = 'RUNNING'
+    job.error = None
+    job.save(update_fields=['status', 'error', 'updated_at'])
+
+    try:
+        if job.target_type == 'USER':
+            purge_user(job)
+        else:
+            purge_group(job)
+    except DeletionCancelled as e:
+        logger.warning(f"Deletion job {job.pk} cancelled: {str(e)}")
+        job.status = 'CANCELLED'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        return job
+    except Exception as e:
+        logger.error(f"Deletion job {job.pk} failed: {str(e)}")
+        job.status = 'FAILED'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        return job
+
+    job.status = 'DONE'
+    job.current_step = ''
+    job.completed_at = timezone.now()
+    job.save(update_fields=['status', 'current_step', 'completed_at', 'updated_at'])
+    return job
+
+
+def run_pending_jobs(limit=None):
+    """Run queued deletion jobs oldest first; returns the jobs that were processed"""
+    jobs = DeletionJob.objects.filter(status__in=['PENDING', 'FAILED']).order_by('created_at')
+    if limit:
+        jobs = jobs[:limit]
+    return [run_job(job) for job in jobs]
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db.models import Q
+from backend.cache import get_or_compute, invalidate_keys, make_key
+
+# Cached set of accepted friend ids per user, dropped by the Friendship signal handlers in models.py
+FRIENDS_NAMESPACE = 'friend_ids'
+
+
+def _ttl():
+    return getattr(settings, 'FRIENDS_CACHE_TTL_SECONDS', 300)
+
+
+def _key(user_id):
+    return make_key(FRIENDS_NAMESPACE, user_id)
+
+
+def get_friend_ids(user_id):
+    """Return the ids of a user's accepted friends, from the cache when possible"""
+    def load():
+        from .models import Friendship
+
+        friendships = Friendship.objects.filter(
+            Q(sender_id=user_id) | Q(receiver_id=user_id),
+            status='ACCEPTED'
+        ).values_list('sender_id', 'receiver_id')
+        return frozenset(
+            receiver_id if sender_id == user_id else sender_id
+            for sender_id, receiver_id in friendships
+        )
+
+    return get_or_compute(_key(user_id), load, _ttl())
+
+
+def invalidate(*user_ids):
+    """Forget the cached friends of the given users"""
+    invalidate_keys(*[_key(user_id) for user_id in user_ids])
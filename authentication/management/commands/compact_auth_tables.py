@@ -0,0 +1,32 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from authentication.retention import compact_login_attempts, purge_otps
+
+
+class Command(BaseCommand):
+    help = "Roll old login attempts into daily totals and purge used or expired OTPs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Keep this many days of raw login attempts (default LOGIN_ATTEMPT_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows deleted per statement")
+        parser.add_argument('--loop', action='store_true', help="Keep running on a schedule")
+        parser.add_argument('--interval', type=int, default=3600, help="Seconds between runs with --loop")
+
+    def handle(self, *args, **options):
+        if options['batch_size']:
+            settings.RETENTION_BATCH_SIZE = options['batch_size']
+        if options['days'] is not None:
+            settings.LOGIN_ATTEMPT_RETENTION_DAYS = options['days']
+
+        while True:
+            attempts = compact_login_attempts()
+            otps = purge_otps()
+            self.stdout.write(self.style.SUCCESS(
+                f"Compacted {attempts} login attempts, purged {otps} OTPs"
+            ))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from authentication.deletion import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Purge accounts and groups queued for deletion, in bounded batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of jobs to run")
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows deleted per transaction")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new jobs")
+        parser.add_argument('--interval', type=int, default=30, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        if options['batch_size']:
+            settings.DELETION_BATCH_SIZE = options['batch_size']
+
+        while True:
+            for job in run_pending_jobs(limit=options['limit']):
+                line = (f"{job} - {job.rows_deleted} rows, {job.files_deleted} files deleted")
+                if job.status == 'FAILED':
+                    self.stderr.write(self.style.ERROR(f"{line}: {job.error}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(line))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0017_deletionjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginAttemptDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150)),
+                ('date', models.DateField()),
+                ('successes', models.IntegerField(default=0)),
+                ('failures', models.IntegerField(default=0)),
+                ('distinct_ips', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['username', 'timestamp'], name='loginattempt_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['timestamp'], name='loginattempt_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otpverification',
+            index=models.Index(fields=['user', 'purpose', 'created_at'], name='otp_user_purpose_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otpverification',
+            index=models.Index(fields=['created_at'], name='otp_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='loginattemptdaily',
+            unique_together={('username', 'date')},
+        ),
+    ]
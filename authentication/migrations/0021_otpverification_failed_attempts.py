@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0020_moderation_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='otpverification',
+            name='failed_attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
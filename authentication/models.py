@@ -1,7 +1,7 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 import uuid
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
@@ -28,6 +28,15 @@ class Profile(models.Model):
     verification_notes = models.TextField(blank=True, null=True)  # Admin feedback for rejection
     verification_date = models.DateTimeField(blank=True, null=True)  # When verification was completed
     email_verified = models.BooleanField(default=False)
+    # Moderation work-queue lease (see authentication/moderation.py)
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Admin pending-verification queue, paged by id
+            models.Index(fields=['verification_status', 'id'], name='profile_status_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.verification_status}"
@@ -79,6 +88,15 @@ class OTPVerification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_used = models.BooleanField(default=False)
     purpose = models.CharField(max_length=20, default="EMAIL_VERIFICATION")
+    failed_attempts = models.IntegerField(default=0)  # Wrong guesses; OTP_MAX_ATTEMPTS locks it
+
+    class Meta:
+        indexes = [
+            # Verification looks up a user's latest OTP for a purpose
+            models.Index(fields=['user', 'purpose', 'created_at'], name='otp_user_purpose_idx'),
+            # The retention purge walks expired rows by age
+            models.Index(fields=['created_at'], name='otp_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.purpose} OTP"
@@ -92,10 +110,35 @@ class LoginAttempt(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     flagged = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # check_suspicious_activity filters by username on every login
+            models.Index(fields=['username', 'timestamp'], name='loginattempt_user_ts_idx'),
+            # Retention compaction walks old attempts by age
+            models.Index(fields=['timestamp'], name='loginattempt_ts_idx'),
+            # Admin suspicious-activity queue, paged newest first
+            models.Index(fields=['flagged', 'timestamp', 'id'], name='loginattempt_flagged_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{self.username} - {'Success' if self.success else 'Failed'} - {self.timestamp}"
 
 
+class LoginAttemptDaily(models.Model):
+    """Per-user daily totals that old LoginAttempt rows are compacted into (see retention.py)"""
+    username = models.CharField(max_length=150)
+    date = models.DateField()
+    successes = models.IntegerField(default=0)
+    failures = models.IntegerField(default=0)
+    distinct_ips = models.IntegerField(default=0)  # Lower bound if a day was compacted in several runs
+
+    class Meta:
+        unique_together = ('username', 'date')
+
+    def __str__(self):
+        return f"{self.username} - {self.date} - {self.successes} ok / {self.failures} failed"
+
+
 class Report(models.Model):
     REPORT_TYPES = [
         ('ABUSE', 'Abusive Content'),
@@ -122,6 +165,16 @@ class Report(models.Model):
     admin_notes = models.TextField(blank=True, null=True)  # For admin use
     resolved_at = models.DateTimeField(null=True, blank=True)
     resolved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reports_resolved')
+    # Moderation work-queue lease (see authentication/moderation.py)
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Admin report queue, paged newest first with or without a status filter
+            models.Index(fields=['status', 'created_at', 'id'], name='report_status_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='report_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.reporter.username} reported {self.reported_user.username} for {self.get_report_type_display()}"
@@ -139,21 +192,70 @@ class UserBlock(models.Model):
         return f"{self.blocker.username} blocked {self.blocked.username}"
 
 
+class DeletionJob(models.Model):
+    """Account or group queued for deletion; the rows are purged in batches outside the request"""
+    TARGET_CHOICES = [
+        ('USER', 'User Account'),
+        ('GROUP', 'Group'),
+    ]
+
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+        ('CANCELLED', 'Cancelled'),  # The target was brought back before the purge finished
+    ]
+    # A target with a job in one of these states is being deleted (see deletion.is_pending)
+    OPEN_STATUSES = ['PENDING', 'RUNNING', 'FAILED']
+
+    target_type = models.CharField(max_length=10, choices=TARGET_CHOICES)
+    target_id = models.BigIntegerField()
+    target_name = models.CharField(max_length=255, blank=True)  # Username or group name, for progress reports
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='deletion_requests')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    rows_deleted = models.BigIntegerField(default=0)
+    files_deleted = models.IntegerField(default=0)
+    current_step = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='deletionjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Delete {self.get_target_type_display()} {self.target_name or self.target_id} - {self.status}"
+
+
 @receiver(post_save, sender=UserBlock)
-def handle_block_updates(sender, instance, created, **kwargs):
-    """When a user blocks someone, update any active chats or friend relationships"""
-    from chat.models import Message
+def broadcast_block_created(sender, instance, created, **kwargs):
+    """Drop cached block pairs and update open sockets once a block is created"""
+    from chat.block_cache import broadcast_block_change
 
     if created:
-        # Instead of deleting friendships, we just mark messages as blocked
-        # This way the friendship and chat history remain intact
-
-        # Mark messages as blocked instead of deleting them
-        Message.objects.filter(
-            (models.Q(sender=instance.blocker, receiver=instance.blocked) |
-             models.Q(sender=instance.blocked, receiver=instance.blocker)),
-            timestamp__gte=timezone.now() - timedelta(days=7)  # Changed created_at to timestamp
-        ).update(blocked=True)
-
-        # DON'T delete the friendship
-        # We've removed this line: Friendship.objects.filter(...).delete()
+        transaction.on_commit(
+            lambda: broadcast_block_change(instance.blocker_id, instance.blocked_id, True)
+        )
+
+
+@receiver(post_delete, sender=UserBlock)
+def broadcast_block_deleted(sender, instance, **kwargs):
+    """Drop cached block pairs and update open sockets once a block is removed"""
+    from chat.block_cache import broadcast_block_change
+
+    transaction.on_commit(
+        lambda: broadcast_block_change(instance.blocker_id, instance.blocked_id, False)
+    )
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def invalidate_friend_cache(sender, instance, **kwargs):
+    """Drop both users' cached friend lists when a friendship changes"""
+    from .friends import invalidate
+
+    transaction.on_commit(lambda: invalidate(instance.sender_id, instance.receiver_id))
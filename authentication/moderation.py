@@ -0,0 +1,62 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Profile, Report
+
+# Queue name -> (model, filter for items still waiting for review, oldest-first ordering)
+QUEUES = {
+    'reports': (Report, Q(status__in=['PENDING', 'REVIEWING']), ('created_at', 'id')),
+    'verifications': (Profile, Q(verification_status='PENDING'), ('id',)),
+}
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'MODERATION_LEASE_SECONDS', 600))
+
+
+def _claimable(admin, now):
+    """Unclaimed, lease expired, or already leased to this admin"""
+    return Q(claimed_by__isnull=True) | Q(claim_expires_at__lte=now) | Q(claimed_by=admin)
+
+
+def claim(queue, admin, count):
+    """
+    Lease up to `count` of the oldest waiting items in a queue to admin. Rows another admin
+    is claiming at the same moment are skipped rather than waited on (SKIP LOCKED), so
+    concurrent moderators always get disjoint items. Items the admin already holds count
+    towards `count` and have their lease renewed.
+    Returns: (queryset of the leased items, lease expiry)
+    """
+    model, waiting, ordering = QUEUES[queue]
+    now = timezone.now()
+    expires_at = now + _lease()
+
+    with transaction.atomic():
+        ids = list(
+            model.objects.filter(waiting, _claimable(admin, now))
+            .select_for_update(skip_locked=True)
+            .order_by(*ordering)
+            .values_list('id', flat=True)[:count]
+        )
+        # Re-checked in the UPDATE for backends without row locks
+        model.objects.filter(_claimable(admin, now), id__in=ids).update(claimed_by=admin, claim_expires_at=expires_at)
+
+    return model.objects.filter(id__in=ids, claimed_by=admin).order_by(*ordering), expires_at
+
+
+def release(queue, admin, ids):
+    """Give back items admin holds without reviewing them. Returns how many were released."""
+    model = QUEUES[queue][0]
+    return model.objects.filter(id__in=ids, claimed_by=admin).update(claimed_by=None, claim_expires_at=None)
+
+
+def held_by_other(item, admin):
+    """True while another admin's lease on the item is live"""
+    return (
+        item.claimed_by_id is not None
+        and item.claimed_by_id != admin.id
+        and item.claim_expires_at is not None
+        and item.claim_expires_at > timezone.now()
+    )
@@ -0,0 +1,130 @@
+import hashlib
+import hmac
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from backend import metrics
+from .models import OTPVerification
+from .utils import generate_otp
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# One live OTP per (user, purpose); issuing a new one replaces the old. The cache only saves
+# looking up the newest row: whether the OTP is used or locked, and its failed-guess count,
+# live on the OTPVerification row so every worker sees the same state.
+OTP_KEY = 'otp:{}:{}'
+
+# verify() results
+VALID = 'valid'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+LOCKED = 'locked'
+
+
+def _ttl():
+    return getattr(settings, 'OTP_EXPIRY_MINUTES', 10) * 60
+
+
+def _max_attempts():
+    return getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+
+
+def _digest(otp):
+    """Keyed hash of an OTP so the cache never holds the code itself"""
+    return hmac.new(settings.SECRET_KEY.encode(), str(otp).encode(), hashlib.sha256).hexdigest()
+
+
+def _live(record_id):
+    """Queryset matching the OTP's row only while it is unused and not locked"""
+    return OTPVerification.objects.filter(id=record_id, is_used=False, failed_attempts__lt=_max_attempts())
+
+
+def _refused(record_id):
+    """Why the row no longer matches _live(): LOCKED after too many guesses, otherwise EXPIRED"""
+    attempts = OTPVerification.objects.filter(id=record_id).values_list('failed_attempts', flat=True).first()
+    return LOCKED if attempts is not None and attempts >= _max_attempts() else EXPIRED
+
+
+def issue(user, purpose):
+    """
+    Create a new OTP for (user, purpose), replacing any earlier one.
+    The cache entry holds the OTP's hash; the OTPVerification row holds its state.
+    Returns the OTP to send to the user.
+    """
+    otp = generate_otp()
+    record = OTPVerification.objects.create(user=user, otp=otp, purpose=purpose)
+    cache.set(OTP_KEY.format(user.id, purpose), {
+        'digest': _digest(otp),
+        'record_id': record.id,
+        'expires_at': record.created_at + timedelta(seconds=_ttl()),
+    }, _ttl())
+    return otp
+
+
+def _load(user, purpose):
+    """Cached entry for (user, purpose), rebuilt from the newest live row after a cache miss"""
+    key = OTP_KEY.format(user.id, purpose)
+    entry = cache.get(key)
+    metrics.cache_lookups.inc(cache='otp', result='miss' if entry is None else 'hit')
+    if entry is not None:
+        return entry
+
+    # One indexed lookup on (user, purpose, created_at); only the newest OTP counts
+    record = OTPVerification.objects.filter(user=user, purpose=purpose).order_by('-created_at').first()
+    if not record or record.is_used:
+        return None
+
+    expires_at = record.created_at + timedelta(seconds=_ttl())
+    remaining = (expires_at - timezone.now()).total_seconds()
+    if remaining <= 0:
+        return None
+
+    entry = {'digest': _digest(record.otp), 'record_id': record.id, 'expires_at': expires_at}
+    cache.set(key, entry, int(remaining) + 1)
+    return entry
+
+
+def verify(user, purpose, otp, consume=True):
+    """
+    Check an OTP in constant time. Each wrong guess counts against OTP_MAX_ATTEMPTS;
+    once they run out the OTP is burned and a new one has to be requested.
+    With consume=False a correct OTP stays valid for a later step (e.g. reset_password).
+    Returns one of VALID, INVALID, EXPIRED or LOCKED.
+    """
+    key = OTP_KEY.format(user.id, purpose)
+    entry = _load(user, purpose)
+    if entry is None:
+        return EXPIRED
+
+    remaining = (entry['expires_at'] - timezone.now()).total_seconds()
+    if remaining <= 0:
+        cache.delete(key)
+        return EXPIRED
+
+    record_id = entry['record_id']
+    if not hmac.compare_digest(entry['digest'], _digest(otp or '')):
+        # Counted in the row with a conditional UPDATE, so parallel guesses on any worker can't share an attempt
+        if not _live(record_id).update(failed_attempts=F('failed_attempts') + 1):
+            return _refused(record_id)
+        attempts = OTPVerification.objects.filter(id=record_id).values_list('failed_attempts', flat=True).first()
+        if attempts is not None and attempts >= _max_attempts():
+            logger.warning(f"OTP for user {user.id} ({purpose}) locked after {attempts} failed attempts")
+            cache.delete(key)
+            metrics.login_lock_events.inc(kind='otp')
+            return LOCKED
+        return INVALID
+
+    # A cached entry can outlive the OTP being used or locked through another worker
+    if consume:
+        if not _live(record_id).update(is_used=True):
+            cache.delete(key)
+            return _refused(record_id)
+        cache.delete(key)
+    elif not _live(record_id).exists():
+        cache.delete(key)
+        return _refused(record_id)
+    return VALID
@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import LoginAttempt, LoginAttemptDaily, OTPVerification
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def _batch_size():
+    return getattr(settings, 'RETENTION_BATCH_SIZE', 5000)
+
+
+def login_attempt_cutoff():
+    """
+    Midnight before which unflagged attempts are compacted. Never inside the window
+    check_suspicious_activity looks at, so compaction can't change a login decision.
+    """
+    retention = timedelta(days=getattr(settings, 'LOGIN_ATTEMPT_RETENTION_DAYS', 30))
+    window = getattr(settings, 'LOGIN_ATTEMPT_WINDOW', timedelta(hours=24))
+    cutoff = timezone.localtime() - max(retention, window)
+    return timezone.make_aware(datetime.combine(cutoff.date(), time.min))
+
+
+def _add_daily_totals(attempts):
+    """Add per-user, per-day counts of the given attempts to LoginAttemptDaily"""
+    totals = attempts.annotate(date=TruncDate('timestamp')).values('username', 'date').annotate(
+        successes=models.Count('id', filter=models.Q(success=True)),
+        failures=models.Count('id', filter=models.Q(success=False)),
+        distinct_ips=models.Count('ip_address', distinct=True),
+    )
+    for row in totals:
+        daily, created = LoginAttemptDaily.objects.select_for_update().get_or_create(
+            username=row['username'], date=row['date'],
+            defaults={'successes': row['successes'], 'failures': row['failures'],
+                      'distinct_ips': row['distinct_ips']}
+        )
+        if not created:
+            daily.successes += row['successes']
+            daily.failures += row['failures']
+            daily.distinct_ips = max(daily.distinct_ips, row['distinct_ips'])
+            daily.save()
+
+
+def compact_login_attempts(cutoff=None):
+    """
+    Roll unflagged LoginAttempt rows older than cutoff into LoginAttemptDaily, one day at a time.
+    Flagged attempts are kept for the admin review queue.
+    Returns the number of attempts removed.
+    """
+    cutoff = cutoff or login_attempt_cutoff()
+    old_attempts = LoginAttempt.objects.filter(timestamp__lt=cutoff, flagged=False)
+    removed = 0
+
+    while True:
+        oldest = old_attempts.order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None:
+            break
+        day_start = timezone.make_aware(datetime.combine(timezone.localtime(oldest).date(), time.min))
+        day = old_attempts.filter(timestamp__gte=day_start, timestamp__lt=min(day_start + timedelta(days=1), cutoff))
+
+        # Each chunk is counted and deleted in its own transaction, so no lock is held for a whole
+        # busy day and a run stopped part way leaves only uncounted rows behind for the next one.
+        # Ordered by username so a user's day is usually counted in one chunk (see distinct_ips).
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    day.select_for_update().order_by('username', 'id').values_list('id', flat=True)[:_batch_size()]
+                )
+                if not ids:
+                    break
+                chunk = LoginAttempt.objects.filter(id__in=ids)
+                _add_daily_totals(chunk)
+                removed += chunk.delete()[0]
+
+        logger.info(f"Compacted login attempts for {day_start:%Y-%m-%d}, {removed} removed so far")
+    return removed
+
+
+def purge_otps():
+    """
+    Delete OTPs that are used or past OTP_EXPIRY_MINUTES, in batches.
+    Returns the number of rows deleted.
+    """
+    expired_before = timezone.now() - timedelta(minutes=getattr(settings, 'OTP_EXPIRY_MINUTES', 10))
+    stale = OTPVerification.objects.filter(models.Q(is_used=True) | models.Q(created_at__lt=expired_before))
+    deleted = 0
+    while True:
+        ids = list(stale.values_list('id', flat=True)[:_batch_size()])
+        if not ids:
+            break
+        with transaction.atomic():
+            deleted += OTPVerification.objects.filter(id__in=ids).delete()[0]
+    if deleted:
+        logger.info(f"Purged {deleted} used or expired OTPs")
+    return deleted
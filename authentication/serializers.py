@@ -1,10 +1,11 @@
 from rest_framework import serializers
+from backend.profiling import TimedSerializerMixin
 from django.contrib.auth.models import User
 from .models import Profile, VerificationDocument, OTPVerification, Report, UserBlock
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     is_admin = serializers.BooleanField(source="is_staff", read_only=True)
 
     class Meta:
@@ -12,7 +13,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "email", "is_admin"]
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     bio = serializers.CharField(required=False, allow_blank=True)
 
@@ -33,7 +34,7 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         fields = ["username"]
 
 
-class VerificationDocumentSerializer(serializers.ModelSerializer):
+class VerificationDocumentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     document_file_url = serializers.SerializerMethodField()
 
     class Meta:
@@ -54,7 +55,7 @@ class VerificationDocumentSubmitSerializer(serializers.ModelSerializer):
         fields = ['document_type', 'document_file', 'description']
 
 
-class PendingVerificationSerializer(serializers.ModelSerializer):
+class PendingVerificationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     documents = serializers.SerializerMethodField()
 
@@ -63,7 +64,8 @@ class PendingVerificationSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'verification_status', 'verification_notes', 'verification_date', 'documents']
 
     def get_documents(self, obj):
-        documents = VerificationDocument.objects.filter(user=obj.user)
+        # Uses the prefetched documents when the queryset was built with prefetch_related
+        documents = obj.user.verification_documents.all()
         return VerificationDocumentSerializer(documents, many=True, context=self.context).data
 
 
@@ -110,7 +112,7 @@ class ResetPasswordSerializer(serializers.Serializer):
         return data
 
 
-class ReportSerializer(serializers.ModelSerializer):
+class ReportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     reporter_username = serializers.SerializerMethodField()
     reported_username = serializers.SerializerMethodField()
     report_type_display = serializers.SerializerMethodField()
@@ -138,7 +140,7 @@ class ReportCreateSerializer(serializers.ModelSerializer):
         fields = ['reported_user', 'report_type', 'content', 'evidence_screenshot']
 
 
-class UserBlockSerializer(serializers.ModelSerializer):
+class UserBlockSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     blocked_username = serializers.SerializerMethodField()
 
     class Meta:
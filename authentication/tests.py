@@ -1,3 +1,605 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from backend.testing import QueryScalingTestCase, make_users
+from groupchat import membership
+from groupchat.models import Group, GroupMessage, GroupMediaAttachment, GroupReadCursor
+from . import deletion, otp_store, retention
+from .models import (Profile, Friendship, VerificationDocument, LoginAttempt, LoginAttemptDaily, Report, UserBlock,
+                     DeletionJob, OTPVerification)
 
-# Create your tests here.
+PASSWORD = 'Scaling-Test-123'
+
+
+@override_settings(ADMIN_MASTER_KEY='scaling-master-key')
+class AuthenticationEndpointScalingTests(QueryScalingTestCase):
+    """Every URL in authentication/urls.py keeps a flat query count as the tables grow"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', PASSWORD)
+        self.admin = User.objects.create_user('admin', 'admin@example.com', PASSWORD, is_staff=True)
+        Profile.objects.create(user=self.user)
+        Profile.objects.create(user=self.admin)
+        # Login takes a shorter path for users with no login history; keep both runs on the usual one
+        LoginAttempt.objects.create(username='owner', ip_address='127.0.0.1', success=True)
+        self.document = VerificationDocument.objects.create(
+            user=self.user, document_type='ID_CARD',
+            document_file=SimpleUploadedFile('id.png', b'\x89PNG scaling test')
+        )
+
+        # One-shot targets, one per measured run
+        self.inactive = make_users('inactive', 2, is_active=False)
+        self.email_otps = [otp_store.issue(user, 'EMAIL_VERIFICATION') for user in self.inactive]
+        self.resetters = make_users('resetter', 2)
+        self.reset_otps = [otp_store.issue(user, 'PASSWORD_RESET') for user in self.resetters]
+        self.leavers = make_users('leaver', 2)
+        for user in self.leavers:
+            user.set_password(PASSWORD)
+            user.save()
+
+        self.friends, self.requesters, self.strangers = [], [], []
+        self.pending_requests, self.peer_documents, self.flagged_attempts = [], [], []
+
+    def grow(self, count):
+        """Add friends, incoming requests and blocked strangers, each with documents, reports and flagged logins"""
+        peers = make_users('peer', count)
+        for index, peer in enumerate(peers):
+            [self.friends, self.requesters, self.strangers][index % 3].append(peer)
+
+        Friendship.objects.bulk_create(
+            [Friendship(sender=self.user, receiver=peer, status='ACCEPTED') for peer in peers[0::3]] +
+            [Friendship(sender=peer, receiver=self.user, status='PENDING') for peer in peers[1::3]]
+        )
+        self.pending_requests = list(Friendship.objects.filter(receiver=self.user, status='PENDING').order_by('id'))
+        UserBlock.objects.bulk_create([UserBlock(blocker=self.user, blocked=peer) for peer in peers[2::3]])
+
+        Profile.objects.filter(user__in=peers).update(verification_status='PENDING')
+        VerificationDocument.objects.bulk_create([
+            VerificationDocument(user=peer, document_type='ID_CARD', document_file='verification_docs/peer.png')
+            for peer in peers
+        ])
+        self.peer_documents = list(VerificationDocument.objects.filter(user__username__startswith='peer').order_by('id'))
+
+        Report.objects.bulk_create(
+            [Report(reporter=peer, reported_user=self.user, report_type='SPAM', content='spam') for peer in peers] +
+            [Report(reporter=self.user, reported_user=peer, report_type='ABUSE', content='abuse') for peer in peers]
+        )
+        LoginAttempt.objects.bulk_create([
+            LoginAttempt(username=peer.username, ip_address='10.0.0.1', success=False, flagged=True) for peer in peers
+        ])
+        self.flagged_attempts = list(LoginAttempt.objects.filter(flagged=True).order_by('id'))
+        DeletionJob.objects.bulk_create([
+            DeletionJob(target_type='USER', target_id=peer.id, target_name=peer.username, status='DONE') for peer in peers
+        ])
+
+    # Registration, login and password reset
+
+    def test_register(self):
+        self.assertScales(lambda run: self.client_for().post('/api/auth/register/', {
+            'username': f'newcomer{run}', 'email': f'newcomer{run}@example.com', 'password': PASSWORD
+        }, format='json'), status=201)
+
+    def test_verify_email(self):
+        self.assertScales(lambda run: self.client_for().post('/api/auth/verify-email/', {
+            'username': self.inactive[run].username, 'otp': self.email_otps[run]
+        }, format='json'))
+
+    def test_resend_verification(self):
+        self.assertScales(lambda run: self.client_for().post(
+            '/api/auth/resend-verification/', {'username': self.inactive[run].username}, format='json'))
+
+    def test_login(self):
+        self.assertScales(lambda run: self.client_for().post(
+            '/api/auth/login/', {'username': 'owner', 'password': PASSWORD}, format='json'))
+
+    def test_verify_otp(self):
+        self.assertScales(lambda run: self.client_for().post('/api/auth/verify-otp/', {
+            'email': self.resetters[run].email, 'otp': self.reset_otps[run]
+        }, format='json'))
+
+    def test_request_password_reset(self):
+        self.assertScales(lambda run: self.client_for().post(
+            '/api/auth/request-password-reset/', {'email': self.user.email}, format='json'))
+
+    def test_reset_password(self):
+        self.assertScales(lambda run: self.client_for().post('/api/auth/reset-password/', {
+            'email': self.resetters[run].email, 'otp': self.reset_otps[run],
+            'password': 'New-Password-456', 'password2': 'New-Password-456'
+        }, format='json'))
+
+    def test_admin_account_unlock(self):
+        self.assertScales(lambda run: self.client_for().post('/api/auth/admin-unlock/', {
+            'username': 'admin', 'master_key': 'scaling-master-key'
+        }, format='json'))
+
+    # Profile and verification
+
+    def test_user_profile(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/auth/profile/'))
+
+    def test_update_profile(self):
+        self.assertScales(lambda run: self.client_for(self.user).put(
+            '/api/auth/profile/update/', {'bio': f'bio {run}'}, format='multipart'))
+
+    def test_remove_profile_picture(self):
+        self.assertScales(lambda run: self.client_for(self.user).delete('/api/auth/profile/remove_picture/'))
+
+    def test_submit_verification_document(self):
+        self.assertScales(lambda run: self.client_for(self.user).post('/api/auth/verification/submit/', {
+            'document_type': 'ID_CARD', 'document_file': SimpleUploadedFile('id.png', b'\x89PNG')
+        }, format='multipart'), status=201)
+
+    def test_get_verification_status(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/auth/verification/status/'))
+
+    def test_serve_document(self):
+        self.assertScales(lambda run: self.client_for(self.user).get(f'/api/auth/document/{self.document.id}/'))
+
+    def test_get_document_info(self):
+        self.assertScales(lambda run: self.client_for(self.user).get(f'/api/auth/document/{self.document.id}/info/'))
+
+    def test_document_view_with_token(self):
+        self.assertScales(lambda run: self.client_for().get(
+            f'/api/auth/document/{self.document.id}/view/?token={self.token_for(self.user)}'))
+
+    # Friends, search, reports and blocks
+
+    def test_get_users(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/auth/users/'))
+
+    def test_get_friends(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/auth/friends/'))
+
+    def test_search_users(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/auth/search/?q=peer'))
+
+    def test_send_friend_request(self):
+        self.assertScales(lambda run: self.client_for(self.user).post(
+            '/api/auth/friend-request/send/', {'receiver': self.strangers[run].id}, format='json'))
+
+    def test_respond_friend_request(self):
+        self.assertScales(lambda run: self.client_for(self.user).post('/api/auth/friend-request/respond/', {
+            'request_id': self.pending_requests[run].id, 'action': 'accept'
+        }, format='json'))
+
+    def test_get_friend_requests(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/auth/friend-requests/'))
+
+    def test_report_user(self):
+        self.assertScales(lambda run: self.client_for(self.user).post('/api/auth/report/', {
+            'reported_user': self.friends[run].id, 'report_type': 'SPAM', 'content': 'spam'
+        }, format='multipart'), status=201)
+
+    def test_get_my_reports(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/auth/reports/'))
+
+    def test_block_user(self):
+        self.assertScales(lambda run: self.client_for(self.user).post(
+            '/api/auth/block/', {'user_id': self.friends[run].id}, format='json'), status=201)
+
+    def test_unblock_user(self):
+        self.assertScales(lambda run: self.client_for(self.user).delete(f'/api/auth/unblock/{self.strangers[run].id}/'))
+
+    def test_get_blocked_users(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/auth/blocks/'))
+
+    def test_delete_own_account(self):
+        self.assertScales(lambda run: self.client_for(self.leavers[run]).delete(
+            '/api/auth/account/delete/', {'password': PASSWORD}, format='json'), status=202)
+
+    # Admin
+
+    def test_admin_dashboard(self):
+        self.assertScales(lambda run: self.client_for(self.admin).get('/api/auth/admin/dashboard/'))
+
+    def test_verify_user(self):
+        self.assertScales(lambda run: self.client_for(self.admin).post(f'/api/auth/admin/verify/{self.friends[run].id}/'))
+
+    def test_reject_user(self):
+        self.assertScales(lambda run: self.client_for(self.admin).post(f'/api/auth/admin/reject/{self.friends[run].id}/'))
+
+    def test_reset_user_verification(self):
+        self.assertScales(lambda run: self.client_for(self.admin).post(
+            f'/api/auth/admin/reset-verification/{self.friends[run].id}/'))
+
+    def test_get_pending_verifications(self):
+        self.assertScales(lambda run: self.client_for(self.admin).get('/api/auth/admin/verifications/'))
+
+    def test_get_pending_verifications_next_page(self):
+        def call(run):
+            first = self.client_for(self.admin).get('/api/auth/admin/verifications/?limit=2')
+            return self.client_for(self.admin).get(f'/api/auth/admin/verifications/?limit=2&after={first.data["after"]}')
+        self.assertScales(call)
+
+    def test_admin_document_review(self):
+        self.assertScales(lambda run: self.client_for(self.admin).post(
+            f'/api/auth/admin/document/{self.peer_documents[run].id}/review/', {'action': 'approve'}, format='json'))
+
+    def test_get_suspicious_activity(self):
+        self.assertScales(lambda run: self.client_for(self.admin).get('/api/auth/admin/suspicious-activity/'))
+
+    def test_get_suspicious_activity_older_page(self):
+        def call(run):
+            first = self.client_for(self.admin).get('/api/auth/admin/suspicious-activity/?limit=2')
+            return self.client_for(self.admin).get(
+                f'/api/auth/admin/suspicious-activity/?limit=2&before={first.data["before"]}')
+        self.assertScales(call)
+
+    def test_resolve_suspicious_activity(self):
+        self.assertScales(lambda run: self.client_for(self.admin).post(
+            f'/api/auth/admin/suspicious-activity/{self.flagged_attempts[run].id}/resolve/'))
+
+    def test_delete_user(self):
+        self.assertScales(lambda run: self.client_for(self.admin).delete(
+            f'/api/auth/admin/user/{self.friends[run].id}/delete/'), status=202)
+
+    def test_get_deletion_jobs(self):
+        self.assertScales(lambda run: self.client_for(self.admin).get('/api/auth/admin/deletions/'))
+
+    def test_admin_reset_login_attempts(self):
+        self.assertScales(lambda run: self.client_for(self.admin).post(
+            '/api/auth/admin/reset-login-attempts/', {'username': self.friends[run].username}, format='json'))
+
+    def test_get_all_reports(self):
+        self.assertScales(lambda run: self.client_for(self.admin).get('/api/auth/admin/reports/'))
+
+    def test_get_all_reports_older_page(self):
+        def call(run):
+            first = self.client_for(self.admin).get('/api/auth/admin/reports/?status=PENDING&limit=2')
+            return self.client_for(self.admin).get(
+                f'/api/auth/admin/reports/?status=PENDING&limit=2&before={first.data["before"]}')
+        self.assertScales(call)
+
+    def test_update_report_status(self):
+        def call(run):
+            report = Report.objects.filter(reported_user=self.user).order_by('id')[run]
+            return self.client_for(self.admin).post(
+                f'/api/auth/admin/report/{report.id}/update/', {'status': 'RESOLVED'}, format='json')
+        self.assertScales(call)
+
+    def test_claim_reports(self):
+        self.assertScales(lambda run: self.client_for(self.admin).post(
+            '/api/auth/admin/queue/reports/claim/', {'count': 20}, format='json'))
+
+    def test_claim_verifications(self):
+        self.assertScales(lambda run: self.client_for(self.admin).post(
+            '/api/auth/admin/queue/verifications/claim/', {'count': 20}, format='json'))
+
+    def test_release_reports(self):
+        def call(run):
+            claimed = self.client_for(self.admin).post('/api/auth/admin/queue/reports/claim/', {'count': 20}, format='json')
+            return self.client_for(self.admin).post('/api/auth/admin/queue/reports/release/', {
+                'ids': [report['id'] for report in claimed.data['results']]
+            }, format='json')
+        self.assertScales(call)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ModerationQueueTests(TestCase):
+    """Claims hand concurrent admins disjoint work and guard the review endpoints"""
+
+    def setUp(self):
+        self.first, self.second = make_users('moderator', 2, is_staff=True)
+        reporters = make_users('reporter', 6)
+        Report.objects.bulk_create([
+            Report(reporter=reporter, reported_user=self.first, report_type='SPAM', content='spam')
+            for reporter in reporters
+        ])
+        self.client = APIClient()
+
+    def claim(self, admin, count=4):
+        self.client.force_authenticate(admin)
+        response = self.client.post('/api/auth/admin/queue/reports/claim/', {'count': count}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [report['id'] for report in response.data['results']]
+
+    def test_admins_claim_disjoint_items(self):
+        first_ids = self.claim(self.first)
+        second_ids = self.claim(self.second)
+        self.assertEqual(len(first_ids), 4)
+        self.assertEqual(len(second_ids), 2)
+        self.assertFalse(set(first_ids) & set(second_ids))
+
+    def test_expired_lease_can_be_claimed(self):
+        first_ids = self.claim(self.first, count=6)
+        Report.objects.filter(id__in=first_ids).update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(sorted(self.claim(self.second, count=6)), sorted(first_ids))
+
+    def test_update_rejects_report_claimed_by_another_admin(self):
+        report_id = self.claim(self.first, count=1)[0]
+        self.client.force_authenticate(self.second)
+        response = self.client.post(f'/api/auth/admin/report/{report_id}/update/', {'status': 'RESOLVED'}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        self.client.force_authenticate(self.first)
+        response = self.client.post(f'/api/auth/admin/report/{report_id}/update/', {'status': 'RESOLVED'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Report.objects.get(id=report_id).claimed_by)
+
+
+@override_settings(OTP_MAX_ATTEMPTS=3, OTP_EXPIRY_MINUTES=10)
+class OTPStoreTests(TestCase):
+    """
+    OTP state lives in the database, so the per-process cache of another worker
+    (simulated here by clearing or restoring cache entries) can't widen what an OTP allows
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('otp', 'otp@example.com', PASSWORD)
+        self.otp = otp_store.issue(self.user, 'PASSWORD_RESET')
+        self.wrong = '000000' if self.otp != '000000' else '111111'
+
+    def verify(self, otp, consume=True):
+        return otp_store.verify(self.user, 'PASSWORD_RESET', otp, consume=consume)
+
+    def test_valid_otp_is_consumed(self):
+        self.assertEqual(self.verify(self.otp), otp_store.VALID)
+        self.assertEqual(self.verify(self.otp), otp_store.EXPIRED)
+
+    def test_lockout_after_max_attempts(self):
+        self.assertEqual(self.verify(self.wrong), otp_store.INVALID)
+        self.assertEqual(self.verify(self.wrong), otp_store.INVALID)
+        self.assertEqual(self.verify(self.wrong), otp_store.LOCKED)
+        self.assertEqual(self.verify(self.otp), otp_store.LOCKED)
+
+    def test_attempts_are_counted_across_workers(self):
+        self.assertEqual(self.verify(self.wrong), otp_store.INVALID)
+        cache.clear()
+        self.assertEqual(self.verify(self.wrong), otp_store.INVALID)
+        cache.clear()
+        self.assertEqual(self.verify(self.wrong), otp_store.LOCKED)
+        cache.clear()
+        self.assertEqual(self.verify(self.otp), otp_store.LOCKED)
+
+    def test_expired_otp(self):
+        OTPVerification.objects.filter(user=self.user).update(created_at=timezone.now() - timedelta(minutes=11))
+        cache.clear()
+        self.assertEqual(self.verify(self.otp), otp_store.EXPIRED)
+
+    def test_expired_cached_entry(self):
+        key = otp_store.OTP_KEY.format(self.user.id, 'PASSWORD_RESET')
+        cache.set(key, dict(cache.get(key), expires_at=timezone.now() - timedelta(seconds=1)))
+        self.assertEqual(self.verify(self.otp), otp_store.EXPIRED)
+
+    def test_reuse_through_stale_cache_entry(self):
+        key = otp_store.OTP_KEY.format(self.user.id, 'PASSWORD_RESET')
+        stale_entry = cache.get(key)
+        self.assertEqual(self.verify(self.otp), otp_store.VALID)
+        # Another worker still has the entry cached from before the OTP was used
+        cache.set(key, stale_entry)
+        self.assertEqual(self.verify(self.otp), otp_store.EXPIRED)
+
+    def test_consume_false_keeps_otp_valid(self):
+        self.assertEqual(self.verify(self.otp, consume=False), otp_store.VALID)
+        self.assertEqual(self.verify(self.otp, consume=False), otp_store.VALID)
+        self.assertEqual(self.verify(self.otp), otp_store.VALID)
+        self.assertEqual(self.verify(self.otp, consume=False), otp_store.EXPIRED)
+
+    def test_new_otp_replaces_old(self):
+        old = self.otp
+        new = otp_store.issue(self.user, 'PASSWORD_RESET')
+        if new != old:
+            self.assertEqual(self.verify(old), otp_store.INVALID)
+        self.assertEqual(self.verify(new), otp_store.VALID)
+
+
+@override_settings(RETENTION_BATCH_SIZE=2)
+class LoginAttemptCompactionTests(TestCase):
+    """Compaction counts every old attempt exactly once, even across interrupted runs"""
+
+    def setUp(self):
+        attempts = (
+            [LoginAttempt(username='alice', ip_address=f'10.0.0.{n}', success=False) for n in range(3)] +
+            [LoginAttempt(username='alice', ip_address='10.0.0.9', success=True)] +
+            [LoginAttempt(username='bob', ip_address='10.0.1.1', success=n == 0) for n in range(2)] +
+            [LoginAttempt(username='bob', ip_address='10.0.1.1', success=False, flagged=True)]
+        )
+        LoginAttempt.objects.bulk_create(attempts)
+        self.day = timezone.localtime() - timedelta(days=60)
+        LoginAttempt.objects.update(timestamp=self.day)
+
+    def totals(self):
+        return {
+            daily.username: (daily.successes, daily.failures)
+            for daily in LoginAttemptDaily.objects.filter(date=self.day.date())
+        }
+
+    def test_rerun_after_partial_compaction(self):
+        real_add = retention._add_daily_totals
+        calls = []
+
+        def fail_on_second_chunk(attempts):
+            calls.append(attempts)
+            real_add(attempts)
+            if len(calls) == 2:
+                raise RuntimeError('worker stopped')
+
+        with mock.patch.object(retention, '_add_daily_totals', side_effect=fail_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                retention.compact_login_attempts()
+        # Only the first chunk was counted and deleted; the second rolled back with its totals
+        self.assertEqual(LoginAttempt.objects.filter(flagged=False).count(), 4)
+        self.assertEqual(self.totals(), {'alice': (0, 2)})
+
+        self.assertEqual(retention.compact_login_attempts(), 4)
+        self.assertEqual(self.totals(), {'alice': (1, 3), 'bob': (1, 1)})
+        self.assertEqual(retention.compact_login_attempts(), 0)
+        self.assertEqual(self.totals(), {'alice': (1, 3), 'bob': (1, 1)})
+        # Flagged attempts stay for review
+        self.assertEqual(list(LoginAttempt.objects.values_list('flagged', flat=True)), [True])
+
+
+@override_settings(DELETION_BATCH_SIZE=2)
+class DeletionJobTests(TestCase):
+    """Queued deletions purge in recorded batches and resume cleanly after a failure"""
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.owner, self.member = make_users('deleter', 2)
+        self.group = Group.objects.create(name='doomed', creator=self.owner)
+        self.group.members.add(self.owner, self.member)
+        self.messages = [
+            GroupMessage.objects.create(group=self.group, sender=self.owner, encrypted_text=f'message {n}')
+            for n in range(5)
+        ]
+        self.attachments = []
+        for message in self.messages[:3]:
+            attachment = GroupMediaAttachment(message=message, file=SimpleUploadedFile('photo.png', b'\x89PNG'),
+                                              file_type='image')
+            attachment.save()
+            self.attachments.append(attachment)
+        GroupReadCursor.objects.create(group=self.group, user=self.member)
+        # 3 attachments + 5 messages + 1 read cursor + the group
+        self.total_rows = 10
+
+    def schedule(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return deletion.schedule_group_deletion(self.group, requested_by=self.owner)
+
+    def file_exists(self, attachment):
+        return attachment.file.storage.exists(attachment.file.name)
+
+    def test_schedule_group_deletion_clears_members(self):
+        job = self.schedule()
+        self.group.refresh_from_db()
+        self.assertIsNotNone(self.group.deleted_at)
+        self.assertEqual(self.group.members.count(), 0)
+        self.assertFalse(membership.is_member(self.group.id, self.member.id))
+        self.assertEqual((job.status, job.target_type, job.target_id), ('PENDING', 'GROUP', self.group.id))
+        # Scheduling again reuses the queued job
+        self.assertEqual(self.schedule().pk, job.pk)
+
+    def test_progress_recorded_per_batch(self):
+        job = self.schedule()
+        progress = []
+        real_update = QuerySet.update
+
+        def record_progress(queryset, **kwargs):
+            updated = real_update(queryset, **kwargs)
+            if queryset.model is DeletionJob and 'rows_deleted' in kwargs:
+                progress.append(DeletionJob.objects.get(pk=job.pk).rows_deleted)
+            return updated
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=record_progress):
+            deletion.run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'DONE')
+        self.assertEqual((job.rows_deleted, job.files_deleted), (self.total_rows, 3))
+        # Attachments 2+1, messages 2+2+1, read cursor, group
+        self.assertEqual(progress, [2, 3, 5, 7, 8, 9, 10])
+        self.assertFalse(Group.objects.filter(id=self.group.id).exists())
+
+    def test_failed_job_resumes_without_double_counting(self):
+        job = self.schedule()
+        real_delete = QuerySet.delete
+        message_batches = []
+
+        def fail_second_message_batch(queryset):
+            if queryset.model is GroupMessage:
+                message_batches.append(queryset)
+                if len(message_batches) == 2:
+                    raise RuntimeError('database went away')
+            return real_delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', autospec=True, side_effect=fail_second_message_batch):
+            deletion.run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertEqual(job.error, 'database went away')
+        self.assertEqual(job.current_step, 'group messages')
+        # The attachments and the first message batch were committed; the failed batch rolled back
+        self.assertEqual(job.rows_deleted, 5)
+        self.assertEqual(GroupMessage.objects.filter(group_id=self.group.id).count(), 3)
+
+        self.assertEqual([retried.pk for retried in deletion.run_pending_jobs()], [job.pk])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'DONE')
+        self.assertEqual((job.rows_deleted, job.files_deleted), (self.total_rows, 3))
+        self.assertFalse(GroupMessage.objects.filter(group_id=self.group.id).exists())
+        self.assertEqual(deletion.run_pending_jobs(), [])
+
+    def test_files_removed_after_rows(self):
+        self.schedule()
+        self.assertTrue(all(self.file_exists(attachment) for attachment in self.attachments))
+        real_delete_files = deletion._delete_files
+
+        def check_rows_gone(files):
+            names = [field_file.name for field_file in files]
+            self.assertFalse(GroupMediaAttachment.objects.filter(file__in=names).exists())
+            return real_delete_files(files)
+
+        with mock.patch.object(deletion, '_delete_files', side_effect=check_rows_gone) as delete_files:
+            deletion.run_pending_jobs()
+
+        self.assertEqual(delete_files.call_count, 2)
+        self.assertFalse(any(self.file_exists(attachment) for attachment in self.attachments))
+
+
+@override_settings(ADMIN_MASTER_KEY='deletion-master-key')
+class DeletedAccountTests(TestCase):
+    """A deleted account stays deleted: it is not an unverified or locked-out account"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('leaving', 'leaving@example.com', PASSWORD)
+        Profile.objects.get_or_create(user=self.user)
+        self.partner = User.objects.create_user('staying', 'staying@example.com', PASSWORD)
+        Friendship.objects.create(sender=self.user, receiver=self.partner, status='ACCEPTED')
+        self.client = APIClient()
+
+    def delete_account(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.delete('/api/auth/account/delete/', {'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.client.force_authenticate(None)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+    def test_deleted_account_cannot_verify_email_again(self):
+        # An OTP issued before the deletion must not bring the account back either
+        otp = otp_store.issue(self.user, 'EMAIL_VERIFICATION')
+        self.delete_account()
+
+        response = self.client.post('/api/auth/resend-verification/', {'username': self.user.username}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/auth/verify-email/', {'username': self.user.username, 'otp': otp},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+    def test_unlock_paths_keep_deleted_account_inactive(self):
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        self.delete_account()
+
+        response = self.client.post('/api/auth/admin-unlock/', {
+            'username': self.user.username, 'master_key': 'deletion-master-key'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        admin = User.objects.create_user('resetter', 'resetter@example.com', PASSWORD, is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.post('/api/auth/admin/reset-login-attempts/', {'username': self.user.username},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+    def test_purge_stops_when_account_is_restored(self):
+        self.delete_account()
+        # Brought back outside the API, e.g. from the Django admin
+        User.objects.filter(id=self.user.id).update(is_active=True)
+
+        job, = deletion.run_pending_jobs()
+        self.assertEqual(job.status, 'CANCELLED')
+        self.assertEqual(job.rows_deleted, 0)
+        self.assertTrue(Friendship.objects.filter(sender=self.user).exists())
+        self.assertFalse(deletion.is_pending('USER', self.user.id))
+        self.assertEqual(deletion.run_pending_jobs(), [])
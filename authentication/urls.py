@@ -9,8 +9,8 @@ from .views import (
     verify_email, resend_verification_email, get_suspicious_activity, resolve_suspicious_activity,
     delete_user, delete_own_account, admin_account_unlock, admin_reset_login_attempts,
     report_user, get_my_reports, block_user, unblock_user, get_blocked_users,
-    get_all_reports, update_report_status,
-    request_password_reset, reset_password, verify_otp
+    get_all_reports, update_report_status, claim_moderation_items, release_moderation_items,
+    request_password_reset, reset_password, verify_otp, get_deletion_jobs
 )
 
 urlpatterns = [
@@ -45,6 +45,7 @@ urlpatterns = [
     path("admin/suspicious-activity/<int:attempt_id>/resolve/", resolve_suspicious_activity, name="resolve_suspicious_activity"),
     path("admin/user/<int:user_id>/delete/", delete_user, name="delete_user"),
     path("account/delete/", delete_own_account, name="delete_own_account"),
+    path("admin/deletions/", get_deletion_jobs, name="get_deletion_jobs"),
     path("admin-unlock/", admin_account_unlock, name="admin_account_unlock"),
     path("admin/reset-login-attempts/", admin_reset_login_attempts, name="admin_reset_login_attempts"),
 
@@ -58,4 +59,6 @@ urlpatterns = [
     # Admin report management
     path("admin/reports/", get_all_reports, name="get_all_reports"),
     path("admin/report/<int:report_id>/update/", update_report_status, name="update_report_status"),
+    path("admin/queue/<str:queue>/claim/", claim_moderation_items, name="claim_moderation_items"),
+    path("admin/queue/<str:queue>/release/", release_moderation_items, name="release_moderation_items"),
 ]
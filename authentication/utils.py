@@ -1,8 +1,9 @@
-import random
+import secrets
 import string
 import logging
 from django.conf import settings
 from django.core.mail import send_mail
+from backend import metrics
 from .models import LoginAttempt
 from django.utils import timezone
 from datetime import timedelta
@@ -12,7 +13,23 @@ logger = logging.getLogger(__name__)
 
 def generate_otp():
     """Generate a 6-digit OTP"""
-    return ''.join(random.choices(string.digits, k=6))
+    return ''.join(secrets.choice(string.digits) for _ in range(6))
+
+def deliver_mail(kind, subject, message, from_email, recipient_list):
+    """
+    send_mail, tracked in /metrics. Emails go out inside the request, so emails_in_flight
+    is the number of workers currently blocked on SMTP.
+    """
+    metrics.emails_in_flight.inc()
+    try:
+        result = send_mail(subject, message, from_email, recipient_list, fail_silently=False)
+    except Exception:
+        metrics.emails_sent.inc(kind=kind, result='error')
+        raise
+    finally:
+        metrics.emails_in_flight.dec()
+    metrics.emails_sent.inc(kind=kind, result='sent' if result else 'not_sent')
+    return result
 
 def send_otp_email(user, otp, purpose="EMAIL_VERIFICATION"):
     """Send OTP email to the user"""
@@ -50,13 +67,7 @@ The Secure Chat App Team
 
     try:
         # Send the actual email
-        result = send_mail(
-            subject,
-            message,
-            from_email,
-            [user.email],
-            fail_silently=False,
-        )
+        result = deliver_mail(purpose, subject, message, from_email, [user.email])
 
         logger.info(f"Email sending result for {user.email}: {result}")
         return result
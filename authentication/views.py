@@ -1,4 +1,5 @@
 import os
+import logging
 import mimetypes
 from datetime import timedelta
 from django.http import HttpResponse
@@ -18,14 +19,21 @@ from .serializers import (ProfileSerializer, ProfileUpdateSerializer, UserUpdate
                           EmailVerificationSerializer, OTPVerificationSerializer,
                           ReportCreateSerializer, ReportSerializer, UserBlockSerializer,
                           RequestPasswordResetSerializer, ResetPasswordSerializer)
-from .models import Profile, Friendship, VerificationDocument, OTPVerification, LoginAttempt, Report, UserBlock
+from .models import Profile, Friendship, VerificationDocument, LoginAttempt, Report, UserBlock, DeletionJob
 from django.db import models, transaction
 from django.utils import timezone
-from .utils import generate_otp, send_otp_email, check_suspicious_activity
-from django.core.mail import send_mail
-from django.core.cache import cache
+from .utils import send_otp_email, check_suspicious_activity, deliver_mail
+from . import deletion
+from .deletion import schedule_user_deletion
+from . import otp_store, moderation
+from .friends import get_friend_ids
+from backend import metrics
+from backend.pagination import parse_limit, keyset_page, id_page
 from rest_framework import views, permissions
 
+# Set up logging
+logger = logging.getLogger(__name__)
+
 @api_view(["POST"])
 def register_user(request):
     """
@@ -58,12 +66,7 @@ def register_user(request):
         Profile.objects.create(user=user)
 
         # Generate and save OTP
-        otp = generate_otp()
-        OTPVerification.objects.create(
-            user=user,
-            otp=otp,
-            purpose="EMAIL_VERIFICATION"
-        )
+        otp = otp_store.issue(user, "EMAIL_VERIFICATION")
 
         # Send verification email
         send_otp_email(user, otp)
@@ -91,21 +94,19 @@ def verify_email(request):
         return Response({"error": "Invalid username or already verified"},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    # Find the most recent unused OTP for this user
-    otp_record = OTPVerification.objects.filter(
-        user=user,
-        is_used=False,
-        purpose="EMAIL_VERIFICATION",
-        created_at__gte=timezone.now() - timedelta(minutes=settings.OTP_EXPIRY_MINUTES)
-    ).order_by('-created_at').first()
+    # Deleted accounts are inactive too, but must never be switched back on
+    if deletion.is_pending('USER', user.id):
+        return Response({"error": "Invalid username or already verified"},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    if not otp_record or otp_record.otp != otp:
+    # Check against the live OTP for this user; marks it used on success
+    result = otp_store.verify(user, "EMAIL_VERIFICATION", otp)
+    if result == otp_store.LOCKED:
+        return Response({"error": "Too many incorrect attempts. Please request a new OTP."},
+                        status=status.HTTP_429_TOO_MANY_REQUESTS)
+    if result != otp_store.VALID:
         return Response({"error": "Invalid or expired OTP"}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Mark OTP as used
-    otp_record.is_used = True
-    otp_record.save()
-
     # Activate user
     user.is_active = True
     user.save()
@@ -143,13 +144,12 @@ def resend_verification_email(request):
         return Response({"error": "User not found or already verified"},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    # Generate and save new OTP
-    otp = generate_otp()
-    OTPVerification.objects.create(
-        user=user,
-        otp=otp,
-        purpose="EMAIL_VERIFICATION"
-    )
+    if deletion.is_pending('USER', user.id):
+        return Response({"error": "User not found or already verified"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Generate and save new OTP, replacing the previous one
+    otp = otp_store.issue(user, "EMAIL_VERIFICATION")
 
     # Send verification email
     send_otp_email(user, otp)
@@ -183,6 +183,7 @@ def login_user(request):
                     username=username,
                     timestamp__gte=timezone.now() - settings.LOGIN_ATTEMPT_WINDOW
                 ).update(flagged=True)
+                metrics.login_lock_events.inc(kind='suspicious_login')
 
                 # Calculate when the account will auto-unblock
                 auto_unblock_hours = getattr(settings, 'ACCOUNT_AUTO_UNBLOCK_HOURS', 1)
@@ -193,7 +194,7 @@ def login_user(request):
                 }, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
             # If there's an error in suspicious activity check, just log it and continue
-            print(f"Error checking suspicious activity: {str(e)}")
+            logger.error(f"Error checking suspicious activity: {str(e)}")
             # Don't block the login due to this error
 
         user = authenticate(username=username, password=password)
@@ -203,7 +204,7 @@ def login_user(request):
             try:
                 check_suspicious_activity(username, ip_address, user_agent, login_success=True)
             except Exception as e:
-                print(f"Error recording successful login: {str(e)}")
+                logger.error(f"Error recording successful login: {str(e)}")
                 # Don't block the login due to this error
 
             refresh = RefreshToken.for_user(user)
@@ -215,7 +216,7 @@ def login_user(request):
                 if profile.profile_picture:
                     profile_picture = request.build_absolute_uri(profile.profile_picture.url)
             except Exception as e:
-                print(f"Error getting profile picture: {str(e)}")
+                logger.warning(f"Error getting profile picture: {str(e)}")
                 # Don't fail if we can't get the profile picture
 
             return Response({
@@ -234,7 +235,7 @@ def login_user(request):
         return Response({"error": "Invalid Credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
     except Exception as e:
-        print(f"Login error: {str(e)}")
+        logger.exception(f"Login error: {str(e)}")
         return Response({"error": "An error occurred during login. Please try again."},
                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -284,11 +285,27 @@ def update_profile(request):
         "bio": profile.bio
     })
 
+def admin_queue_limit(request):
+    """Page size for the admin review queues from ?limit="""
+    return parse_limit(
+        request.query_params.get('limit'),
+        getattr(settings, 'ADMIN_QUEUE_PAGE_SIZE', 50),
+        getattr(settings, 'ADMIN_QUEUE_MAX_PAGE_SIZE', 200)
+    )
+
 @api_view(["GET"])
 @permission_classes([IsAdminUser])
 def get_suspicious_activity(request):
-    """Get flagged login attempts for admin review"""
-    flagged_attempts = LoginAttempt.objects.filter(flagged=True).order_by('-timestamp')
+    """
+    Get flagged login attempts for admin review, newest first, as {"results", "before"};
+    pass ?before=<cursor> for older pages
+    """
+    try:
+        flagged_attempts, before = keyset_page(
+            LoginAttempt.objects.filter(flagged=True), request.query_params.get('before'), admin_queue_limit(request)
+        )
+    except ValueError:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
 
     data = []
     for attempt in flagged_attempts:
@@ -302,7 +319,7 @@ def get_suspicious_activity(request):
             "reason": "Multiple failed attempts"  # This could be more specific
         })
 
-    return Response(data)
+    return Response({"results": data, "before": before})
 
 @api_view(["POST"])
 @permission_classes([IsAdminUser])
@@ -342,6 +359,10 @@ def admin_account_unlock(request):
             return Response({"error": "This feature is only for admin accounts"},
                           status=status.HTTP_403_FORBIDDEN)
 
+        if deletion.is_pending('USER', user.id):
+            return Response({"error": "This account has been deleted"},
+                          status=status.HTTP_400_BAD_REQUEST)
+
         # Delete all login attempts for this user to completely reset the account's login history
         LoginAttempt.objects.filter(username=username).delete()
 
@@ -372,9 +393,14 @@ def admin_reset_login_attempts(request):
     # Delete all login attempts for this user
     deleted_count = LoginAttempt.objects.filter(username=username).delete()[0]
 
-    # Ensure user account is active
+    # Ensure user account is active, unless it was deleted rather than locked out
     try:
         user = User.objects.get(username=username)
+        if deletion.is_pending('USER', user.id):
+            return Response({
+                "message": f"Cleared login history for {username}. The account has been deleted and stays inactive.",
+                "deleted_count": deleted_count
+            })
         if not user.is_active:
             user.is_active = True
             user.save()
@@ -409,26 +435,18 @@ def search_users(request):
     serializer = UserSerializer(users, many=True)
     data = serializer.data
 
-    # Add friendship status for each user
+    # Add friendship status for each user, from one query over all of the results
+    statuses = get_friendship_statuses(request.user.id, [user_data['id'] for user_data in data])
     for user_data in data:
-        user_data['friendship_status'] = get_friendship_status(request.user.id, user_data['id'])
+        user_data['friendship_status'] = statuses.get(user_data['id'])
 
     return Response(data)
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_friends(request):
-    # Get all accepted friendships where the user is either sender or receiver
-    friendships = Friendship.objects.filter(
-        (models.Q(sender=request.user) | models.Q(receiver=request.user)),
-        status='ACCEPTED'
-    )
-
-    # Extract friend users from friendships
-    friends = []
-    for friendship in friendships:
-        friend = friendship.receiver if friendship.sender == request.user else friendship.sender
-        friends.append(friend)
+    # Friend ids come from the shared friend cache; one query loads the users
+    friends = User.objects.filter(id__in=get_friend_ids(request.user.id)).order_by('id')
 
     serializer = UserSerializer(friends, many=True)
     return Response(serializer.data)
@@ -496,20 +514,25 @@ def get_friendship_status(user1_id, user2_id):
     except Friendship.DoesNotExist:
         return None
 
+def get_friendship_statuses(user_id, other_ids):
+    """
+    Friendship status between user_id and each of other_ids in one query
+    Returns: {other_id: status}; users without a friendship are left out
+    """
+    friendships = Friendship.objects.filter(
+        models.Q(sender_id=user_id, receiver_id__in=other_ids) |
+        models.Q(sender_id__in=other_ids, receiver_id=user_id)
+    ).values_list('sender_id', 'receiver_id', 'status')
+    return {
+        receiver_id if sender_id == user_id else sender_id: friendship_status
+        for sender_id, receiver_id, friendship_status in friendships
+    }
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_users(request):
-    # Get all accepted friendships
-    friendships = Friendship.objects.filter(
-        (models.Q(sender=request.user) | models.Q(receiver=request.user)),
-        status='ACCEPTED'
-    )
-
-    # Extract friend users from friendships
-    friends = []
-    for friendship in friendships:
-        friend = friendship.receiver if friendship.sender == request.user else friendship.sender
-        friends.append(friend)
+    # Friend ids come from the shared friend cache; one query loads the users
+    friends = User.objects.filter(id__in=get_friend_ids(request.user.id)).order_by('id')
 
     serializer = UserSerializer(friends, many=True)
     return Response(serializer.data)
@@ -517,14 +540,14 @@ def get_users(request):
 @api_view(["GET"])
 @permission_classes([IsAdminUser])  # ✅ Only Admins Can Access
 def admin_dashboard(request):
-    users = User.objects.all()
+    # Profiles and document counts come back in the same query as the users
+    users = User.objects.select_related('profile').annotate(doc_count=models.Count('verification_documents'))
     user_data = []
 
     for u in users:
         try:
-            profile = Profile.objects.get(user=u)
-            # Count documents for this user
-            doc_count = VerificationDocument.objects.filter(user=u).count()
+            profile = u.profile
+            doc_count = u.doc_count
 
             user_data.append({
                 "id": u.id,
@@ -607,7 +630,7 @@ def get_friend_requests(request):
     friend_requests = Friendship.objects.filter(
         receiver=request.user,
         status='PENDING'
-    )
+    ).select_related('sender')
 
     return Response([{
         'id': request.id,
@@ -660,10 +683,20 @@ def submit_verification_document(request):
 @api_view(["GET"])
 @permission_classes([IsAdminUser])
 def get_pending_verifications(request):
-    """Get all profiles with pending verification status"""
-    pending_profiles = Profile.objects.filter(verification_status='PENDING')
-    serializer = PendingVerificationSerializer(pending_profiles, many=True, context={'request': request})
-    return Response(serializer.data)
+    """
+    Get profiles with pending verification status, oldest first, as {"results", "after"};
+    pass ?after=<cursor> for the next page
+    """
+    pending_profiles = Profile.objects.filter(verification_status='PENDING').select_related('user')
+    try:
+        page, after = id_page(pending_profiles, request.query_params.get('after'), admin_queue_limit(request))
+    except ValueError:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # One query for the documents of the whole page
+    models.prefetch_related_objects(page, 'user__verification_documents')
+    serializer = PendingVerificationSerializer(page, many=True, context={'request': request})
+    return Response({"results": serializer.data, "after": after})
 
 @api_view(["POST"])
 @permission_classes([IsAdminUser])
@@ -681,18 +714,27 @@ def admin_document_review(request, doc_id):
         return Response({"error": "Invalid action. Use 'approve' or 'reject'"},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    profile = Profile.objects.get(user=document.user)
-    profile.verification_notes = notes
-    profile.verification_date = timezone.now()
+    with transaction.atomic():
+        # Locked so two admins reviewing the same user can't both apply a decision
+        profile = Profile.objects.select_for_update().get(user=document.user)
+        if moderation.held_by_other(profile, request.user):
+            return Response({"error": "Another admin has claimed this verification"},
+                            status=status.HTTP_409_CONFLICT)
 
-    if action == 'approve':
-        profile.verification_status = 'VERIFIED'
-        message = "User verification approved"
-    else:
-        profile.verification_status = 'REJECTED'
-        message = "User verification rejected"
+        profile.verification_notes = notes
+        profile.verification_date = timezone.now()
 
-    profile.save()
+        if action == 'approve':
+            profile.verification_status = 'VERIFIED'
+            message = "User verification approved"
+        else:
+            profile.verification_status = 'REJECTED'
+            message = "User verification rejected"
+
+        # Reviewed, so it leaves the work queue
+        profile.claimed_by = None
+        profile.claim_expires_at = None
+        profile.save()
 
     return Response({"message": message, "user": document.user.username})
 
@@ -798,12 +840,13 @@ def delete_user(request, user_id):
         user = User.objects.get(id=user_id)
         username = user.username
 
-        # Delete the user
-        user.delete()
+        # Lock the account now; the purge runs in the background (manage.py purge_deletions)
+        job = schedule_user_deletion(user, requested_by=request.user)
 
         return Response({
-            "message": f"User {username} deleted successfully."
-        })
+            "message": f"User {username} deleted successfully.",
+            "deletion_job_id": job.id
+        }, status=status.HTTP_202_ACCEPTED)
     except User.DoesNotExist:
         return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -825,12 +868,32 @@ def delete_own_account(request):
         return Response({"error": "Incorrect password"},
                        status=status.HTTP_400_BAD_REQUEST)
 
-    # Delete the user
-    user.delete()
+    # Lock the account now; the purge runs in the background (manage.py purge_deletions)
+    job = schedule_user_deletion(user, requested_by=user)
 
     return Response({
-        "message": f"Your account ({username}) has been deleted successfully."
-    })
+        "message": f"Your account ({username}) has been deleted successfully.",
+        "deletion_job_id": job.id
+    }, status=status.HTTP_202_ACCEPTED)
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def get_deletion_jobs(request):
+    """Get progress of queued and recent account/group deletions (admin only)"""
+    jobs = DeletionJob.objects.order_by('-created_at')[:100]
+    return Response([{
+        "id": job.id,
+        "target_type": job.target_type,
+        "target_id": job.target_id,
+        "target_name": job.target_name,
+        "status": job.status,
+        "current_step": job.current_step,
+        "rows_deleted": job.rows_deleted,
+        "files_deleted": job.files_deleted,
+        "error": job.error,
+        "created_at": job.created_at,
+        "completed_at": job.completed_at
+    } for job in jobs])
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -858,7 +921,7 @@ def report_user(request):
 @permission_classes([IsAuthenticated])
 def get_my_reports(request):
     """Get reports filed by the current user"""
-    reports = Report.objects.filter(reporter=request.user)
+    reports = Report.objects.filter(reporter=request.user).select_related('reporter', 'reported_user')
     serializer = ReportSerializer(reports, many=True)
     return Response(serializer.data)
 
@@ -870,7 +933,7 @@ def block_user(request):
         # Extract the user_id from request data
         user_id = request.data.get('user_id')
 
-        print(f"Received block request for user_id: {user_id}")
+        logger.debug(f"Received block request for user_id: {user_id}")
 
         if not user_id:
             return Response({"error": "User ID is required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -902,9 +965,7 @@ def block_user(request):
             "block_id": block.id
         }, status=status.HTTP_201_CREATED)
     except Exception as e:
-        import traceback
-        print(f"Error in block_user: {str(e)}")
-        traceback.print_exc()
+        logger.exception(f"Error in block_user: {str(e)}")
         return Response({"error": f"An error occurred: {str(e)}"},
                      status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -928,33 +989,76 @@ def unblock_user(request, user_id):
 @permission_classes([IsAuthenticated])
 def get_blocked_users(request):
     """Get list of users blocked by the current user"""
-    blocks = UserBlock.objects.filter(blocker=request.user)
+    blocks = UserBlock.objects.filter(blocker=request.user).select_related('blocked')
     serializer = UserBlockSerializer(blocks, many=True)
     return Response(serializer.data)
 
 @api_view(["GET"])
 @permission_classes([IsAdminUser])
 def get_all_reports(request):
-    """Get all reports (admin only)"""
+    """
+    Get reports, optionally filtered by ?status=, newest first, as {"results", "before"};
+    pass ?before=<cursor> for older pages (admin only)
+    """
     status_filter = request.query_params.get('status')
 
+    reports = Report.objects.select_related('reporter', 'reported_user')
     if status_filter:
-        reports = Report.objects.filter(status=status_filter).order_by('-created_at')
+        reports = reports.filter(status=status_filter)
+
+    try:
+        page, before = keyset_page(reports, request.query_params.get('before'), admin_queue_limit(request),
+                                   field='created_at')
+    except ValueError:
+        return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = ReportSerializer(page, many=True)
+    return Response({"results": serializer.data, "before": before})
+
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def claim_moderation_items(request, queue):
+    """
+    Lease the next `count` waiting items of the 'reports' or 'verifications' queue to this admin
+    for MODERATION_LEASE_SECONDS. Admins claiming at the same time get different items.
+    """
+    if queue not in moderation.QUEUES:
+        return Response({"error": "Unknown queue"}, status=status.HTTP_404_NOT_FOUND)
+
+    count = parse_limit(
+        request.data.get('count'),
+        getattr(settings, 'MODERATION_CLAIM_SIZE', 10),
+        getattr(settings, 'MODERATION_CLAIM_MAX', 50)
+    )
+    items, expires_at = moderation.claim(queue, request.user, count)
+
+    if queue == 'reports':
+        serializer = ReportSerializer(items.select_related('reporter', 'reported_user'), many=True)
     else:
-        reports = Report.objects.all().order_by('-created_at')
+        serializer = PendingVerificationSerializer(
+            items.select_related('user').prefetch_related('user__verification_documents'),
+            many=True, context={'request': request}
+        )
+    return Response({"results": serializer.data, "lease_expires_at": expires_at})
 
-    serializer = ReportSerializer(reports, many=True)
-    return Response(serializer.data)
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def release_moderation_items(request, queue):
+    """Hand claimed items back to the queue without reviewing them"""
+    if queue not in moderation.QUEUES:
+        return Response({"error": "Unknown queue"}, status=status.HTTP_404_NOT_FOUND)
+
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(item_id, int) for item_id in ids):
+        return Response({"error": "ids must be a list of item ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+    released = moderation.release(queue, request.user, ids)
+    return Response({"released": released})
 
 @api_view(["POST"])
 @permission_classes([IsAdminUser])
 def update_report_status(request, report_id):
     """Update a report's status (admin only)"""
-    try:
-        report = Report.objects.get(id=report_id)
-    except Report.DoesNotExist:
-        return Response({"error": "Report not found"}, status=status.HTTP_404_NOT_FOUND)
-
     new_status = request.data.get('status')
     admin_notes = request.data.get('admin_notes')
 
@@ -964,16 +1068,29 @@ def update_report_status(request, report_id):
     if new_status not in dict(Report.STATUS_CHOICES):
         return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
 
-    report.status = new_status
+    with transaction.atomic():
+        # Locked so two admins can't overwrite each other's decision
+        try:
+            report = Report.objects.select_for_update().get(id=report_id)
+        except Report.DoesNotExist:
+            return Response({"error": "Report not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if moderation.held_by_other(report, request.user):
+            return Response({"error": "Another admin has claimed this report"}, status=status.HTTP_409_CONFLICT)
+
+        report.status = new_status
 
-    if admin_notes:
-        report.admin_notes = admin_notes
+        if admin_notes:
+            report.admin_notes = admin_notes
 
-    if new_status in ['RESOLVED', 'DISMISSED']:
-        report.resolved_at = timezone.now()
-        report.resolved_by = request.user
+        if new_status in ['RESOLVED', 'DISMISSED']:
+            report.resolved_at = timezone.now()
+            report.resolved_by = request.user
+            # Closed, so it leaves the work queue
+            report.claimed_by = None
+            report.claim_expires_at = None
 
-    report.save()
+        report.save()
 
     return Response({
         "message": f"Report status updated to {report.get_status_display()}",
@@ -996,12 +1113,7 @@ def request_password_reset(request):
             # if not user.is_active:
             #     return Response({'message': 'Account is not active.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            otp = generate_otp() # Use your existing utility function
-            OTPVerification.objects.create(
-                user=user,
-                otp=otp,
-                purpose="PASSWORD_RESET" # Use a distinct purpose
-            )
+            otp = otp_store.issue(user, "PASSWORD_RESET") # Use a distinct purpose
 
             # Send email
             try:
@@ -1012,21 +1124,22 @@ def request_password_reset(request):
                 # Ensure DEFAULT_FROM_EMAIL is defined in settings
                 from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com')
                 recipient_list = [email]
-                send_mail(subject, message, from_email, recipient_list, fail_silently=False)
+                deliver_mail('PASSWORD_RESET', subject, message, from_email, recipient_list)
 
                 return Response({'message': 'OTP sent to your email.'}, status=status.HTTP_200_OK)
             except Exception as e:
-                print(f"Email sending failed for password reset {email}: {e}")
+                logger.error(f"Email sending failed for password reset {email}: {e}")
                 # Consider adding more robust error handling/logging
                 return Response({'error': 'Failed to send OTP email.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         except User.DoesNotExist:
             # Avoid user enumeration: always return a success-like message
-            print(f"Password reset requested for non-existent email: {email}")
+            logger.info(f"Password reset requested for non-existent email: {email}",
+                        extra={'sample_key': 'auth.password_reset_unknown_email'})
             # Still return OK to prevent attackers from knowing which emails are registered
             return Response({'message': 'If an account with this email exists, an OTP has been sent.'}, status=status.HTTP_200_OK)
         except Exception as e:
-            print(f"Error in request_password_reset for {email}: {e}")
+            logger.exception(f"Error in request_password_reset for {email}: {e}")
             return Response({'error': 'An unexpected error occurred.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     # If serializer is not valid
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -1055,55 +1168,17 @@ def reset_password(request):
              # If the user doesn't exist for the email, it's an invalid request
              return Response({'error': 'User with this email not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        # First check if this OTP has been verified recently
-        cache_key = f"verified_otp_{user.id}_{otp}"
-        cached_otp = cache.get(cache_key)
-
-        if cached_otp:
-            # OTP was verified previously, we can use it for password reset
-            # Find the OTP record to mark it as used
-            expiry_minutes = getattr(settings, 'OTP_EXPIRY_MINUTES', 5)
-            otp_record = OTPVerification.objects.filter(
-                user=user,
-                otp=otp,
-                purpose="PASSWORD_RESET",
-                created_at__gte=timezone.now() - timedelta(minutes=expiry_minutes)
-            ).order_by('-created_at').first()
-
-            if otp_record:
-                # Mark OTP as used now
-                otp_record.is_used = True
-                otp_record.save()
-
-                # Clear the cache
-                cache.delete(cache_key)
-
-                # Set the new password securely
-                user.set_password(password)
-                user.save()
-
-                return Response({'message': 'Password has been reset successfully.'}, status=status.HTTP_200_OK)
-
-        # If we get here, either the OTP wasn't verified or verification expired
-        # Let's check if it's a valid OTP directly as fallback
-        expiry_minutes = getattr(settings, 'OTP_EXPIRY_MINUTES', 5)
-        otp_record = OTPVerification.objects.filter(
-            user=user,
-            otp=otp, # Check if OTP matches
-            is_used=False,
-            purpose="PASSWORD_RESET",
-            created_at__gte=timezone.now() - timedelta(minutes=expiry_minutes)
-        ).order_by('-created_at').first()
-
-        if not otp_record:
-            # Log this attempt potentially? Could indicate brute-forcing OTPs
-            print(f"Invalid/Expired OTP attempt for email: {email}")
+        # Same OTP store as verify_otp; this step consumes the OTP
+        result = otp_store.verify(user, "PASSWORD_RESET", otp)
+        if result == otp_store.LOCKED:
+            return Response({'error': 'Too many incorrect attempts. Please request a new OTP.'},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS)
+        if result != otp_store.VALID:
+            # Wrong guesses are counted by the store and lock the OTP after OTP_MAX_ATTEMPTS
+            logger.warning(f"Invalid/Expired OTP attempt for email: {email}",
+                           extra={'sample_key': 'auth.invalid_reset_otp'})
             return Response({'error': 'Invalid or expired OTP.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Mark OTP as used
-        otp_record.is_used = True
-        otp_record.save()
-
         # Set the new password securely
         user.set_password(password)
         user.save()
@@ -1127,22 +1202,12 @@ def verify_otp(request):
     except User.DoesNotExist:
         return Response({'error': 'User with this email not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-    # Find the most recent unused PASSWORD_RESET OTP for this user within expiry time
-    expiry_minutes = getattr(settings, 'OTP_EXPIRY_MINUTES', 5)
-    otp_record = OTPVerification.objects.filter(
-        user=user,
-        otp=otp,  # Check if OTP matches
-        is_used=False,
-        purpose="PASSWORD_RESET",
-        created_at__gte=timezone.now() - timedelta(minutes=expiry_minutes)
-    ).order_by('-created_at').first()
-
-    if not otp_record:
+    # Don't consume the OTP here, so the same OTP can be used for verification and password reset
+    result = otp_store.verify(user, "PASSWORD_RESET", otp, consume=False)
+    if result == otp_store.LOCKED:
+        return Response({'error': 'Too many incorrect attempts. Please request a new OTP.'},
+                        status=status.HTTP_429_TOO_MANY_REQUESTS)
+    if result != otp_store.VALID:
         return Response({'error': 'Invalid or expired OTP.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Instead of marking OTP as used immediately, store it in the cache for the password reset step
-    # This way, the same OTP can be used for verification and password reset
-    cache_key = f"verified_otp_{user.id}_{otp}"
-    cache.set(cache_key, otp, timeout=expiry_minutes * 60)  # Cache for the same duration as OTP expiry
-
     return Response({'message': 'OTP verified successfully.'}, status=status.HTTP_200_OK)
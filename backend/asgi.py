@@ -3,22 +3,25 @@ ASGI config for backend project.
 """
 
 import os
-import django
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from channels.security.websocket import AllowedHostsOriginValidator
-import messaging.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
-django.setup()
+# Database connection settings are sized per worker type
+os.environ.setdefault('APP_WORKER_TYPE', 'asgi')
+django_asgi_app = get_asgi_application()
+
+# Imported after the app registry is ready since these touch models
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+from chat.middleware import JWTAuthMiddleware
+import chat.routing
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        JWTAuthMiddleware(
             URLRouter(
-                messaging.routing.websocket_urlpatterns
+                chat.routing.websocket_urlpatterns
             )
         )
     ),
@@ -0,0 +1,92 @@
+import random
+import time
+from django.conf import settings
+from django.core.cache import cache
+from backend import metrics
+
+_MISSING = object()
+
+
+def make_key(namespace, *parts, version=1):
+    """
+    Build a cache key like 'friend_ids:v1:42'. Bump version when the shape of
+    a cached value changes, so a shared cache never serves the old shape.
+    """
+    return ':'.join([namespace, f'v{version}', *(str(part) for part in parts)])
+
+
+def jittered_ttl(ttl):
+    """Spread expiry by +/- CACHE_TTL_JITTER so keys set together don't all expire together"""
+    jitter = getattr(settings, 'CACHE_TTL_JITTER', 0.1)
+    return max(1, int(ttl * random.uniform(1 - jitter, 1 + jitter)))
+
+
+def _generation_key(key):
+    return f'{key}:gen'
+
+
+def _lookup(key):
+    """
+    Read a cached value and its key's generation in one round trip.
+    Returns: (value or _MISSING, current generation)
+    """
+    generation_key = _generation_key(key)
+    entries = cache.get_many([key, generation_key])
+    generation = entries.get(generation_key, 0)
+    entry = entries.get(key)
+    # Values are stored with the generation they were computed under; an older one is stale
+    if entry is not None and entry[0] == generation:
+        return entry[1], generation
+    return _MISSING, generation
+
+
+def get_or_compute(key, compute, ttl):
+    """
+    Return the cached value for key, computing and caching it on a miss.
+    Only one caller recomputes a missing key (single flight); the others wait
+    up to CACHE_LOCK_TIMEOUT_SECONDS for its result before computing it themselves.
+    A value computed while invalidate_keys() ran for the key is written under the old
+    generation, so it is never served.
+    """
+    value, generation = _lookup(key)
+    # Keys come from make_key, so the namespace is everything before the first ':'
+    namespace = key.split(':', 1)[0]
+    metrics.cache_lookups.inc(cache=namespace, result='hit' if value is not _MISSING else 'miss')
+    if value is not _MISSING:
+        return value
+
+    lock_key = f'{key}:lock'
+    lock_timeout = getattr(settings, 'CACHE_LOCK_TIMEOUT_SECONDS', 5)
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, (generation, value), jittered_ttl(ttl))
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # Someone else is recomputing; wait for their result instead of hitting the database too
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value, _ = _lookup(key)
+        if value is not _MISSING:
+            return value
+    return compute()
+
+
+def invalidate_keys(*keys):
+    """
+    Forget cached values. Bumping each key's generation also voids a value that a
+    get_or_compute() already running will write after this returns.
+    """
+    for key in keys:
+        generation_key = _generation_key(key)
+        # Generations outlive the values they guard
+        cache.add(generation_key, 0, None)
+        try:
+            cache.incr(generation_key)
+        except ValueError:
+            # Evicted between add and incr; any generation other than the old one will do
+            cache.set(generation_key, 1, None)
+    cache.delete_many(keys)
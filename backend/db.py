@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import connections
+from backend import metrics
+
+
+def connection_stats():
+    """
+    Connection settings and, when DB_POOL is on, psycopg pool counters for each database
+    in this worker process (requests_waiting, pool_size, pool_available, ...)
+    """
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        entry = {
+            'vendor': connection.vendor,
+            'worker_type': getattr(settings, 'APP_WORKER_TYPE', 'wsgi'),
+            'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+            'health_checks': connection.settings_dict.get('CONN_HEALTH_CHECKS'),
+            'connected': connection.connection is not None,
+            'pool': None,
+        }
+        # Only the PostgreSQL backend has a pool, and only when OPTIONS['pool'] is set
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            entry['pool'] = pool.get_stats()
+        stats[alias] = entry
+    return stats
+
+
+def _collect():
+    """psycopg pool counters (pool_size, pool_available, requests_waiting, ...) per database"""
+    values = {}
+    for alias, entry in connection_stats().items():
+        for name, value in (entry['pool'] or {}).items():
+            values.setdefault(name, {})[(('database', alias),)] = value
+    return [(f'db_{name}', 'gauge', f"psycopg pool {name} in this worker", samples)
+            for name, samples in sorted(values.items())]
+
+
+metrics.register_collector(_collect)
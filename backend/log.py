@@ -0,0 +1,107 @@
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from backend import metrics
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, any `extra=` fields and the traceback"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != 'sample_key':
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # The handler drops records when the queue is full, but the stop sentinel has to wait for room
+        self.queue.put(self._sentinel)
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded in-process queue; a listener thread formats and writes them.
+    Logging never blocks the caller: when the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.listener = _Listener(self.queue, self.target)
+        self.listener.start()
+        self._listening = True
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread, not in the request
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Same process, so the record doesn't need to be flattened for pickling
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.log_records_dropped.inc(reason='queue_full')
+
+    def close(self):
+        # Called by logging.shutdown() at exit: write out whatever is still queued
+        if self._listening:
+            self._listening = False
+            self.listener.stop()
+            self.target.close()
+        super().close()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `limit` records per `interval` seconds for each sample_key.
+    Per-message events log with extra={'sample_key': '...'}; records without one always pass.
+    The next record let through for a key carries how many were suppressed before it.
+    """
+
+    def __init__(self, limit=10, interval=60):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}  # sample_key -> [window start, records let through, records suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'sample_key', None)
+        if key is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                window = self._windows[key] = [now, 0, window[2] if window else 0]
+            if window[1] >= self.limit:
+                window[2] += 1
+                metrics.log_records_dropped.inc(reason='rate_limited')
+                return False
+            window[1] += 1
+            if window[2]:
+                record.suppressed = window[2]
+                window[2] = 0
+        return True
@@ -0,0 +1,217 @@
+import bisect
+import threading
+import time
+
+# Every metric created through counter()/gauge()/histogram(), in registration order
+_registry = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A named family of samples keyed by label values. Updates take one short lock;
+    exposition copies the values under the same lock and formats outside it.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        """Yields (suffix, label text, value)"""
+        for key, value in sorted(self._snapshot().items()):
+            yield '', _format_labels(self.labelnames, key), value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _snapshot(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self._snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '_bucket', _format_labels(self.labelnames, key, [('le', _format_value(bound))]), cumulative
+            yield '_sum', _format_labels(self.labelnames, key), total
+            yield '_count', _format_labels(self.labelnames, key), count
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def _register(metric):
+    with _registry_lock:
+        # Modules can be imported more than once (e.g. by the autoreloader); keep the first
+        return _registry.setdefault(metric.name, metric)
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return _register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def register_collector(collect):
+    """
+    Add a function called at scrape time for values that already live elsewhere
+    (pool stats, buffer counters). It returns [(name, kind, documentation, {labels: value})].
+    """
+    if collect not in _collectors:
+        _collectors.append(collect)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in list(_registry.values()):
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for suffix, labels, value in metric.samples():
+            lines.append(f'{metric.name}{suffix}{labels} {_format_value(value)}')
+
+    for collect in _collectors:
+        for name, kind, documentation, values in collect():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in values.items():
+                labelnames = [label for label, _ in labels]
+                key = tuple(str(value) for _, value in labels)
+                lines.append(f'{name}{_format_labels(labelnames, key)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# Shared metrics for the hot paths; each module records into these
+http_request_duration = histogram(
+    'http_request_duration_seconds', "HTTP request latency by URL name", ('view', 'method', 'status'))
+websocket_connections = gauge(
+    'websocket_connections', "Open WebSocket connections in this worker", ('consumer',))
+channel_layer_send_duration = histogram(
+    'channel_layer_send_seconds', "Channel layer group_send latency by event type", ('type',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+crypto_bytes = counter(
+    'crypto_bytes_total', "Bytes passed through Fernet, by operation", ('operation',))
+emails_in_flight = gauge(
+    'emails_in_flight', "Emails being sent by this worker right now")
+emails_sent = counter(
+    'emails_sent_total', "Emails sent, by kind and result", ('kind', 'result'))
+login_lock_events = counter(
+    'login_lock_events_total', "Accounts or OTPs locked after too many failures", ('kind',))
+cache_lookups = counter(
+    'cache_lookups_total', "Cache lookups by cache and result (hit or miss)", ('cache', 'result'))
+log_records_dropped = counter(
+    'log_records_dropped_total', "Log records dropped, by reason (queue_full or rate_limited)", ('reason',))
+
+
+async def timed_group_send(channel_layer, group, message):
+    """channel_layer.group_send, recording its latency under the event type"""
+    started = time.perf_counter()
+    try:
+        await channel_layer.group_send(group, message)
+    finally:
+        channel_layer_send_duration.observe(time.perf_counter() - started, type=message.get('type', ''))
+
+
+def _cache_hit_ratios():
+    totals = {}
+    for (cache_name, result), value in cache_lookups._snapshot().items():
+        totals.setdefault(cache_name, {'hit': 0, 'miss': 0})[result] = value
+    return [(
+        'cache_hit_ratio', 'gauge', "Hits over lookups since this worker started, by cache",
+        {(('cache', name),): counts['hit'] / ((counts['hit'] + counts['miss']) or 1)
+         for name, counts in sorted(totals.items())},
+    )]
+
+
+register_collector(_cache_hit_ratios)
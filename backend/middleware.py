@@ -1,3 +1,21 @@
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from backend import metrics, profiling
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
 class CorsMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -13,3 +31,163 @@ class CorsMiddleware:
                 response["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
                 response["Access-Control-Allow-Headers"] = "Content-Type, X-Requested-With"
         return response
+
+
+class MetricsMiddleware:
+    """Records request latency per URL name into /metrics (METRICS_ENABLED)"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        # URL names keep the label set bounded; unrouted paths share one label
+        match = getattr(request, 'resolver_match', None)
+        metrics.http_request_duration.observe(
+            time.perf_counter() - started,
+            view=match.view_name if match else 'unmatched',
+            method=request.method,
+            status=f'{response.status_code // 100}xx',
+        )
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-request instrumentation (PROFILING_ENABLED). A PROFILING_SAMPLE_RATE fraction of
+    requests, plus any request flagged with the X-Profile header, gets its wall time split into
+    database, Fernet, serializer and render time. The split is returned as a Server-Timing header
+    and logged as one JSON line. Flagged requests can also capture a cProfile or pyinstrument
+    profile into PROFILING_OUTPUT_DIR.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01)
+        self.output_dir = getattr(settings, 'PROFILING_OUTPUT_DIR', None)
+
+    def __call__(self, request):
+        mode = self.capture_mode(request)
+        if mode is None and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timings, token = profiling.start()
+        request.profiling_timings = timings
+        profiler = self.start_profiler(mode)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.time_query))
+                response = self.get_response(request)
+            total = time.perf_counter() - started
+        finally:
+            profile_file = self.stop_profiler(mode, profiler, request)
+            profiling.stop(token)
+
+        self.finish(request, response, timings, total, profile_file)
+        return response
+
+    def capture_mode(self, request):
+        """'cprofile' or 'pyinstrument' when the request asks for a profile and is allowed to"""
+        mode = request.headers.get('X-Profile', '').lower()
+        if mode not in ('cprofile', 'pyinstrument'):
+            return None
+        secret = getattr(settings, 'PROFILING_TOKEN', None)
+        if secret:
+            if not hmac.compare_digest(request.headers.get('X-Profile-Token', ''), secret):
+                return None
+        elif not settings.DEBUG:
+            return None
+        return mode
+
+    @staticmethod
+    def time_query(execute, sql, params, many, context):
+        with profiling.timed('db'):
+            return execute(sql, params, many, context)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that as 'render'
+        timings = getattr(request, 'profiling_timings', None)
+        if timings is not None:
+            render_started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: timings.add('render', time.perf_counter() - render_started)
+            )
+        return response
+
+    def start_profiler(self, mode):
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        if mode == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("X-Profile: pyinstrument requested but pyinstrument is not installed")
+                return None
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+        return None
+
+    def stop_profiler(self, mode, profiler, request):
+        """Stop the profiler and write its output; returns the file name or None"""
+        if profiler is None:
+            return None
+
+        output_dir = self.output_dir or os.path.join(settings.BASE_DIR, 'profiles')
+        os.makedirs(output_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{uuid.uuid4().hex[:8]}"
+        if mode == 'cprofile':
+            profiler.disable()
+            name += '.prof'
+            profiler.dump_stats(os.path.join(output_dir, name))
+        else:
+            profiler.stop()
+            name += '.html'
+            with open(os.path.join(output_dir, name), 'w') as output_file:
+                output_file.write(profiler.output_html())
+        return name
+
+    def finish(self, request, response, timings, total, profile_file):
+        if response.streaming:
+            size = int(response.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+
+        parts = {name: timings.seconds(name) for name in ('db', 'crypto', 'serialize', 'render')}
+        # Serializers decrypt message text, so 'serialize' includes some of the 'crypto' time
+        entries = [f'total;dur={total * 1000:.2f}',
+                   f'db;dur={parts["db"] * 1000:.2f};desc="{timings.count("db")} queries"']
+        entries += [f'{name};dur={parts[name] * 1000:.2f}' for name in ('crypto', 'serialize', 'render')]
+        response['Server-Timing'] = ', '.join(entries)
+        if profile_file:
+            response['X-Profile-File'] = profile_file
+
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(parts['db'] * 1000, 2),
+            'queries': timings.count('db'),
+            'crypto_ms': round(parts['crypto'] * 1000, 2),
+            'crypto_calls': timings.count('crypto'),
+            'serialize_ms': round(parts['serialize'] * 1000, 2),
+            'render_ms': round(parts['render'] * 1000, 2),
+            'response_bytes': size,
+            'profile': profile_file,
+        }
+        # Full record as JSON fields with LOG_FORMAT='json'; the message keeps text logs readable
+        logger.info(f"request_profile {request.method} {request.path} {record['total_ms']}ms",
+                    extra={'profile': record})
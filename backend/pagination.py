@@ -0,0 +1,69 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+
+def encode_cursor(timestamp, pk):
+    """Opaque cursor for the (timestamp, id) position of a row"""
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Reverse of encode_cursor
+    Returns: (timestamp, id); raises ValueError on a malformed cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, pk = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def parse_limit(value, default, maximum):
+    """Clamp a ?limit= query parameter into 1..maximum"""
+    try:
+        limit = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def keyset_page(queryset, cursor, limit, field='timestamp'):
+    """
+    Fetch one page of rows older than cursor, walking (field, id) newest first
+    so the query is a single range scan on an index ending in (field, id).
+    Returns: (rows newest first, cursor for the next older page or None)
+    """
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk})
+        )
+
+    rows = list(queryset.order_by(f'-{field}', '-id')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field), last.pk)
+
+
+def id_page(queryset, after, limit):
+    """
+    Fetch one page of rows with an id above `after`, oldest first, for queues that
+    have no timestamp to page on. The cursor is the last id on the page.
+    Returns: (rows oldest first, cursor for the next page or None); raises ValueError on a malformed cursor
+    """
+    if after:
+        queryset = queryset.filter(id__gt=int(after))
+
+    rows = list(queryset.order_by('id')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, str(rows[-1].pk)
@@ -0,0 +1,68 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Timings for the request being profiled in this context, None when it isn't sampled
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Per-request buckets of (seconds, count), filled by timed() while a request is sampled"""
+
+    def __init__(self):
+        self.buckets = {}
+        self._depth = {}
+
+    def add(self, name, seconds):
+        total, count = self.buckets.get(name, (0.0, 0))
+        self.buckets[name] = (total + seconds, count + 1)
+
+    def seconds(self, name):
+        return self.buckets.get(name, (0.0, 0))[0]
+
+    def count(self, name):
+        return self.buckets.get(name, (0.0, 0))[1]
+
+
+def start():
+    """Begin collecting timings in this context; returns (timings, token for stop())"""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to bucket `name` of the sampled request, if any.
+    Nested blocks with the same name are only counted once, by the outermost block.
+    """
+    timings = _current.get()
+    if timings is None or timings._depth.get(name):
+        yield
+        return
+
+    timings._depth[name] = 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._depth[name] = 0
+        timings.add(name, time.perf_counter() - started)
+
+
+class TimedSerializerMixin:
+    """Serializer mixin that charges to_representation() to the 'serialize' bucket"""
+
+    def to_representation(self, instance):
+        if _current.get() is None:
+            return super().to_representation(instance)
+        with timed('serialize'):
+            return super().to_representation(instance)
@@ -53,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.middleware.ProfilingMiddleware',  # Outermost so its total covers every other middleware
+    'backend.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -103,6 +105,59 @@ DATABASES = {
     }
 }
 
+# Connection reuse, sized per worker type. backend/wsgi.py and backend/asgi.py set
+# APP_WORKER_TYPE; management commands count as 'wsgi'.
+APP_WORKER_TYPE = os.getenv('APP_WORKER_TYPE', 'wsgi')
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+if os.getenv('DB_POOL', '').lower() in ('1', 'true', 'yes'):
+    # psycopg 3 connection pool (needs psycopg[pool]). Under ASGI every database_sync_to_async
+    # thread may hold a connection, so the default ceiling is the sync thread pool size.
+    if APP_WORKER_TYPE == 'asgi':
+        default_min, default_max = 2, int(os.getenv('ASGI_THREADS', 10))
+    else:
+        default_min, default_max = 1, int(os.getenv('WSGI_THREADS', 4))
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # Django requires this with a pool
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', default_min)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', default_max)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+    }
+elif APP_WORKER_TYPE == 'asgi':
+    # Persistent connections leak under ASGI (one per sync thread, never closed); use DB_POOL instead
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+else:
+    # Keep each WSGI thread's connection open between requests instead of reconnecting every time
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+# Cache shared by every worker, chosen by CACHE_URL:
+#   redis://host:6379/0        Redis (needs the redis package)
+#   memcached://host:11211     memcached (needs pymemcache)
+#   file:///var/tmp/app-cache  file-based, shared by workers on one host
+# Without CACHE_URL each process gets its own LocMemCache, which is only fit for tests and local runs.
+CACHE_URL = os.getenv('CACHE_URL', '')
+
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHE_BACKEND = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}
+elif CACHE_URL.startswith('memcached://'):
+    CACHE_BACKEND = {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+                     'LOCATION': CACHE_URL[len('memcached://'):]}
+elif CACHE_URL.startswith('file://'):
+    CACHE_BACKEND = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                     'LOCATION': CACHE_URL[len('file://'):]}
+else:
+    CACHE_BACKEND = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+CACHES = {
+    'default': {
+        **CACHE_BACKEND,
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'chatapp'),
+        'TIMEOUT': 300,
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -192,6 +247,7 @@ MAX_RAPID_ATTEMPTS = 10
 RAPID_ATTEMPT_SECONDS = 60
 SUSPICIOUS_IP_COUNT = 3
 OTP_EXPIRY_MINUTES = 10
+OTP_MAX_ATTEMPTS = 5  # Wrong guesses before an OTP is burned (see authentication/otp_store.py)
 ACCOUNT_AUTO_UNBLOCK_HOURS = 1  # Accounts automatically unblock after this many hours
 
 # Channel layer configuration (using in-memory for development, Redis recommended for production)
@@ -205,3 +261,120 @@ CHANNEL_LAYERS = {
         # },
     },
 }
+
+# Cached block pairs per user for the message views and ChatConsumer (see chat/block_cache.py).
+# Dropped from the shared cache on every block change; the TTL is a safety net.
+BLOCK_CACHE_TTL_SECONDS = 300
+
+# Presence and typing indicators (see chat/presence.py)
+PRESENCE_TTL_SECONDS = 60  # User shows offline this long after their last heartbeat
+PRESENCE_HEARTBEAT_INTERVAL_SECONDS = 20  # At most one cache write per user per interval per worker
+PRESENCE_FLUSH_SECONDS = 1  # Presence changes are batched per friend over this window
+TYPING_THROTTLE_SECONDS = 3
+
+# Per-connection outbound queue limits for ChatConsumer (see chat/send_buffer.py).
+# Policy when a client falls behind: 'drop_oldest', 'disconnect' or 'resync'.
+# A single frame over MAX_BYTES is always replaced by a resync notice.
+CHAT_SEND_BUFFER_MAX_MESSAGES = 100
+CHAT_SEND_BUFFER_MAX_BYTES = 256 * 1024
+CHAT_SEND_BUFFER_POLICY = 'drop_oldest'
+
+# Group message history is served in keyset-paginated pages
+GROUP_MESSAGES_PAGE_SIZE = 50
+GROUP_MESSAGES_MAX_PAGE_SIZE = 200
+
+# Account and group deletions are purged outside the request by `manage.py purge_deletions`,
+# this many rows per transaction
+DELETION_BATCH_SIZE = 1000
+
+# Whole months older than this are moved out of the message tables into compressed
+# monthly archive rows by `manage.py archive_messages` (see chat/archive.py)
+MESSAGE_ARCHIVE_AFTER_DAYS = 365
+MESSAGE_ARCHIVE_BATCH_SIZE = 5000
+
+# 1:1 history pages when ?limit= or ?before= is passed
+CHAT_MESSAGES_PAGE_SIZE = 50
+CHAT_MESSAGES_MAX_PAGE_SIZE = 200
+
+# Message text at least this long is compressed before encryption (see chat/encryption.py).
+# 'zstd' needs the optional zstandard package and falls back to 'zlib'; None turns compression off.
+MESSAGE_COMPRESSION = 'zstd'
+MESSAGE_COMPRESSION_THRESHOLD_BYTES = 256
+
+# Retention for auth tables, applied by `manage.py compact_auth_tables` (see authentication/retention.py).
+# Unflagged login attempts older than this are rolled into per-user daily totals.
+LOGIN_ATTEMPT_RETENTION_DAYS = 30
+RETENTION_BATCH_SIZE = 5000
+
+# backend/cache.py: expiry spread (fraction of the TTL) and how long a cache miss
+# waits for another worker that is already recomputing the same key
+CACHE_TTL_JITTER = 0.1
+CACHE_LOCK_TIMEOUT_SECONDS = 5
+
+# Cached friend id sets, dropped on friendship changes (see authentication/friends.py)
+FRIENDS_CACHE_TTL_SECONDS = 300
+
+# Per-request profiling (backend/middleware.py ProfilingMiddleware), off unless PROFILING_ENABLED is set.
+# Sampled requests get a Server-Timing header and a request_profile log line. Requests with
+# 'X-Profile: cprofile' or 'X-Profile: pyinstrument' and a matching X-Profile-Token (any request
+# when DEBUG and no token is set) are always sampled and write a profile to PROFILING_OUTPUT_DIR.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.01))
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+PROFILING_OUTPUT_DIR = os.getenv('PROFILING_OUTPUT_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# In-process Prometheus metrics at /metrics (backend/metrics.py). Each worker process
+# exposes its own numbers. Scrapers send 'Authorization: Bearer <METRICS_TOKEN>';
+# without a token only METRICS_ALLOWED_IPS (and anyone when DEBUG) may scrape.
+# Staff signed in to the admin may always view it.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Logging goes through a bounded queue drained by a background thread (backend/log.py), so a
+# request never waits on stdout. Per-message events pass extra={'sample_key': ...} and are
+# limited to LOG_RATE_LIMIT records per key every LOG_RATE_LIMIT_INTERVAL_SECONDS.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' or 'text'
+LOG_QUEUE_SIZE = 10000
+LOG_RATE_LIMIT = 10
+LOG_RATE_LIMIT_INTERVAL_SECONDS = 60
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'backend.log.JsonFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'filters': {
+        'rate_limit': {
+            '()': 'backend.log.RateLimitFilter',
+            'limit': LOG_RATE_LIMIT,
+            'interval': LOG_RATE_LIMIT_INTERVAL_SECONDS,
+        },
+    },
+    'handlers': {
+        'queue': {
+            '()': 'backend.log.AsyncQueueHandler',
+            'queue_size': LOG_QUEUE_SIZE,
+            'formatter': LOG_FORMAT,
+            'filters': ['rate_limit'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': LOG_LEVEL},
+    'loggers': {
+        # Replaces Django's DEBUG-only console handler so its records aren't written twice
+        'django': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Admin review queues (reports, suspicious logins, pending verifications) are served in pages
+ADMIN_QUEUE_PAGE_SIZE = 50
+ADMIN_QUEUE_MAX_PAGE_SIZE = 200
+
+# Moderation work queue (authentication/moderation.py): admins claim items in batches and
+# hold them for this long before other admins can pick them up
+MODERATION_LEASE_SECONDS = 600
+MODERATION_CLAIM_SIZE = 10
+MODERATION_CLAIM_MAX = 50
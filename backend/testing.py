@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+Measurement = namedtuple('Measurement', 'status queries elapsed_ms sql')
+
+
+def budget_scale():
+    """Multiplier for every time budget, e.g. PERF_BUDGET_SCALE=3 on a slow CI runner"""
+    return float(os.environ.get('PERF_BUDGET_SCALE', 1))
+
+
+def make_users(prefix, count, **fields):
+    """Bulk-create `count` users (with profiles) named prefix0, prefix1, ..."""
+    from authentication.models import Profile
+
+    start = User.objects.filter(username__startswith=prefix).count()
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}{index}', email=f'{prefix}{index}@example.com', **fields)
+        for index in range(start, start + count)
+    ])
+    # bulk_create doesn't return ids on every backend; reload them
+    users = list(User.objects.filter(username__in=[user.username for user in users]).order_by('id'))
+    Profile.objects.bulk_create([Profile(user=user) for user in users])
+    return users
+
+
+def reset_caches():
+    """Start a measurement cold"""
+    cache.clear()
+
+
+# Fast hashing keeps user setup out of the timings
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryScalingTestCase(TestCase):
+    """
+    Base class for endpoint scaling tests. Subclasses implement grow(count), which adds
+    `count` more of every kind of row their endpoints read.
+
+    assertScales() measures one request after the data has grown to small_size, grows it
+    to large_size and measures again. It fails if the second request ran more queries
+    than the first (an N+1 pattern) or took longer than its time budget.
+    """
+    small_size = 3
+    large_size = 30
+    default_budget_ms = 250
+
+    @classmethod
+    def setUpClass(cls):
+        # Uploaded and seeded files go to a throwaway MEDIA_ROOT
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def grow(self, count):
+        raise NotImplementedError
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def token_for(self, user):
+        return str(AccessToken.for_user(user))
+
+    def measure(self, call, run):
+        reset_caches()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = call(run)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        return Measurement(response.status_code, len(queries), elapsed_ms,
+                           [query['sql'] for query in queries.captured_queries])
+
+    def assertScales(self, call, status=200, budget_ms=None):
+        """
+        call(run) makes the request; run is 0 for the small dataset and 1 for the large one,
+        so endpoints that change data can pick a different target each time.
+        """
+        self.grow(self.small_size)
+        small = self.measure(call, 0)
+        self.grow(self.large_size - self.small_size)
+        large = self.measure(call, 1)
+
+        self.assertEqual(small.status, status, f"Unexpected status with {self.small_size} rows")
+        self.assertEqual(large.status, status, f"Unexpected status with {self.large_size} rows")
+        self.assertLessEqual(
+            large.queries, small.queries,
+            f"Query count grew from {small.queries} to {large.queries} going from "
+            f"{self.small_size} to {self.large_size} rows; first queries:\n" + '\n'.join(large.sql[:20])
+        )
+        budget = (budget_ms or self.default_budget_ms) * budget_scale()
+        self.assertLessEqual(
+            large.elapsed_ms, budget,
+            f"Took {large.elapsed_ms:.1f}ms with {self.large_size} rows, budget is {budget:.0f}ms"
+        )
+        return small, large
@@ -0,0 +1,319 @@
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import weakref
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from . import metrics, profiling
+from .log import AsyncQueueHandler, JsonFormatter, RateLimitFilter
+from .cache import get_or_compute, invalidate_keys, make_key
+from .middleware import ProfilingMiddleware
+
+
+class Loader:
+    """compute() stand-in that counts its calls and can be held until released"""
+
+    def __init__(self, value, hold=False):
+        self.value = value
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return self.value
+
+
+@override_settings(CACHE_LOCK_TIMEOUT_SECONDS=2)
+class GetOrComputeTests(TestCase):
+    """Single-flight cache fills that never keep a value invalidated while it was computed"""
+
+    def setUp(self):
+        cache.clear()
+        self.key = make_key('tests', 1)
+
+    def test_miss_then_hit(self):
+        loader = Loader({1, 2})
+        self.assertEqual(get_or_compute(self.key, loader, 60), {1, 2})
+        self.assertEqual(get_or_compute(self.key, loader, 60), {1, 2})
+        self.assertEqual(loader.calls, 1)
+
+    def test_invalidate_forces_recompute(self):
+        get_or_compute(self.key, Loader('old'), 60)
+        invalidate_keys(self.key)
+        self.assertEqual(get_or_compute(self.key, Loader('new'), 60), 'new')
+
+    def test_value_invalidated_during_compute_is_not_served(self):
+        def stale():
+            # A block commits and invalidates while the old rows are being read
+            invalidate_keys(self.key)
+            return 'stale'
+
+        self.assertEqual(get_or_compute(self.key, stale, 60), 'stale')
+        fresh = Loader('fresh')
+        self.assertEqual(get_or_compute(self.key, fresh, 60), 'fresh')
+        self.assertEqual(get_or_compute(self.key, fresh, 60), 'fresh')
+        self.assertEqual(fresh.calls, 1)
+
+    def test_waiter_gets_lock_holders_value(self):
+        holder = Loader('computed once', hold=True)
+        results = {}
+        thread = threading.Thread(target=lambda: results.setdefault('holder', get_or_compute(self.key, holder, 60)))
+        thread.start()
+        self.assertTrue(holder.started.wait(5))
+
+        waiter = Loader('computed twice')
+        threading.Timer(0.1, holder.release.set).start()
+        self.assertEqual(get_or_compute(self.key, waiter, 60), 'computed once')
+        thread.join(5)
+        self.assertEqual(results['holder'], 'computed once')
+        self.assertEqual((holder.calls, waiter.calls), (1, 0))
+
+    @override_settings(CACHE_LOCK_TIMEOUT_SECONDS=0.2)
+    def test_waiter_computes_after_lock_timeout(self):
+        # A lock holder that died without writing a value
+        cache.add(f'{self.key}:lock', 1, 60)
+        waiter = Loader('fallback')
+        self.assertEqual(get_or_compute(self.key, waiter, 60), 'fallback')
+        self.assertEqual(waiter.calls, 1)
+
+
+class MetricsExpositionTests(TestCase):
+    """Prometheus text format for counters and histograms"""
+
+    def test_histogram_buckets_are_cumulative_with_sum_and_count(self):
+        histogram = metrics.Histogram('test_seconds', "Test latency", ('view',), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, view='home')
+
+        lines = [f'test_seconds{suffix}{labels} {metrics._format_value(value)}'
+                 for suffix, labels, value in histogram.samples()]
+        self.assertEqual(lines, [
+            'test_seconds_bucket{view="home",le="0.1"} 1',
+            'test_seconds_bucket{view="home",le="1"} 3',
+            'test_seconds_bucket{view="home",le="+Inf"} 4',
+            'test_seconds_sum{view="home"} 4.05',
+            'test_seconds_count{view="home"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        counter = metrics.Counter('test_total', "Test counter", ('path',))
+        counter.inc(path='a"b\\c\nd')
+        self.assertEqual(list(counter.samples()), [('', '{path="a\\"b\\\\c\\nd"}', 1)])
+
+    def test_render_includes_help_type_and_collectors(self):
+        text = metrics.render()
+        self.assertIn('# HELP http_request_duration_seconds HTTP request latency by URL name\n', text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram\n', text)
+        self.assertIn('# TYPE cache_hit_ratio gauge\n', text)
+        self.assertTrue(text.endswith('\n'))
+
+
+class MetricsEndpointTests(TestCase):
+    """Who may scrape /metrics, and how MetricsMiddleware labels requests"""
+
+    def observed(self, **labels):
+        entry = metrics.http_request_duration._snapshot().get(
+            metrics._label_key(metrics.http_request_duration.labelnames, labels))
+        return entry[2] if entry else 0
+
+    @override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_allowed_ips_without_token(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_token_replaces_ip_allowlist(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret', REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=[])
+    def test_staff_session_may_view(self):
+        user = User.objects.create_user('member', 'member@example.com', 'unused')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_endpoint_is_not_found(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=[])
+    def test_requests_labelled_by_url_name(self):
+        before = self.observed(view='metrics', method='GET', status='4xx')
+        unmatched = self.observed(view='unmatched', method='GET', status='4xx')
+
+        self.client.get('/metrics')
+        self.client.get('/no/such/page/')
+        self.client.get('/another/missing/page/')
+
+        self.assertEqual(self.observed(view='metrics', method='GET', status='4xx'), before + 1)
+        # Unrouted paths share one label instead of one series per path
+        self.assertEqual(self.observed(view='unmatched', method='GET', status='4xx'), unmatched + 2)
+        self.assertIn('view="unmatched",method="GET",status="4xx"', metrics.render())
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_TOKEN=None)
+class ProfilingMiddlewareTests(TestCase):
+    """Per-request timings are collected only when enabled and never leak into the next request"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.seen = []
+
+    def view(self, request):
+        # What the view's own code would see through profiling.current()
+        self.seen.append(profiling.current())
+        User.objects.count()
+        User.objects.exists()
+        return HttpResponse('ok')
+
+    def test_off_unless_enabled(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(self.view)
+
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            response = ProfilingMiddleware(self.view)(self.factory.get('/'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.seen, [None])
+
+    def test_summary_reports_queries_and_time(self):
+        with self.assertLogs('backend.middleware', 'INFO') as logs:
+            response = ProfilingMiddleware(self.view)(self.factory.get('/api/hello/'))
+
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="2 queries", crypto;')
+        record = logs.records[0].profile
+        self.assertEqual((record['path'], record['status'], record['queries']), ('/api/hello/', 200, 2))
+        self.assertGreaterEqual(record['total_ms'], record['db_ms'])
+        self.assertEqual(record['response_bytes'], 2)
+
+    def test_timings_reset_between_requests(self):
+        middleware = ProfilingMiddleware(self.view)
+        with self.assertLogs('backend.middleware', 'INFO'):
+            middleware(self.factory.get('/'))
+            middleware(self.factory.get('/'))
+
+        first, second = self.seen
+        self.assertIsNotNone(first)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.count('db'), 2)
+        self.assertIsNone(profiling.current())
+
+    def test_timings_reset_when_view_raises(self):
+        def failing_view(request):
+            self.seen.append(profiling.current())
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            ProfilingMiddleware(failing_view)(self.factory.get('/'))
+        self.assertIsNotNone(self.seen[0])
+        self.assertIsNone(profiling.current())
+
+    def test_flagged_request_writes_profile(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            with override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_TOKEN='profile-secret',
+                                   PROFILING_OUTPUT_DIR=output_dir):
+                middleware = ProfilingMiddleware(self.view)
+                with self.assertLogs('backend.middleware', 'INFO'):
+                    response = middleware(self.factory.get('/', HTTP_X_PROFILE='cprofile',
+                                                           HTTP_X_PROFILE_TOKEN='profile-secret'))
+                # Without the token the header is ignored and the request isn't sampled
+                unflagged = middleware(self.factory.get('/', HTTP_X_PROFILE='cprofile'))
+
+            self.assertTrue(os.path.exists(os.path.join(output_dir, response['X-Profile-File'])))
+            self.assertNotIn('Server-Timing', unflagged)
+
+
+def log_record(message='event', exc_info=None, **extra):
+    return logging.getLogger('backend.tests').makeRecord(
+        'backend.tests', logging.WARNING, __file__, 1, message, (), exc_info, extra=extra)
+
+
+class RateLimitFilterTests(TestCase):
+    """At most `limit` records per sample_key per window; the rest are counted and reported later"""
+
+    def setUp(self):
+        self.clock = self.enterContext(mock.patch('backend.log.time.monotonic', return_value=1000.0))
+        self.filter = RateLimitFilter(limit=2, interval=60)
+
+    def passed(self, count, **extra):
+        return [self.filter.filter(log_record(**extra)) for _ in range(count)]
+
+    def test_repeated_key_suppressed_until_window_rolls_over(self):
+        dropped = metrics.log_records_dropped.value(reason='rate_limited')
+        self.assertEqual(self.passed(5, sample_key='media.serve_error'), [True, True, False, False, False])
+        self.assertEqual(metrics.log_records_dropped.value(reason='rate_limited'), dropped + 3)
+
+        # Other keys have their own window
+        self.assertEqual(self.passed(1, sample_key='email.failed'), [True])
+
+        self.clock.return_value += 60
+        record = log_record(sample_key='media.serve_error')
+        self.assertTrue(self.filter.filter(record))
+        self.assertEqual(record.suppressed, 3)
+        self.assertEqual(self.passed(2, sample_key='media.serve_error'), [True, False])
+
+    def test_records_without_sample_key_pass(self):
+        self.assertEqual(self.passed(20), [True] * 20)
+
+
+class JsonFormatterTests(TestCase):
+    """One JSON object per record, with `extra=` fields and the traceback"""
+
+    def test_extra_fields_included(self):
+        entry = json.loads(JsonFormatter().format(
+            log_record('sent %s', sample_key='email.sent', profile={'queries': 2}, user_id=7)))
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual(entry['logger'], 'backend.tests')
+        self.assertEqual(entry['profile'], {'queries': 2})
+        self.assertEqual(entry['user_id'], 7)
+        # The rate limit key is routing, not content
+        self.assertNotIn('sample_key', entry)
+        self.assertNotIn('exception', entry)
+
+    def test_exception_info_included(self):
+        try:
+            raise ValueError('bad token')
+        except ValueError as error:
+            exc_info = (type(error), error, error.__traceback__)
+        entry = json.loads(JsonFormatter().format(log_record('failed', exc_info=exc_info)))
+        self.assertIn('Traceback', entry['exception'])
+        self.assertIn('ValueError: bad token', entry['exception'])
+
+
+class AsyncQueueHandlerTests(TestCase):
+    """Records are written by the listener thread, and everything queued is written at shutdown"""
+
+    def test_shutdown_stops_listener_and_flushes_queue(self):
+        stream = io.StringIO()
+        handler = AsyncQueueHandler(stream=stream)
+        handler.setFormatter(JsonFormatter())
+        for index in range(200):
+            handler.handle(log_record(f'record {index}'))
+
+        # What logging.shutdown() does for every handler at exit
+        logging.shutdown([weakref.ref(handler)])
+
+        self.assertIsNone(handler.listener._thread)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([json.loads(line)['message'] for line in lines], [f'record {index}' for index in range(200)])
+        # A second close (e.g. dictConfig reconfiguring) is harmless
+        handler.close()
@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Database connection settings are sized per worker type
+os.environ.setdefault('APP_WORKER_TYPE', 'wsgi')
 
 application = get_wsgi_application()
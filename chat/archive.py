@@ -0,0 +1,215 @@
+import json
+import zlib
+import logging
+from datetime import datetime, timedelta, date
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from backend.pagination import decode_cursor, encode_cursor, keyset_page
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Bumped if the packed row layout ever changes
+ARCHIVE_FORMAT_VERSION = 1
+
+
+def archive_cutoff():
+    """Start of the oldest month that stays in the hot tables"""
+    age = timezone.now() - timedelta(days=getattr(settings, 'MESSAGE_ARCHIVE_AFTER_DAYS', 365))
+    return age.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _batch_size():
+    return getattr(settings, 'MESSAGE_ARCHIVE_BATCH_SIZE', 5000)
+
+
+def month_of(timestamp):
+    return date(timestamp.year, timestamp.month, 1)
+
+
+def pack_rows(rows):
+    """Compress a list of message dicts; encrypted_text stays encrypted"""
+    return zlib.compress(json.dumps({'v': ARCHIVE_FORMAT_VERSION, 'rows': rows}).encode(), 6)
+
+
+def unpack_rows(payload):
+    if isinstance(payload, memoryview):
+        payload = bytes(payload)
+    return json.loads(zlib.decompress(payload))['rows']
+
+
+def _merge_into(archive, rows):
+    """Append rows to an archive row, keeping it sorted by (timestamp, id)"""
+    existing = unpack_rows(archive.payload) if archive.payload else []
+    merged = sorted(existing + rows, key=lambda row: (datetime.fromisoformat(row['timestamp']), row['id']))
+    archive.payload = pack_rows(merged)
+    archive.message_count = len(merged)
+    archive.first_timestamp = datetime.fromisoformat(merged[0]['timestamp'])
+    archive.last_timestamp = datetime.fromisoformat(merged[-1]['timestamp'])
+    archive.save()
+
+
+def _message_row(message):
+    encrypted = message.encrypted_text
+    if isinstance(encrypted, memoryview):
+        encrypted = bytes(encrypted)
+    if isinstance(encrypted, bytes):
+        # Fernet tokens are urlsafe base64, so they round-trip through JSON as text
+        encrypted = encrypted.decode()
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'timestamp': message.timestamp.isoformat(),
+        'encrypted_text': encrypted,
+        'blocked': getattr(message, 'blocked', False),
+    }
+
+
+def _archive_batches(queryset, key_for, save_rows):
+    """
+    Move queryset into the archive in batches; each batch is grouped by key_for(message)
+    and handed to save_rows(key, month, rows) in the same transaction as the delete.
+    Returns the number of messages archived.
+    """
+    model = queryset.model
+    archived = 0
+    while True:
+        batch = list(queryset.order_by('id')[:_batch_size()])
+        if not batch:
+            break
+
+        grouped = {}
+        for message in batch:
+            key = (key_for(message), month_of(message.timestamp))
+            grouped.setdefault(key, []).append(_message_row(message))
+
+        with transaction.atomic():
+            for (key, month), rows in grouped.items():
+                save_rows(key, month, rows)
+            model.objects.filter(id__in=[message.id for message in batch]).delete()
+
+        archived += len(batch)
+        logger.info(f"Archived {archived} {model._meta.verbose_name_plural}")
+    return archived
+
+
+def archive_direct_messages(cutoff=None):
+    """Move 1:1 messages without attachments from months before cutoff into MessageArchive"""
+    from .models import Message, MessageArchive
+
+    cutoff = cutoff or archive_cutoff()
+    queryset = Message.objects.filter(timestamp__lt=cutoff, attachments__isnull=True)
+
+    def key_for(message):
+        return tuple(sorted((message.sender_id, message.receiver_id)))
+
+    def save_rows(pair, month, rows):
+        archive = MessageArchive.objects.select_for_update().filter(
+            user_low_id=pair[0], user_high_id=pair[1], month=month
+        ).first() or MessageArchive(user_low_id=pair[0], user_high_id=pair[1], month=month)
+        _merge_into(archive, rows)
+
+    return _archive_batches(queryset, key_for, save_rows)
+
+
+def archive_group_messages(cutoff=None):
+    """Move group messages without attachments from months before cutoff into GroupMessageArchive"""
+    from groupchat.models import GroupMessage, GroupMessageArchive
+
+    cutoff = cutoff or archive_cutoff()
+    queryset = GroupMessage.objects.filter(timestamp__lt=cutoff, attachments__isnull=True)
+
+    def save_rows(group_id, month, rows):
+        archive = GroupMessageArchive.objects.select_for_update().filter(
+            group_id=group_id, month=month
+        ).first() or GroupMessageArchive(group_id=group_id, month=month)
+        _merge_into(archive, rows)
+
+    return _archive_batches(queryset, lambda message: message.group_id, save_rows)
+
+
+def direct_archives(user_a_id, user_b_id):
+    """Archive rows of the conversation between two users"""
+    from .models import MessageArchive
+
+    user_low_id, user_high_id = sorted((int(user_a_id), int(user_b_id)))
+    return MessageArchive.objects.filter(user_low_id=user_low_id, user_high_id=user_high_id)
+
+
+def build_direct_message(row, user_a_id, user_b_id):
+    """Unsaved Message for an archived row, so the usual serializer can render it"""
+    from .models import Message
+
+    sender_id = row['sender_id']
+    return Message(
+        id=row['id'],
+        sender_id=sender_id,
+        receiver_id=user_b_id if sender_id == user_a_id else user_a_id,
+        encrypted_text=row['encrypted_text'].encode(),
+        timestamp=datetime.fromisoformat(row['timestamp']),
+        blocked=row.get('blocked', False),
+    )
+
+
+def build_group_message(row, group_id):
+    """Unsaved GroupMessage for an archived row"""
+    from groupchat.models import GroupMessage
+
+    return GroupMessage(
+        id=row['id'],
+        group_id=group_id,
+        sender_id=row['sender_id'],
+        encrypted_text=row['encrypted_text'].encode(),
+        timestamp=datetime.fromisoformat(row['timestamp']),
+    )
+
+
+def _older_archived_rows(archives, cursor, limit, keep=None):
+    """Walk archive rows newest month first, collecting up to limit rows older than cursor"""
+    rows = []
+    for archive in archives.order_by('-month'):
+        month_rows = unpack_rows(archive.payload)
+        for row in reversed(month_rows):
+            position = (datetime.fromisoformat(row['timestamp']), row['id'])
+            if (cursor is None or position < cursor) and (keep is None or keep(row)):
+                rows.append(row)
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+
+def page_with_archive(hot_queryset, archives, cursor, limit, build, keep=None):
+    """
+    One page of history, newest first. The hot table is paged as usual; the archive
+    is only read once the page reaches back past the archive cutoff.
+    build(row) turns an archived row dict into an unsaved message instance and
+    keep(row), if given, applies the same visibility rules as hot_queryset.
+    Returns: (messages newest first, cursor for the next older page or None)
+    """
+    hot_rows, next_cursor = keyset_page(hot_queryset, cursor, limit)
+    if next_cursor and hot_rows[-1].timestamp >= archive_cutoff():
+        # Archived messages are all older than the cutoff, so none belong on this page
+        return hot_rows, next_cursor
+
+    # Messages with attachments stay hot, so past the cutoff the two tiers interleave.
+    # The newest limit + 1 archived rows older than cursor are enough to fill the page
+    # from both tiers and to tell whether anything is left after it.
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        archives = archives.filter(first_timestamp__lte=position[0])
+    cold = [build(row) for row in _older_archived_rows(archives, position, limit + 1, keep)]
+    if cold:
+        # Archived messages never have attachments; the prefetch just fills the empty caches
+        prefetch_related_objects(cold, 'sender', 'attachments')
+        # Purged accounts are dropped from the hot tables but their rows may linger in group archives
+        cold = [message for message in cold if message.sender is not None]
+    if not cold:
+        return hot_rows, next_cursor
+
+    rows = sorted(hot_rows + cold, key=lambda message: (message.timestamp, message.id), reverse=True)
+    if len(rows) <= limit and not next_cursor:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
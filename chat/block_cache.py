@@ -0,0 +1,75 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Q
+from backend import metrics
+from backend.cache import get_or_compute, invalidate_keys, make_key
+from .presence import user_group
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Cached block pairs per user in the shared cache, dropped by the UserBlock signal handlers
+# in authentication/models.py, so HTTP and WebSocket workers all see a change at once
+BLOCKS_NAMESPACE = 'block_pairs'
+
+
+def _ttl():
+    return getattr(settings, 'BLOCK_CACHE_TTL_SECONDS', 300)
+
+
+def _key(user_id):
+    return make_key(BLOCKS_NAMESPACE, user_id)
+
+
+def load(user_id):
+    """Return every (blocker_id, blocked_id) pair involving user_id, from the cache when possible"""
+    def compute():
+        from authentication.models import UserBlock
+
+        return frozenset(
+            UserBlock.objects.filter(
+                Q(blocker_id=user_id) | Q(blocked_id=user_id)
+            ).values_list('blocker_id', 'blocked_id')
+        )
+
+    return get_or_compute(_key(int(user_id)), compute, _ttl())
+
+
+def block_status(user_id, other_id):
+    """
+    Check the blocking relationship between two users
+    Returns: (user_blocked_other, other_blocked_user)
+    """
+    user_id, other_id = int(user_id), int(other_id)
+    pairs = load(user_id)
+    return (user_id, other_id) in pairs, (other_id, user_id) in pairs
+
+
+def invalidate(*user_ids):
+    """Forget the cached block pairs of the given users"""
+    invalidate_keys(*[_key(user_id) for user_id in user_ids])
+
+
+def broadcast_block_change(blocker_id, blocked_id, is_blocked):
+    """Drop both users' cached pairs and update the sockets they have open"""
+    invalidate(blocker_id, blocked_id)
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    event = {
+        'type': 'block_update',
+        'blocker_id': blocker_id,
+        'blocked_id': blocked_id,
+        'is_blocked': is_blocked,
+    }
+    try:
+        # Only the two users' own sockets hold these pairs
+        for user_id in (blocker_id, blocked_id):
+            async_to_sync(metrics.timed_group_send)(channel_layer, user_group(user_id), event)
+    except Exception as e:
+        # Open sockets keep their pairs until they reconnect if the update is lost
+        logger.error(f"Error broadcasting block change: {str(e)}")
@@ -1,8 +1,12 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import database_sync_to_async
-from django.db.models import Q
+from channels.db import database_sync_to_async
+import time
 import logging
+from django.conf import settings
+from backend import metrics
+from . import block_cache, presence
+from .send_buffer import SendBuffer
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -10,7 +14,25 @@ logger = logging.getLogger(__name__)
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
-        self.room_group_name = f'chat_{self.room_name}'
+
+        # Identity comes from the JWT resolved by JWTAuthMiddleware, never from the frames
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4001)
+            return
+
+        # The room is the other participant's user id; nobody else may join it
+        peer_id = await database_sync_to_async(self.resolve_peer)(user.id, self.room_name)
+        if peer_id is None:
+            await self.close(code=4003)
+            return
+
+        self.user_id = user.id
+        self.username = user.username
+        self.peer_id = peer_id
+        # Both participants join the same group whichever side opened the room
+        low_id, high_id = sorted((self.user_id, self.peer_id))
+        self.room_group_name = f'chat_{low_id}_{high_id}'
 
         # Join room group
         await self.channel_layer.group_add(
@@ -18,136 +40,220 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        # Personal group for presence updates from friends and block changes
+        await self.channel_layer.group_add(
+            presence.user_group(self.user_id),
+            self.channel_name
+        )
+        # Loaded after joining, so a block change made in between still arrives as a block_update
+        self.friend_ids, self.block_pairs = await database_sync_to_async(self.load_relationships)()
+        self.last_typing_sent = 0
+
+        await self.accept(subprotocol=self.scope.get('jwt_subprotocol'))
+        metrics.websocket_connections.inc(consumer='ChatConsumer')
+
+        # Outbound frames go through a bounded queue so a slow client can't pile up memory
+        self.send_buffer = SendBuffer(self.send, self.close)
+
+        if await presence.mark_online(self.user_id, self.channel_name):
+            await presence.publish(self.user_id, 'online', self.friend_ids)
 
     async def disconnect(self, close_code):
+        # Sockets rejected in connect never joined a group or came online
+        if getattr(self, 'user_id', None) is None:
+            return
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
+        self.send_buffer.close()
+        metrics.websocket_connections.dec(consumer='ChatConsumer')
+
+        await self.channel_layer.group_discard(
+            presence.user_group(self.user_id),
+            self.channel_name
+        )
+        if await presence.mark_offline(self.user_id, self.channel_name):
+            await presence.publish(self.user_id, 'offline', self.friend_ids)
+
     async def receive(self, text_data):
         try:
             text_data_json = json.loads(text_data)
+            frame_type = text_data_json.get('type')
+
+            # Every frame proves the user is still here; coalesced to one cache write per interval
+            if await presence.heartbeat(self.user_id, self.channel_name):
+                await presence.publish(self.user_id, 'online', self.friend_ids)
+            if frame_type == 'heartbeat':
+                return
+            if frame_type == 'typing':
+                await self.send_typing_indicator()
+                return
+
             message = text_data_json['message']
-            sender_username = text_data_json['sender_username']
-            receiver_id = text_data_json['receiver_id']
-            sender_id = text_data_json.get('sender_id')
+            # The receiver is fixed by the room; a frame naming anyone else is refused
+            receiver_id = self.peer_id
+            if 'receiver_id' in text_data_json and str(text_data_json['receiver_id']) != str(receiver_id):
+                self.queue_send({
+                    'message': message,
+                    'sender_username': self.username,
+                    'error': 'Messages in this chat can only be sent to its other participant.'
+                })
+                return
 
-            # Check the blocking relationship
-            sender_blocked_receiver, receiver_blocked_sender = await database_sync_to_async(self.check_block_status)(sender_id, receiver_id)
+            # Check the blocking relationship against the set loaded at connect
+            sender_blocked_receiver = (self.user_id, receiver_id) in self.block_pairs
+            receiver_blocked_sender = (receiver_id, self.user_id) in self.block_pairs
 
             # If sender has blocked receiver, prevent sending
             if sender_blocked_receiver:
                 # Send an error message only to the sender
-                await self.send(text_data=json.dumps({
+                self.queue_send({
                     'message': message,
-                    'sender_username': sender_username,
+                    'sender_username': self.username,
                     'error': 'You have blocked this user. Unblock them to send messages.'
-                }))
+                })
                 return
 
             # If receiver has blocked sender, silently accept the message but don't deliver to receiver
             if receiver_blocked_sender:
                 # Only echo back to sender (making them think message was sent normally)
-                await self.send(text_data=json.dumps({
+                self.queue_send({
                     'message': message,
-                    'sender_username': sender_username,
+                    'sender_username': self.username,
                     'timestamp': text_data_json.get('timestamp', '')
-                }))
+                })
 
                 # Save the message but mark as blocked so it's filtered out for the receiver
                 await database_sync_to_async(self.save_blocked_message)(
-                    sender_id, receiver_id, message
+                    receiver_id, message
                 )
                 return
 
             # No blocking, send message normally to the chat room
-            await self.channel_layer.group_send(
+            await metrics.timed_group_send(
+                self.channel_layer,
                 self.room_group_name,
                 {
                     'type': 'chat_message',
                     'message': message,
-                    'sender_username': sender_username
+                    'sender_username': self.username
                 }
             )
         except Exception as e:
-            logger.error(f"Error in chat consumer receive: {str(e)}")
+            logger.error(f"Error in chat consumer receive: {str(e)}", extra={'sample_key': 'chat.receive_error'})
             # Send error message back to sender
-            await self.send(text_data=json.dumps({
+            self.queue_send({
                 'error': 'An error occurred while processing your message. Please try again.'
-            }))
+            })
 
     async def chat_message(self, event):
         message = event['message']
         sender_username = event['sender_username']
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+        self.queue_send({
             'message': message,
             'sender_username': sender_username
-        }))
+        })
 
-    def check_block_status(self, sender_id, receiver_id):
-        """
-        Check the blocking relationship between sender and receiver
-        Returns: (sender_blocked_receiver, receiver_blocked_sender)
-        """
-        try:
-            from authentication.models import UserBlock
+    def queue_send(self, payload):
+        """Queue a JSON frame for this client without waiting for it to be written"""
+        self.send_buffer.put(json.dumps(payload))
 
-            if not sender_id or not receiver_id:
-                return False, False
+    async def send_typing_indicator(self):
+        """Forward a typing notice to the room, at most once per throttle window"""
+        now = time.monotonic()
+        if now - self.last_typing_sent < getattr(settings, 'TYPING_THROTTLE_SECONDS', 3):
+            return
+        self.last_typing_sent = now
 
-            logger.debug(f"Checking block status between users {sender_id} and {receiver_id}")
+        await metrics.timed_group_send(
+            self.channel_layer,
+            self.room_group_name,
+            {
+                'type': 'typing_indicator',
+                'user_id': self.user_id,
+                'username': self.username
+            }
+        )
 
-            # Check if sender has blocked receiver
-            sender_blocked_receiver = UserBlock.objects.filter(
-                blocker_id=sender_id, blocked_id=receiver_id
-            ).exists()
+    async def typing_indicator(self, event):
+        # Don't echo our own typing notice back
+        if event['user_id'] == self.user_id:
+            return
 
-            # Check if receiver has blocked sender
-            receiver_blocked_sender = UserBlock.objects.filter(
-                blocker_id=receiver_id, blocked_id=sender_id
-            ).exists()
+        self.queue_send({
+            'typing': True,
+            'sender_username': event['username']
+        })
 
-            if sender_blocked_receiver:
-                logger.info(f"Sender {sender_id} has blocked receiver {receiver_id}")
+    async def presence_diff(self, event):
+        # Batched online/offline changes for this user's friends
+        self.queue_send({
+            'presence': event['changes']
+        })
 
-            if receiver_blocked_sender:
-                logger.info(f"Receiver {receiver_id} has blocked sender {sender_id}")
+    async def presence_expired(self, event):
+        # Sent by presence.sweep() when this socket's heartbeats stopped; the next frame brings it back
+        if await presence.expire(self.user_id, self.channel_name):
+            await presence.publish(self.user_id, 'offline', self.friend_ids)
 
-            return sender_blocked_receiver, receiver_blocked_sender
-        except Exception as e:
-            logger.error(f"Error checking block status: {str(e)}")
-            return False, False
+    async def block_update(self, event):
+        # This user blocked or was blocked by someone, or a block was removed
+        pair = (event['blocker_id'], event['blocked_id'])
+        if event['is_blocked']:
+            self.block_pairs.add(pair)
+        else:
+            self.block_pairs.discard(pair)
 
-    def save_blocked_message(self, sender_id, receiver_id, message_text):
-        """Save a message that's blocked but don't deliver it to the receiver"""
-        from chat.models import Message
+    def resolve_peer(self, user_id, room_name):
+        """The active user a room name refers to, or None if user_id may not join the room"""
         from django.contrib.auth.models import User
-        from cryptography.fernet import Fernet
-        from django.conf import settings
 
         try:
-            sender = User.objects.get(id=sender_id)
-            receiver = User.objects.get(id=receiver_id)
+            peer_id = int(room_name)
+        except ValueError:
+            return None
+        if peer_id == user_id or not User.objects.filter(id=peer_id, is_active=True).exists():
+            return None
+        return peer_id
+
+    def load_relationships(self):
+        """
+        Load the connected user's friends and block pairs once per connection
+        Returns: (friend_ids, block_pairs)
+        """
+        from authentication.friends import get_friend_ids
+
+        friend_ids = set(get_friend_ids(self.user_id))
 
-            # Get the cipher
-            cipher = Fernet(settings.ENCRYPTION_KEY)
+        # Also primes the shared block cache for the message views
+        block_pairs = set(block_cache.load(self.user_id))
 
+        return friend_ids, block_pairs
+
+    def save_blocked_message(self, receiver_id, message_text):
+        """Save a message that's blocked but don't deliver it to the receiver"""
+        from chat.models import Message
+        from chat.encryption import encrypt_text
+
+        try:
             # Encrypt the message text
-            encrypted_text = cipher.encrypt(message_text.encode())
+            encrypted_text = encrypt_text(message_text)
 
             # Create message with blocked=True
             Message.objects.create(
-                sender=sender,
-                receiver=receiver,
+                sender_id=self.user_id,
+                receiver_id=receiver_id,
                 encrypted_text=encrypted_text,
                 blocked=True
             )
-            logger.info(f"Saved blocked message from {sender_id} to {receiver_id}")
+            logger.info(f"Saved blocked message from {self.user_id} to {receiver_id}",
+                        extra={'sample_key': 'chat.blocked_message'})
             return True
         except Exception as e:
             logger.error(f"Error saving blocked message: {str(e)}")
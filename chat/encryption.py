@@ -0,0 +1,107 @@
+import zlib
+from cryptography.fernet import Fernet
+from django.conf import settings
+from backend import metrics, profiling
+
+try:
+    import zstandard
+except ImportError:  # Optional; zlib is used instead
+    zstandard = None
+
+
+class InstrumentedFernet(Fernet):
+    """
+    Fernet that counts bytes in and out for /metrics and charges encrypt/decrypt
+    time to the 'crypto' bucket of a profiled request
+    """
+
+    def encrypt(self, data):
+        metrics.crypto_bytes.inc(len(data), operation='encrypt')
+        if profiling.current() is None:
+            return super().encrypt(data)
+        with profiling.timed('crypto'):
+            return super().encrypt(data)
+
+    def decrypt(self, token, ttl=None):
+        metrics.crypto_bytes.inc(len(token), operation='decrypt')
+        if profiling.current() is None:
+            return super().decrypt(token, ttl)
+        with profiling.timed('crypto'):
+            return super().decrypt(token, ttl)
+
+
+cipher = InstrumentedFernet(settings.ENCRYPTION_KEY)
+
+# Plaintext layout inside the Fernet token:
+#   legacy / short messages: the UTF-8 text as-is
+#   framed messages:         MAGIC + FORMAT_VERSION + codec byte + body
+# Text that happens to start with MAGIC is framed with CODEC_RAW so it can't be misread.
+MAGIC = b'\x00\xc5'
+FORMAT_VERSION = b'\x01'
+CODEC_RAW = b'r'
+CODEC_ZLIB = b'z'
+CODEC_ZSTD = b's'
+HEADER_LENGTH = len(MAGIC) + len(FORMAT_VERSION) + 1
+
+
+def _codec():
+    """The configured codec byte, or None when compression is off"""
+    name = getattr(settings, 'MESSAGE_COMPRESSION', 'zstd')
+    if not name:
+        return None
+    if name == 'zstd' and zstandard is not None:
+        return CODEC_ZSTD
+    return CODEC_ZLIB
+
+
+def compress_payload(data, codec=None, threshold=None):
+    """
+    Frame and compress plaintext bytes before encryption. Payloads under the threshold,
+    or that don't get smaller, are returned unchanged so they stay in the legacy layout.
+    """
+    codec = codec if codec is not None else _codec()
+    if threshold is None:
+        threshold = getattr(settings, 'MESSAGE_COMPRESSION_THRESHOLD_BYTES', 256)
+
+    if codec and len(data) >= threshold:
+        if codec == CODEC_ZSTD:
+            body = zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            body = zlib.compress(data, 6)
+        if len(body) + HEADER_LENGTH < len(data):
+            return MAGIC + FORMAT_VERSION + codec + body
+
+    if data.startswith(MAGIC):
+        return MAGIC + FORMAT_VERSION + CODEC_RAW + data
+    return data
+
+
+def decompress_payload(data):
+    """Reverse of compress_payload; plaintext without the header is returned as-is"""
+    if not data.startswith(MAGIC):
+        return data
+
+    version, codec, body = data[2:3], data[3:4], data[HEADER_LENGTH:]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unknown message format version: {version!r}")
+    if codec == CODEC_RAW:
+        return body
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Message is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    raise ValueError(f"Unknown message codec: {codec!r}")
+
+
+def encrypt_text(text):
+    """Compress (when worthwhile) and encrypt message text; returns the Fernet token bytes"""
+    return cipher.encrypt(compress_payload(text.encode()))
+
+
+def decrypt_text(encrypted_text):
+    """Decrypt a token from encrypt_text, or one written before compression existed"""
+    if isinstance(encrypted_text, memoryview):
+        encrypted_text = bytes(encrypted_text)
+    return decompress_payload(cipher.decrypt(encrypted_text)).decode()
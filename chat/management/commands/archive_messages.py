@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from chat.archive import archive_cutoff, archive_direct_messages, archive_group_messages
+
+
+class Command(BaseCommand):
+    help = "Move old chat and group messages into the compressed monthly archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Archive whole months older than this many days (default MESSAGE_ARCHIVE_AFTER_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=None, help="Messages moved per transaction")
+        parser.add_argument('--skip-groups', action='store_true', help="Only archive 1:1 messages")
+
+    def handle(self, *args, **options):
+        if options['batch_size']:
+            settings.MESSAGE_ARCHIVE_BATCH_SIZE = options['batch_size']
+        if options['days'] is not None:
+            settings.MESSAGE_ARCHIVE_AFTER_DAYS = options['days']
+
+        cutoff = archive_cutoff()
+        self.stdout.write(f"Archiving messages older than {cutoff:%Y-%m-%d}")
+
+        archived = archive_direct_messages(cutoff)
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} chat messages"))
+
+        if not options['skip_groups']:
+            archived = archive_group_messages(cutoff)
+            self.stdout.write(self.style.SUCCESS(f"Archived {archived} group messages"))
@@ -0,0 +1,185 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from api.loadtest import compare_to_baseline, summarize
+from chat.models import Message, MediaAttachment
+from groupchat.models import Group, GroupMessage
+
+CASES = ['message_save', 'message_decrypt', 'group_message_decrypt', 'media_save', 'media_decrypt']
+UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+SAMPLE_TEXT = "see you at the meeting tomorrow, bring the deploy notes and the build log please. "
+
+
+def parse_size(text):
+    """'10B', '64KB', '500MB' -> bytes"""
+    text = text.strip().upper()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            number = text[:-len(unit)]
+            break
+    else:
+        unit, number = 'B', text
+    try:
+        return int(float(number) * UNITS[unit])
+    except ValueError:
+        raise CommandError(f"Invalid size: {text}")
+
+
+def size_label(size):
+    for unit in ('GB', 'MB', 'KB'):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f'{size // UNITS[unit]}{unit}'
+    return f'{size}B'
+
+
+def make_payload(size, kind):
+    """Bytes of the given size: chat-like text (compressible) or random (incompressible)"""
+    if kind == 'random':
+        # base64 keeps it valid UTF-8 for message text
+        return base64.b64encode(os.urandom(size * 3 // 4 + 3))[:size]
+    return (SAMPLE_TEXT.encode() * (size // len(SAMPLE_TEXT) + 1))[:size]
+
+
+class Command(BaseCommand):
+    help = ("Benchmark message and attachment encryption paths (Message.save, get_decrypted_message, "
+            "MediaAttachment.save/get_decrypted_data) across payload sizes")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10B,1KB,64KB,1MB,10MB',
+                            help="Comma-separated payload sizes, e.g. 10B,1KB,1MB,500MB")
+        parser.add_argument('--cases', default=','.join(CASES), help="Comma-separated case names")
+        parser.add_argument('--payload', choices=['text', 'random'], default='text',
+                            help="Compressible chat-like text or incompressible random data")
+        parser.add_argument('--min-time', type=float, default=1.0, help="Seconds to keep repeating each case")
+        parser.add_argument('--max-iterations', type=int, default=1000)
+        parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+        parser.add_argument('--output', default=None, help="Write results as JSON to this file")
+        parser.add_argument('--baseline', default=None, help="Compare against a JSON file from an earlier run")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Allowed p95 slowdown vs baseline")
+
+    def handle(self, *args, **options):
+        cases = [name.strip() for name in options['cases'].split(',') if name.strip()]
+        unknown = set(cases) - set(CASES)
+        if unknown:
+            raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}")
+        sizes = [parse_size(size) for size in options['sizes'].split(',') if size.strip()]
+
+        self.stdout.write(f"{'case':<22} {'size':>6} {'iters':>6} {'p50 ms':>10} {'p95 ms':>10} "
+                          f"{'MB/s':>9} {'peak MB':>9} {'copies':>7} {'blocks':>7}")
+        # Attachments are written to a scratch MEDIA_ROOT and every row is rolled back
+        media_root = tempfile.mkdtemp()
+        results = {}
+        try:
+            with override_settings(MEDIA_ROOT=media_root), transaction.atomic():
+                self.sender = User.objects.create(username='bench_crypto_sender')
+                self.receiver = User.objects.create(username='bench_crypto_receiver')
+                self.group = Group.objects.create(name='bench_crypto', creator=self.sender)
+                for size in sizes:
+                    data = make_payload(size, options['payload'])
+                    for case in cases:
+                        name = f'{case}:{size_label(size)}'
+                        results[name] = self.run_case(getattr(self, f'setup_{case}')(data), size, options)
+                        self.report(case, size, results[name])
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['baseline']:
+            regressions = compare_to_baseline(results, options['baseline'], options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f"REGRESSION {regression}"))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS("No regressions against baseline"))
+
+    # Each setup_* prepares rows outside the timed region and returns the operation to time
+
+    def setup_message_save(self, data):
+        text = data.decode()
+        return lambda: Message(sender=self.sender, receiver=self.receiver, encrypted_text=text).save()
+
+    def setup_message_decrypt(self, data):
+        message = Message(sender=self.sender, receiver=self.receiver, encrypted_text=data.decode())
+        message.save()
+        # Read it back so encrypted_text has the type the database driver returns
+        message = Message.objects.get(id=message.id)
+        return message.get_decrypted_message
+
+    def setup_group_message_decrypt(self, data):
+        message = GroupMessage(group=self.group, sender=self.sender, encrypted_text=data.decode())
+        message.save()
+        message = GroupMessage.objects.get(id=message.id)
+        return message.get_decrypted_message
+
+    def setup_media_save(self, data):
+        message = Message.objects.create(sender=self.sender, receiver=self.receiver, encrypted_text=' ')
+        return lambda: MediaAttachment(
+            message=message, file=SimpleUploadedFile('bench.bin', data), file_type='file'
+        ).save()
+
+    def setup_media_decrypt(self, data):
+        message = Message.objects.create(sender=self.sender, receiver=self.receiver, encrypted_text=' ')
+        attachment = MediaAttachment(message=message, file=SimpleUploadedFile('bench.bin', data), file_type='file')
+        attachment.save()
+        attachment = MediaAttachment.objects.get(id=attachment.id)
+        return attachment.get_decrypted_data
+
+    def run_case(self, operation, size, options):
+        # One untimed call warms caches and lazy imports
+        operation()
+        latencies = []
+        started = time.perf_counter()
+        while not latencies or (time.perf_counter() - started < options['min_time']
+                                and len(latencies) < options['max_iterations']):
+            op_started = time.perf_counter()
+            operation()
+            latencies.append((time.perf_counter() - op_started) * 1000)
+        elapsed = time.perf_counter() - started
+
+        result = summarize(latencies, elapsed)
+        result['payload_bytes'] = size
+        result['mb_per_second'] = size * len(latencies) / elapsed / UNITS['MB'] if elapsed else None
+        result.update(self.measure_memory(operation, size) if not options['no_memory'] else
+                      {'peak_bytes': None, 'peak_copies': None, 'live_blocks': None})
+        return result
+
+    def measure_memory(self, operation, size):
+        """
+        Peak traced memory of one call above what was live before it, that peak in multiples of
+        the payload (how many copies the path holds at once), and blocks still allocated afterwards
+        """
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        live_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+        peak_bytes = max(0, peak - baseline)
+        return {'peak_bytes': peak_bytes, 'peak_copies': peak_bytes / size if size else None,
+                'live_blocks': live_blocks}
+
+    def report(self, case, size, result):
+        peak = f"{result['peak_bytes'] / UNITS['MB']:9.2f}" if result['peak_bytes'] is not None else f"{'-':>9}"
+        copies = f"{result['peak_copies']:7.1f}" if result['peak_copies'] is not None else f"{'-':>7}"
+        blocks = f"{result['live_blocks']:7d}" if result['live_blocks'] is not None else f"{'-':>7}"
+        self.stdout.write(
+            f"{case:<22} {size_label(size):>6} {result['requests']:>6} {result['p50_ms']:10.3f} "
+            f"{result['p95_ms']:10.3f} {result['mb_per_second']:9.1f} {peak} {copies} {blocks}"
+        )
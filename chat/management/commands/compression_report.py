@@ -0,0 +1,74 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from chat import encryption
+
+WORDS = ("the a we you meeting tomorrow lunch deploy build failed works thanks sure "
+         "later call me when done review merge branch fix bug release notes send photo").split()
+
+CODE_BLOCK = '''def handler(request):
+    data = json.loads(request.body)
+    if not data.get("user_id"):
+        return JsonResponse({"error": "user_id is required"}, status=400)
+    user = User.objects.get(id=data["user_id"])
+    return JsonResponse({"id": user.id, "username": user.username})
+'''
+
+
+def synthetic_corpus(count, seed):
+    """Mostly short chat lines with some paragraphs and pasted code, like a real inbox"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.8:
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 15)))
+        elif kind < 0.95:
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(60, 400)))
+        else:
+            text = CODE_BLOCK * rng.randint(1, 8)
+        corpus.append(text)
+    return corpus
+
+
+class Command(BaseCommand):
+    help = "Compare stored size and encrypt/decrypt throughput of message compression codecs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=20000, help="Messages in the synthetic corpus")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed for the corpus")
+        parser.add_argument('--threshold', type=int, default=None,
+                            help="Compression threshold in bytes (default MESSAGE_COMPRESSION_THRESHOLD_BYTES)")
+
+    def handle(self, *args, **options):
+        corpus = [text.encode() for text in synthetic_corpus(options['count'], options['seed'])]
+        raw_bytes = sum(len(data) for data in corpus)
+        self.stdout.write(f"{len(corpus)} messages, {raw_bytes} bytes of plaintext")
+
+        codecs = [('none', b''), ('zlib', encryption.CODEC_ZLIB)]
+        if encryption.zstandard is not None:
+            codecs.append(('zstd', encryption.CODEC_ZSTD))
+        else:
+            self.stdout.write("zstandard not installed, skipping zstd")
+
+        baseline = None
+        for name, codec in codecs:
+            start = time.perf_counter()
+            tokens = [
+                encryption.cipher.encrypt(encryption.compress_payload(data, codec, options['threshold']))
+                for data in corpus
+            ]
+            encrypt_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for token in tokens:
+                encryption.decompress_payload(encryption.cipher.decrypt(token))
+            decrypt_seconds = time.perf_counter() - start
+
+            stored = sum(len(token) for token in tokens)
+            baseline = baseline or stored
+            self.stdout.write(
+                f"{name:>5}: {stored:>10} bytes stored ({stored / baseline:.1%} of uncompressed), "
+                f"encrypt {len(corpus) / encrypt_seconds:,.0f} msg/s, "
+                f"decrypt {len(corpus) / decrypt_seconds:,.0f} msg/s"
+            )
@@ -1,3 +1,4 @@
+import logging
 from django.http import HttpResponse, Http404
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
@@ -11,12 +12,28 @@ from django.db.models import Q
 import jwt
 from django.conf import settings
 
-@api_view(["GET"])
-@authentication_classes([])  # Remove default authentication
-@permission_classes([])  # Remove default permission requirements
-def serve_media(request, attachment_id):
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def detect_file_type(media_file):
+    """Map an upload's content type onto the attachment file_type values"""
+    content_type = media_file.content_type.lower()
+
+    if 'image/svg+xml' in content_type:
+        return 'svg'
+    elif 'image/gif' in content_type:
+        return 'gif'
+    elif 'image' in content_type:
+        return 'image'
+    elif 'video' in content_type:
+        return 'video'
+    return 'file'  # Generic file type for other files
+
+
+def authenticate_media_request(request):
     """
-    Serve decrypted media files to authorized users
+    Resolve the user from the ?auth_token= query parameter used by <img>/<video> tags
+    Returns: (user, None) on success or (None, error response)
     """
     # First try token from query params (for direct image/media requests)
     auth_token = request.query_params.get('auth_token')
@@ -43,64 +60,88 @@ def serve_media(request, attachment_id):
             user = User.objects.get(id=user_id)
         except (jwt.InvalidTokenError, User.DoesNotExist, Exception) as e:
             # Log the specific error for debugging
-            print(f"Token authentication error: {str(e)}")
-            return HttpResponse("Invalid token", status=401)
+            logger.warning(f"Token authentication error: {str(e)}", extra={'sample_key': 'media.token_error'})
+            return None, HttpResponse("Invalid token", status=401)
 
     # If authentication failed, return 401
     if not user:
-        return HttpResponse("Authentication required", status=401)
+        return None, HttpResponse("Authentication required", status=401)
 
-    try:
-        # Get the attachment
-        attachment = get_object_or_404(MediaAttachment, id=attachment_id)
-        message = attachment.message
+    return user, None
 
-        # Check if the user is either the sender or receiver of the message
-        if user != message.sender and user != message.receiver:
-            return HttpResponse("Access denied", status=403)
 
-        # Get the decrypted data
-        decrypted_data = attachment.get_decrypted_data()
-        if not decrypted_data:
-            return HttpResponse("Media content not available", status=404)
-
-        # Determine content type based on file_type and filename
-        content_type = "application/octet-stream"  # Default
-        if attachment.file_type == 'svg':
-            content_type = 'image/svg+xml'
-        elif attachment.file_type == 'image':
-            if hasattr(attachment, 'original_filename') and attachment.original_filename:
-                if attachment.original_filename.lower().endswith('.jpg') or attachment.original_filename.lower().endswith('.jpeg'):
-                    content_type = 'image/jpeg'
-                elif attachment.original_filename.lower().endswith('.png'):
-                    content_type = 'image/png'
-                else:
-                    content_type = 'image/jpeg'  # Fallback
+def get_media_content_type(attachment):
+    """Determine content type based on file_type and filename"""
+    content_type = "application/octet-stream"  # Default
+    if attachment.file_type == 'svg':
+        content_type = 'image/svg+xml'
+    elif attachment.file_type == 'image':
+        if hasattr(attachment, 'original_filename') and attachment.original_filename:
+            if attachment.original_filename.lower().endswith('.jpg') or attachment.original_filename.lower().endswith('.jpeg'):
+                content_type = 'image/jpeg'
+            elif attachment.original_filename.lower().endswith('.png'):
+                content_type = 'image/png'
             else:
                 content_type = 'image/jpeg'  # Fallback
-        elif attachment.file_type == 'gif':
-            content_type = 'image/gif'
-        elif attachment.file_type == 'video':
-            if hasattr(attachment, 'original_filename') and attachment.original_filename:
-                if attachment.original_filename.lower().endswith('.mp4'):
-                    content_type = 'video/mp4'
-                elif attachment.original_filename.lower().endswith('.webm'):
-                    content_type = 'video/webm'
-                else:
-                    content_type = 'video/mp4'  # Fallback
+        else:
+            content_type = 'image/jpeg'  # Fallback
+    elif attachment.file_type == 'gif':
+        content_type = 'image/gif'
+    elif attachment.file_type == 'video':
+        if hasattr(attachment, 'original_filename') and attachment.original_filename:
+            if attachment.original_filename.lower().endswith('.mp4'):
+                content_type = 'video/mp4'
+            elif attachment.original_filename.lower().endswith('.webm'):
+                content_type = 'video/webm'
             else:
                 content_type = 'video/mp4'  # Fallback
+        else:
+            content_type = 'video/mp4'  # Fallback
+    return content_type
 
-        # Create a response with the decrypted data
-        response = HttpResponse(decrypted_data, content_type=content_type)
 
-        # Set filename for download if needed
-        if hasattr(attachment, 'original_filename') and attachment.original_filename:
-            response['Content-Disposition'] = f'inline; filename="{attachment.original_filename}"'
+def build_media_response(attachment):
+    """Decrypt an attachment and wrap it in a response with the right headers"""
+    # Get the decrypted data
+    decrypted_data = attachment.get_decrypted_data()
+    if not decrypted_data:
+        return HttpResponse("Media content not available", status=404)
+
+    # Create a response with the decrypted data
+    response = HttpResponse(decrypted_data, content_type=get_media_content_type(attachment))
+
+    # Set filename for download if needed
+    if hasattr(attachment, 'original_filename') and attachment.original_filename:
+        response['Content-Disposition'] = f'inline; filename="{attachment.original_filename}"'
+
+    return response
+
+
+@api_view(["GET"])
+@authentication_classes([])  # Remove default authentication
+@permission_classes([])  # Remove default permission requirements
+def serve_media(request, attachment_id):
+    """
+    Serve decrypted media files to authorized users
+    """
+    user, error_response = authenticate_media_request(request)
+    if error_response:
+        return error_response
+
+    try:
+        # Get the attachment
+        attachment = get_object_or_404(MediaAttachment.objects.select_related('message'), id=attachment_id)
+        message = attachment.message
+
+        # Check if the user is either the sender or receiver of the message
+        if user.id != message.sender_id and user.id != message.receiver_id:
+            return HttpResponse("Access denied", status=403)
 
-        return response
+        return build_media_response(attachment)
 
+    except Http404:
+        raise
     except Exception as e:
         # Log any other errors
-        print(f"Media serving error: {str(e)}")
+        logger.exception(f"Media serving error: {str(e)}", extra={'sample_key': 'media.serve_error'})
         return HttpResponse("Error serving media", status=500)
@@ -0,0 +1,58 @@
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Browsers can't set headers on a WebSocket, so clients offer the token either as
+# ?token=<jwt> or as the subprotocol pair ["jwt", "<jwt>"]
+JWT_SUBPROTOCOL = 'jwt'
+
+
+def get_token_from_scope(scope):
+    """
+    Pull the access token out of the query string or the offered subprotocols
+    Returns: (token, subprotocol) where subprotocol is the one to echo back on accept
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    token = query.get('token', [None])[0]
+    if token:
+        return token, None
+
+    subprotocols = scope.get('subprotocols') or []
+    if JWT_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(JWT_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], JWT_SUBPROTOCOL
+
+    return None, None
+
+
+@database_sync_to_async
+def get_user_from_token(token):
+    """Validate a simplejwt access token and return its active user"""
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken, TokenError
+
+    try:
+        validated_token = AccessToken(token)
+        return User.objects.get(id=validated_token['user_id'], is_active=True)
+    except (TokenError, KeyError, User.DoesNotExist) as e:
+        logger.warning(f"Rejected WebSocket token: {str(e)}", extra={'sample_key': 'chat.rejected_token'})
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Resolve scope['user'] from a JWT access token once, when the socket is opened"""
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        token, subprotocol = get_token_from_scope(scope)
+
+        scope['user'] = await get_user_from_token(token) if token else AnonymousUser()
+        scope['jwt_subprotocol'] = subprotocol
+
+        return await super().__call__(scope, receive, send)
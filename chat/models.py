@@ -1,10 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from cryptography.fernet import Fernet
-from django.conf import settings
-
 # Ensure ENCRYPTION_KEY is correctly set in settings.py
-cipher = Fernet(settings.ENCRYPTION_KEY)
+from .encryption import cipher, encrypt_text, decrypt_text
 
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sent_messages")
@@ -13,31 +10,51 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     blocked = models.BooleanField(default=False)  # Whether this message was sent to someone who blocked the sender
 
+    class Meta:
+        indexes = [
+            # Each direction of a conversation is one range scan in timestamp order
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='message_conversation_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         """Encrypt message before saving"""
         if isinstance(self.encrypted_text, str):
-            self.encrypted_text = cipher.encrypt(self.encrypted_text.encode())  # Convert to bytes
+            self.encrypted_text = encrypt_text(self.encrypted_text)  # Compressed when long, then encrypted
         super().save(*args, **kwargs)
 
     def get_decrypted_message(self):
         """Decrypt message"""
-        if isinstance(self.encrypted_text, memoryview):  # Convert memoryview to bytes
-            encrypted_data = bytes(self.encrypted_text)
-        else:
-            encrypted_data = self.encrypted_text
-
-        decrypted = cipher.decrypt(encrypted_data).decode().strip()
+        decrypted = decrypt_text(self.encrypted_text).strip()
         # If message is just a space (our placeholder for empty messages), return empty string
         return "" if decrypted == " " else decrypted
 
-class MediaAttachment(models.Model):
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="attachments")
+class MessageArchive(models.Model):
+    """
+    Cold tier for old 1:1 messages: one row per conversation per month holding the
+    month's still-encrypted messages as a zlib-compressed JSON list (see chat/archive.py)
+    """
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")  # Smaller user id of the pair
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    month = models.DateField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.IntegerField(default=0)
+    payload = models.BinaryField()
+
+    class Meta:
+        unique_together = ('user_low', 'user_high', 'month')
+
+class EncryptedAttachment(models.Model):
+    """File attachment whose contents are encrypted once, on upload"""
     file = models.FileField(upload_to='message_attachments/')
     file_type = models.CharField(max_length=20)  # 'image', 'video', or 'gif'
     encrypted_data = models.BinaryField(null=True, blank=True)
     original_filename = models.CharField(max_length=255, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        abstract = True
+
     def save(self, *args, **kwargs):
         """Encrypt file data before saving"""
         # Store the original filename
@@ -75,3 +92,6 @@ class MediaAttachment(models.Model):
             encrypted_data = self.encrypted_data
 
         return cipher.decrypt(encrypted_data)
+
+class MediaAttachment(EncryptedAttachment):
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="attachments")
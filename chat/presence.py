@@ -0,0 +1,201 @@
+import asyncio
+import time
+import logging
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from backend import metrics
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Refreshed by heartbeats, expires PRESENCE_TTL_SECONDS after the last one
+PRESENCE_KEY = 'presence:{}'
+# Open sockets for a user across every worker
+CONNECTIONS_KEY = 'presence_connections:{}'
+# Kept long after the user goes offline so friends can see "last seen"
+LAST_SEEN_KEY = 'presence_last_seen:{}'
+LAST_SEEN_TTL = 60 * 60 * 24 * 30
+
+# channel_name -> (user_id, monotonic time of the last heartbeat written for that socket),
+# for the sockets open in this worker that still count as online
+_last_heartbeat = {}
+# friend_id -> {user_id: status}, flushed as one presence_diff per friend
+_pending = {}
+_flush_task = None
+_sweep_task = None
+
+
+def _ttl():
+    return getattr(settings, 'PRESENCE_TTL_SECONDS', 60)
+
+
+def _heartbeat_interval():
+    return getattr(settings, 'PRESENCE_HEARTBEAT_INTERVAL_SECONDS', 20)
+
+
+def _flush_delay():
+    return getattr(settings, 'PRESENCE_FLUSH_SECONDS', 1)
+
+
+def user_group(user_id):
+    """Channel layer group holding every socket a user has open"""
+    return f'user_{user_id}'
+
+
+async def mark_online(user_id, channel_name):
+    """Record a new socket for user_id; returns True if the user just came online"""
+    global _sweep_task
+
+    ttl = _ttl()
+    connections_key = CONNECTIONS_KEY.format(user_id)
+
+    await cache.aadd(connections_key, 0, ttl)
+    try:
+        count = await cache.aincr(connections_key)
+    except ValueError:
+        # Key expired between add and incr
+        await cache.aset(connections_key, 1, ttl)
+        count = 1
+
+    await cache.aset(PRESENCE_KEY.format(user_id), time.time(), ttl)
+    _last_heartbeat[channel_name] = (user_id, time.monotonic())
+
+    if _sweep_task is None or _sweep_task.done():
+        _sweep_task = asyncio.ensure_future(_sweep_forever())
+    return count == 1
+
+
+async def mark_offline(user_id, channel_name):
+    """Drop a socket for user_id; returns True if it was the user's last one"""
+    # A socket whose presence already expired was counted out by expire()
+    if _last_heartbeat.pop(channel_name, None) is None:
+        return False
+
+    connections_key = CONNECTIONS_KEY.format(user_id)
+    try:
+        count = await cache.adecr(connections_key)
+    except ValueError:
+        count = 0
+
+    if count > 0:
+        return False
+
+    await cache.adelete_many([connections_key, PRESENCE_KEY.format(user_id)])
+    await cache.aset(LAST_SEEN_KEY.format(user_id), time.time(), LAST_SEEN_TTL)
+    return True
+
+
+async def heartbeat(user_id, channel_name):
+    """
+    Refresh the user's presence TTL. Heartbeats on a socket are coalesced so the cache
+    sees at most one write per interval from it. A socket whose presence expired is
+    counted back in; returns True if that brought the user back online.
+    """
+    if channel_name not in _last_heartbeat:
+        return await mark_online(user_id, channel_name)
+
+    now = time.monotonic()
+    if now - _last_heartbeat[channel_name][1] < _heartbeat_interval():
+        return False
+    _last_heartbeat[channel_name] = (user_id, now)
+
+    ttl = _ttl()
+    await cache.aset(PRESENCE_KEY.format(user_id), time.time(), ttl)
+    await cache.atouch(CONNECTIONS_KEY.format(user_id), ttl)
+    return False
+
+
+async def expire(user_id, channel_name):
+    """
+    Count out a socket that has sent nothing for PRESENCE_TTL_SECONDS, as if it had closed.
+    Returns True if the user went offline; False if the socket heartbeated in the meantime.
+    """
+    last = _last_heartbeat.get(channel_name)
+    if last is None or time.monotonic() - last[1] < _ttl():
+        return False
+    return await mark_offline(user_id, channel_name)
+
+
+async def sweep():
+    """Ask each socket in this worker whose heartbeats stopped to expire its presence"""
+    deadline = time.monotonic() - _ttl()
+    stale = [channel_name for channel_name, (_, at) in _last_heartbeat.items() if at <= deadline]
+    if not stale:
+        return
+
+    # The consumer holds the friend list the offline diff goes to
+    channel_layer = get_channel_layer()
+    for channel_name in stale:
+        try:
+            await channel_layer.send(channel_name, {'type': 'presence_expired'})
+        except Exception as e:
+            logger.error(f"Error expiring presence on {channel_name}: {str(e)}")
+
+
+async def _sweep_forever():
+    # Runs while this worker has sockets counted as online
+    while _last_heartbeat:
+        await asyncio.sleep(_ttl() / 2)
+        await sweep()
+
+
+async def publish(user_id, status, friend_ids):
+    """Queue a presence change for the user's friends; sent in batches"""
+    global _flush_task
+
+    for friend_id in friend_ids:
+        _pending.setdefault(friend_id, {})[user_id] = status
+
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.ensure_future(_flush_later())
+
+
+async def _flush_later():
+    global _pending
+
+    await asyncio.sleep(_flush_delay())
+    pending, _pending = _pending, {}
+    if not pending:
+        return
+
+    # Only friends that are online have a socket to deliver to
+    online = await cache.aget_many([PRESENCE_KEY.format(friend_id) for friend_id in pending])
+
+    channel_layer = get_channel_layer()
+    for friend_id, changes in pending.items():
+        if PRESENCE_KEY.format(friend_id) not in online:
+            continue
+        try:
+            await metrics.timed_group_send(
+                channel_layer,
+                user_group(friend_id),
+                {
+                    'type': 'presence_diff',
+                    'changes': [
+                        {'user_id': user_id, 'status': status}
+                        for user_id, status in changes.items()
+                    ],
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error publishing presence to user {friend_id}: {str(e)}")
+
+
+def get_presence(user_ids):
+    """
+    Look up presence for many users in two cache round trips
+    Returns: {user_id: {"online": bool, "last_seen": float or None}}
+    """
+    user_ids = list(user_ids)
+    online = cache.get_many([PRESENCE_KEY.format(user_id) for user_id in user_ids])
+    last_seen = cache.get_many([LAST_SEEN_KEY.format(user_id) for user_id in user_ids])
+
+    presence = {}
+    for user_id in user_ids:
+        heartbeat_at = online.get(PRESENCE_KEY.format(user_id))
+        presence[user_id] = {
+            "online": heartbeat_at is not None,
+            "last_seen": heartbeat_at or last_seen.get(LAST_SEEN_KEY.format(user_id)),
+        }
+    return presence
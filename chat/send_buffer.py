@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from django.conf import settings
+from backend import metrics
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = 'drop_oldest'
+DISCONNECT = 'disconnect'
+RESYNC = 'resync'
+POLICIES = (DROP_OLDEST, DISCONNECT, RESYNC)
+
+# Close code sent to clients that fell too far behind under the disconnect policy
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+# Sent in place of everything that was queued under the resync policy
+RESYNC_NOTICE = json.dumps({'resync': True})
+
+# Worker-wide counters, summed over every open SendBuffer
+_stats = {
+    'buffered_bytes': 0,
+    'buffered_messages': 0,
+    'sent_messages': 0,
+    'dropped_messages': 0,
+    'resyncs': 0,
+    'disconnects': 0,
+    'oversized_messages': 0,
+}
+
+
+def stats():
+    """Snapshot of the worker-wide send buffer counters"""
+    return dict(_stats)
+
+
+class SendBuffer:
+    """
+    Bounded outbound queue for one WebSocket connection. Frames are queued
+    without waiting and a background task writes them out, so a slow client
+    only ever holds up to max_messages / max_bytes of memory in this worker.
+    """
+
+    def __init__(self, send, close, max_messages=None, max_bytes=None, policy=None):
+        self._send = send
+        self._close = close
+        self.max_messages = max_messages or getattr(settings, 'CHAT_SEND_BUFFER_MAX_MESSAGES', 100)
+        self.max_bytes = max_bytes or getattr(settings, 'CHAT_SEND_BUFFER_MAX_BYTES', 256 * 1024)
+        self.policy = policy or getattr(settings, 'CHAT_SEND_BUFFER_POLICY', DROP_OLDEST)
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown send buffer policy: {self.policy}")
+
+        self.queue = deque()
+        self.buffered_bytes = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._task = asyncio.ensure_future(self._drain())
+
+    def put(self, text_data):
+        """Queue a text frame; applies the overflow policy instead of blocking"""
+        if self.closed:
+            return
+
+        # A frame bigger than max_bytes can't fit even in an empty queue; rather than push
+        # everything else out for it, drop it and have the client refetch over HTTP
+        oversized = len(text_data) > self.max_bytes
+        if oversized:
+            logger.warning(f"Dropping {len(text_data)} byte WebSocket frame over the send buffer limit",
+                           extra={'sample_key': 'chat.send_buffer_oversized'})
+            _stats['oversized_messages'] += 1
+            _stats['dropped_messages'] += 1
+            text_data = RESYNC_NOTICE
+
+        size = len(text_data)  # json.dumps output is ASCII, so characters == bytes
+        if self._overflows(size):
+            if self.policy == DISCONNECT:
+                logger.warning("Closing slow WebSocket client: send buffer full",
+                               extra={'sample_key': 'chat.send_buffer_full'})
+                _stats['disconnects'] += 1
+                self.close()
+                asyncio.ensure_future(self._close(code=SLOW_CONSUMER_CLOSE_CODE))
+                return
+            if self.policy == RESYNC:
+                # Everything queued is stale; the client refetches history over HTTP
+                _stats['resyncs'] += 1
+                _stats['dropped_messages'] += len(self.queue)
+                self._clear()
+                self._append(RESYNC_NOTICE)
+                return
+            while self.queue and self._overflows(size):
+                self._pop()
+                _stats['dropped_messages'] += 1
+
+        if oversized:
+            _stats['resyncs'] += 1
+        self._append(text_data)
+
+    def close(self):
+        """Stop writing and release everything still queued"""
+        if self.closed:
+            return
+        self.closed = True
+        self._clear()
+        self._task.cancel()
+
+    def _overflows(self, size):
+        return (len(self.queue) + 1 > self.max_messages or
+                self.buffered_bytes + size > self.max_bytes)
+
+    def _append(self, text_data):
+        self.queue.append(text_data)
+        self.buffered_bytes += len(text_data)
+        _stats['buffered_bytes'] += len(text_data)
+        _stats['buffered_messages'] += 1
+        self._ready.set()
+
+    def _pop(self):
+        text_data = self.queue.popleft()
+        self.buffered_bytes -= len(text_data)
+        _stats['buffered_bytes'] -= len(text_data)
+        _stats['buffered_messages'] -= 1
+        return text_data
+
+    def _clear(self):
+        while self.queue:
+            self._pop()
+
+    async def _drain(self):
+        while True:
+            if not self.queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            text_data = self._pop()
+            try:
+                await self._send(text_data=text_data)
+                _stats['sent_messages'] += 1
+            except Exception as e:
+                logger.error(f"Error writing to WebSocket: {str(e)}")
+                self.close()
+                return
+
+
+def _collect():
+    snapshot = stats()
+    return [
+        (f'chat_send_buffer_{name}', 'gauge', f"Outbound WebSocket frames held in this worker ({name})",
+         {(): snapshot[name]})
+        for name in ('buffered_bytes', 'buffered_messages')
+    ] + [
+        (f'chat_send_buffer_{name}_total', 'counter', f"Outbound WebSocket {name.replace('_', ' ')} in this worker",
+         {(): snapshot[name]})
+        for name in ('sent_messages', 'dropped_messages', 'resyncs', 'disconnects', 'oversized_messages')
+    ]
+
+
+metrics.register_collector(_collect)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from backend.profiling import TimedSerializerMixin
 from .models import Message, MediaAttachment
 
 class MediaAttachmentSerializer(serializers.ModelSerializer):
@@ -12,7 +13,7 @@ class MediaAttachmentSerializer(serializers.ModelSerializer):
         # Don't use absolute URLs here - the frontend will handle authentication
         return f"/api/chat/media/{obj.id}/"
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     sender_username = serializers.CharField(source="sender.username", read_only=True)
     timestamp = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
     decrypted_text = serializers.SerializerMethodField()
@@ -1,3 +1,605 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from urllib.parse import quote
+from unittest import mock, skipIf
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from django.utils import timezone
+from authentication.models import Friendship, UserBlock
+from backend.testing import QueryScalingTestCase, make_users
+from . import archive, encryption, presence, send_buffer
+from .encryption import cipher, encrypt_text
+from .consumers import ChatConsumer
+from .middleware import JWTAuthMiddleware
+from .routing import websocket_urlpatterns
+from .models import Message, MediaAttachment
 
-# Create your tests here.
+PNG = b'\x89PNG\r\n\x1a\n scaling test'
+
+
+class ChatEndpointScalingTests(QueryScalingTestCase):
+    """Every URL in chat/urls.py keeps a flat query count as conversations grow"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'unused')
+        self.partner = User.objects.create_user('partner', 'partner@example.com', 'unused')
+        Friendship.objects.create(sender=self.user, receiver=self.partner, status='ACCEPTED')
+        self.own_messages = []
+
+    def grow(self, count):
+        """Add friends and `count` messages each way with the partner, every third with an image"""
+        friends = make_users('friend', count)
+        Friendship.objects.bulk_create([
+            Friendship(sender=friend, receiver=self.user, status='ACCEPTED') for friend in friends
+        ])
+
+        payload = encrypt_text('scaling test message')
+        messages = Message.objects.bulk_create(
+            [Message(sender=self.user, receiver=self.partner, encrypted_text=payload) for _ in range(count)] +
+            [Message(sender=self.partner, receiver=self.user, encrypted_text=payload) for _ in range(count)]
+        )
+        messages = list(Message.objects.filter(sender__in=[self.user, self.partner]).order_by('-id')[:len(messages)])
+        media = cipher.encrypt(PNG)
+        MediaAttachment.objects.bulk_create([
+            MediaAttachment(message=message, file='message_attachments/scaling.png', file_type='image',
+                            encrypted_data=media, original_filename='scaling.png')
+            for message in messages[::3]
+        ])
+        self.own_messages = list(Message.objects.filter(sender=self.user).order_by('id'))
+
+    def test_send_message(self):
+        self.assertScales(lambda run: self.client_for(self.user).post(
+            '/api/chat/send/', {'receiver': self.partner.id, 'text': f'hello {run}'}, format='json'), status=201)
+
+    def test_send_message_with_media(self):
+        self.assertScales(lambda run: self.client_for(self.user).post('/api/chat/send-with-media/', {
+            'receiver': self.partner.id, 'text': f'photo {run}', 'media': SimpleUploadedFile('photo.png', PNG, 'image/png')
+        }, format='multipart'), status=201)
+
+    def test_get_messages(self):
+        self.assertScales(lambda run: self.client_for(self.user).get(f'/api/chat/{self.partner.id}/'))
+
+    def test_get_messages_page(self):
+        self.assertScales(lambda run: self.client_for(self.user).get(f'/api/chat/{self.partner.id}/?limit=20'))
+
+    def test_serve_media(self):
+        def call(run):
+            attachment = MediaAttachment.objects.filter(message__sender=self.user).order_by('id').first()
+            return self.client_for().get(f'/api/chat/media/{attachment.id}/?auth_token={self.token_for(self.user)}')
+        self.assertScales(call)
+
+    def test_delete_message(self):
+        self.assertScales(lambda run: self.client_for(self.user).delete(
+            f'/api/chat/delete/{self.own_messages[run].id}/'), status=204)
+
+    def test_get_friends_presence(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/chat/presence/'))
+
+
+class ArchivePagingTests(TestCase):
+    """page_with_archive walks the hot table and the archive as one history"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'unused')
+        self.partner = User.objects.create_user('writer', 'writer@example.com', 'unused')
+        self.old = archive.archive_cutoff() - timedelta(days=40)
+        self.names = {}
+
+    def add(self, name, timestamp, attachment=False):
+        message = Message.objects.create(sender=self.user, receiver=self.partner, encrypted_text=encrypt_text(name))
+        Message.objects.filter(id=message.id).update(timestamp=timestamp)
+        if attachment:
+            # Messages with attachments are never archived
+            MediaAttachment.objects.bulk_create([MediaAttachment(
+                message=message, file='message_attachments/old.png', file_type='image',
+                encrypted_data=cipher.encrypt(PNG), original_filename='old.png'
+            )])
+        self.names[message.id] = name
+
+    def walk(self, limit=2):
+        """Names of every message, newest first, fetched limit at a time"""
+        hot = Message.objects.filter(
+            Q(sender=self.user, receiver=self.partner) | Q(sender=self.partner, receiver=self.user)
+        )
+        names, cursor = [], None
+        while True:
+            page, cursor = archive.page_with_archive(
+                hot, archive.direct_archives(self.user.id, self.partner.id), cursor, limit,
+                lambda row: archive.build_direct_message(row, self.user.id, self.partner.id)
+            )
+            self.assertLessEqual(len(page), limit)
+            names += [self.names[message.id] for message in page]
+            if cursor is None:
+                return names
+
+    def test_archived_rows_between_hot_rows(self):
+        now = timezone.now()
+        self.add('R3', now - timedelta(hours=1))
+        self.add('R2', now - timedelta(hours=2))
+        self.add('A1', self.old, attachment=True)
+        self.add('X', self.old - timedelta(days=1))
+        self.add('A0', self.old - timedelta(days=2), attachment=True)
+        self.add('Am1', self.old - timedelta(days=3), attachment=True)
+        self.assertEqual(archive.archive_direct_messages(), 1)
+
+        self.assertEqual(self.walk(), ['R3', 'R2', 'A1', 'X', 'A0', 'Am1'])
+
+    def test_archive_only(self):
+        for day in range(5):
+            self.add(f'O{day}', self.old - timedelta(days=day))
+        self.assertEqual(archive.archive_direct_messages(), 5)
+
+        self.assertEqual(self.walk(), ['O0', 'O1', 'O2', 'O3', 'O4'])
+
+    def test_hot_only(self):
+        now = timezone.now()
+        for hour in range(5):
+            self.add(f'H{hour}', now - timedelta(hours=hour))
+
+        self.assertEqual(self.walk(), ['H0', 'H1', 'H2', 'H3', 'H4'])
+
+
+def chat_communicator(user, peer):
+    """WebsocketCommunicator for user's chat with peer, with the scope JWTAuthMiddleware would build"""
+    room = str(peer.id)
+    communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{room}/')
+    communicator.scope['user'] = user
+    communicator.scope['url_route'] = {'args': (), 'kwargs': {'room_name': room}}
+    return communicator
+
+
+class BlockPropagationTests(TestCase):
+    """Block changes reach the message views and open sockets straight away"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('blocker', 'blocker@example.com', 'unused')
+        self.other = User.objects.create_user('blocked', 'blocked@example.com', 'unused')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def block(self, blocker, blocked):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(blocker).post('/api/auth/block/', {'user_id': blocked.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def unblock(self, blocker, blocked):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(blocker).delete(f'/api/auth/unblock/{blocked.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def visible_to_user(self):
+        response = self.client_for(self.user).get(f'/api/chat/{self.other.id}/')
+        self.assertEqual(response.status_code, 200)
+        return len(response.data)
+
+    def test_block_and_unblock_reach_message_views(self):
+        Message.objects.create(sender=self.other, receiver=self.user, encrypted_text='before the block')
+        # Warms the cached block pairs for both users
+        self.assertEqual(self.visible_to_user(), 1)
+
+        self.block(self.user, self.other)
+        self.assertEqual(self.visible_to_user(), 0)
+        self.client_for(self.other).post('/api/chat/send/', {'receiver': self.user.id, 'text': 'while blocked'},
+                                         format='json')
+        self.assertTrue(Message.objects.filter(sender=self.other, blocked=True).exists())
+
+        self.unblock(self.user, self.other)
+        self.assertEqual(self.visible_to_user(), 1)
+
+    def texts(self, viewer, peer, **params):
+        response = self.client_for(viewer).get(f'/api/chat/{peer.id}/', params)
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if params else response.data
+        return [row['decrypted_text'] for row in rows]
+
+    def test_unblock_restores_history_but_not_messages_sent_while_blocked(self):
+        for text in ('before 1', 'before 2'):
+            self.client_for(self.other).post('/api/chat/send/', {'receiver': self.user.id, 'text': text}, format='json')
+        self.client_for(self.user).post('/api/chat/send/', {'receiver': self.other.id, 'text': 'reply'}, format='json')
+
+        self.block(self.user, self.other)
+        self.assertEqual(self.texts(self.user, self.other), ['reply'])
+        self.client_for(self.other).post('/api/chat/send/', {'receiver': self.user.id, 'text': 'while blocked'},
+                                         format='json')
+        # The blocked sender still sees their message, so the block isn't revealed
+        self.assertEqual(self.texts(self.other, self.user), ['before 1', 'before 2', 'reply', 'while blocked'])
+
+        self.unblock(self.user, self.other)
+        # Blocking no longer rewrites earlier rows, so the history from before the block is back
+        self.assertEqual(Message.objects.filter(blocked=True).count(), 1)
+        for params in ({}, {'limit': 50}):
+            self.assertEqual(self.texts(self.user, self.other, **params), ['before 1', 'before 2', 'reply'])
+        self.assertEqual(self.texts(self.other, self.user), ['before 1', 'before 2', 'reply', 'while blocked'])
+
+    async def test_block_and_unblock_reach_open_socket(self):
+        communicator = chat_communicator(self.user, self.other)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await database_sync_to_async(self.block)(self.user, self.other)
+        await communicator.receive_nothing(0.1)
+        await communicator.send_json_to({'message': 'hello', 'receiver_id': self.other.id})
+        response = await communicator.receive_json_from()
+        self.assertIn('You have blocked this user', response.get('error', ''))
+
+        await database_sync_to_async(self.unblock)(self.user, self.other)
+        await communicator.receive_nothing(0.1)
+        await communicator.send_json_to({'message': 'hello again', 'receiver_id': self.other.id})
+        response = await communicator.receive_json_from()
+        self.assertNotIn('error', response)
+        self.assertEqual(response['message'], 'hello again')
+        await communicator.disconnect()
+
+
+@override_settings(PRESENCE_FLUSH_SECONDS=0.05)
+class PresenceTests(TestCase):
+    """Friends see one online/offline change per user, batched, however many sockets they open"""
+
+    def setUp(self):
+        cache.clear()
+        # Per-worker state; tasks left by an earlier test belong to its closed event loop
+        presence._last_heartbeat.clear()
+        presence._pending.clear()
+        presence._flush_task = presence._sweep_task = None
+        self.watcher = User.objects.create_user('watcher', 'watcher@example.com', 'unused')
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'unused')
+        self.carol = User.objects.create_user('carol', 'carol@example.com', 'unused')
+        for friend in (self.alice, self.carol):
+            Friendship.objects.create(sender=friend, receiver=self.watcher, status='ACCEPTED')
+
+    async def connect(self, user, peer):
+        communicator = chat_communicator(user, peer)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def online(self, user):
+        return presence.get_presence([user.id])[user.id]['online']
+
+    async def test_connections_counted_across_sockets(self):
+        watcher = await self.connect(self.watcher, self.alice)
+        first = await self.connect(self.alice, self.watcher)
+        self.assertEqual((await watcher.receive_json_from())['presence'],
+                         [{'user_id': self.alice.id, 'status': 'online'}])
+
+        # A second socket and closing one of two are not presence changes
+        second = await self.connect(self.alice, self.carol)
+        # connect() returns on accept, before the consumer has counted the socket
+        self.assertTrue(await watcher.receive_nothing(0.2))
+        await first.disconnect()
+        self.assertTrue(await watcher.receive_nothing(0.2))
+        self.assertTrue(await database_sync_to_async(self.online)(self.alice))
+
+        await second.disconnect()
+        self.assertEqual((await watcher.receive_json_from())['presence'],
+                         [{'user_id': self.alice.id, 'status': 'offline'}])
+        state = await database_sync_to_async(presence.get_presence)([self.alice.id])
+        self.assertFalse(state[self.alice.id]['online'])
+        self.assertIsNotNone(state[self.alice.id]['last_seen'])
+        await watcher.disconnect()
+
+    # Wide enough for both users to connect before the first flush
+    @override_settings(PRESENCE_FLUSH_SECONDS=0.5)
+    async def test_changes_batched_per_friend(self):
+        watcher = await self.connect(self.watcher, self.alice)
+        alice = await self.connect(self.alice, self.watcher)
+        carol = await self.connect(self.carol, self.watcher)
+
+        changes = (await watcher.receive_json_from())['presence']
+        self.assertCountEqual(changes, [
+            {'user_id': self.alice.id, 'status': 'online'},
+            {'user_id': self.carol.id, 'status': 'online'},
+        ])
+        self.assertTrue(await watcher.receive_nothing(0.2))
+
+        for communicator in (alice, carol, watcher):
+            await communicator.disconnect()
+
+    async def test_silent_socket_expires_and_returns(self):
+        watcher = await self.connect(self.watcher, self.alice)
+        alice = await self.connect(self.alice, self.watcher)
+        await watcher.receive_json_from()
+
+        # Alice's socket stays open but stops heartbeating for longer than the TTL
+        channel_name = next(name for name, (user_id, _) in presence._last_heartbeat.items()
+                            if user_id == self.alice.id)
+        presence._last_heartbeat[channel_name] = (self.alice.id, 0)
+        await presence.sweep()
+        self.assertEqual((await watcher.receive_json_from())['presence'],
+                         [{'user_id': self.alice.id, 'status': 'offline'}])
+        self.assertFalse(await database_sync_to_async(self.online)(self.alice))
+
+        await alice.send_json_to({'type': 'heartbeat'})
+        self.assertEqual((await watcher.receive_json_from())['presence'],
+                         [{'user_id': self.alice.id, 'status': 'online'}])
+
+        await alice.disconnect()
+        self.assertEqual((await watcher.receive_json_from())['presence'],
+                         [{'user_id': self.alice.id, 'status': 'offline'}])
+        await watcher.disconnect()
+
+
+class MessageFramingTests(TestCase):
+    """Compressed framing round-trips and still reads ciphertext written before it existed"""
+
+    TEXT = 'see you at the meeting tomorrow, bring the deploy notes. ' * 20
+
+    def round_trip(self, codec):
+        framed = encryption.compress_payload(self.TEXT.encode(), codec=codec, threshold=0)
+        self.assertEqual(framed[:encryption.HEADER_LENGTH], encryption.MAGIC + encryption.FORMAT_VERSION + codec)
+        self.assertLess(len(framed), len(self.TEXT))
+        self.assertEqual(encryption.decrypt_text(cipher.encrypt(framed)), self.TEXT)
+
+    def test_zlib_round_trip(self):
+        self.round_trip(encryption.CODEC_ZLIB)
+
+    @skipIf(encryption.zstandard is None, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        self.round_trip(encryption.CODEC_ZSTD)
+
+    def test_raw_round_trip(self):
+        # UTF-8 text that starts with the magic bytes is framed raw so it isn't misread as a header
+        text = '\x00\u0140 hello'
+        self.assertTrue(text.encode().startswith(encryption.MAGIC))
+        framed = encryption.compress_payload(text.encode())
+        self.assertEqual(framed[:encryption.HEADER_LENGTH],
+                         encryption.MAGIC + encryption.FORMAT_VERSION + encryption.CODEC_RAW)
+        self.assertEqual(encryption.decrypt_text(encrypt_text(text)), text)
+
+    @override_settings(MESSAGE_COMPRESSION='zstd')
+    def test_encrypt_text_uses_configured_codec(self):
+        expected = encryption.CODEC_ZSTD if encryption.zstandard else encryption.CODEC_ZLIB
+        plaintext = cipher.decrypt(encrypt_text(self.TEXT))
+        self.assertEqual(plaintext[3:4], expected)
+        self.assertEqual(encryption.decrypt_text(encrypt_text(self.TEXT)), self.TEXT)
+
+    def test_baseline_ciphertext_without_magic(self):
+        for text in ('hi', self.TEXT):
+            token = cipher.encrypt(text.encode())
+            self.assertEqual(encryption.decrypt_text(token), text)
+            self.assertEqual(encryption.decrypt_text(memoryview(token)), text)
+
+    def test_payload_below_threshold_left_unframed(self):
+        data = b'short message'
+        self.assertEqual(encryption.compress_payload(data, codec=encryption.CODEC_ZLIB, threshold=256), data)
+        with override_settings(MESSAGE_COMPRESSION=None):
+            self.assertEqual(encryption.compress_payload(self.TEXT.encode()), self.TEXT.encode())
+
+    def test_unknown_version_or_codec_raises(self):
+        body = encryption.compress_payload(self.TEXT.encode(), codec=encryption.CODEC_ZLIB, threshold=0)[4:]
+        with self.assertRaisesRegex(ValueError, 'Unknown message format version'):
+            encryption.decrypt_text(cipher.encrypt(encryption.MAGIC + b'\x09' + encryption.CODEC_ZLIB + body))
+        with self.assertRaisesRegex(ValueError, 'Unknown message codec'):
+            encryption.decrypt_text(cipher.encrypt(encryption.MAGIC + encryption.FORMAT_VERSION + b'x' + body))
+        # A zstd message read on a worker without the optional package
+        with mock.patch.object(encryption, 'zstandard', None):
+            with self.assertRaisesRegex(ValueError, 'zstandard package is not installed'):
+                encryption.decompress_payload(encryption.MAGIC + encryption.FORMAT_VERSION + encryption.CODEC_ZSTD + body)
+
+
+class WebsocketAuthTests(TestCase):
+    """Sockets are authenticated by JWTAuthMiddleware, and frames can't claim another identity"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('socket', 'socket@example.com', 'unused')
+        self.other = User.objects.create_user('other', 'other@example.com', 'unused')
+        self.application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def token_for(self, user, lifetime=None):
+        token = AccessToken.for_user(user)
+        if lifetime is not None:
+            token.set_exp(lifetime=lifetime)
+        return str(token)
+
+    def communicator(self, token=None, subprotocols=None):
+        path = f'/ws/chat/{self.other.id}/' + (f'?token={quote(token)}' if token else '')
+        return WebsocketCommunicator(self.application, path, subprotocols=subprotocols)
+
+    async def test_query_string_token(self):
+        communicator = self.communicator(await database_sync_to_async(self.token_for)(self.user))
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertIsNone(subprotocol)
+        await communicator.disconnect()
+
+    async def test_subprotocol_token_is_echoed(self):
+        token = await database_sync_to_async(self.token_for)(self.user)
+        communicator = self.communicator(subprotocols=['jwt', token])
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'jwt')
+        await communicator.disconnect()
+
+    async def test_bad_tokens_close_with_4001(self):
+        expired = await database_sync_to_async(self.token_for)(self.user, lifetime=-timedelta(minutes=1))
+        for communicator in (
+            self.communicator(),
+            self.communicator('not-a-jwt'),
+            self.communicator(expired),
+            self.communicator(subprotocols=['jwt', expired]),
+        ):
+            connected, code = await communicator.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4001)
+
+    async def test_inactive_user_is_rejected(self):
+        token = await database_sync_to_async(self.token_for)(self.user)
+        await User.objects.filter(id=self.user.id).aupdate(is_active=False)
+        connected, code = await self.communicator(token).connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+
+    async def test_sender_identity_in_frames_is_ignored(self):
+        communicator = self.communicator(await database_sync_to_async(self.token_for)(self.user))
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to({
+            'message': 'hello', 'receiver_id': self.other.id,
+            'sender_id': self.other.id, 'sender_username': self.other.username, 'user_id': self.other.id,
+        })
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {'message': 'hello', 'sender_username': self.user.username})
+        await communicator.disconnect()
+
+
+class SendBufferTests(TestCase):
+    """Each overflow policy bounds a slow client's queue and keeps the worker counters right"""
+
+    def setUp(self):
+        self.sent = []
+        self.close_codes = []
+        self.writable = asyncio.Event()
+        self.before = send_buffer.stats()
+
+    async def send(self, text_data):
+        # Stalls like a client that stopped reading until the test lets it go
+        await self.writable.wait()
+        self.sent.append(text_data)
+
+    async def close(self, code=None):
+        self.close_codes.append(code)
+
+    def make_buffer(self, policy, max_messages=3, max_bytes=1000):
+        return send_buffer.SendBuffer(self.send, self.close, max_messages=max_messages, max_bytes=max_bytes,
+                                      policy=policy)
+
+    def changes(self):
+        after = send_buffer.stats()
+        return {name: after[name] - self.before[name] for name in after if after[name] != self.before[name]}
+
+    async def drain(self, buffer):
+        self.writable.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        buffer.close()
+
+    async def test_drop_oldest(self):
+        buffer = self.make_buffer(send_buffer.DROP_OLDEST)
+        for n in range(5):
+            buffer.put(f'frame {n}')
+        self.assertEqual(list(buffer.queue), ['frame 2', 'frame 3', 'frame 4'])
+        self.assertEqual(self.changes(), {
+            'dropped_messages': 2, 'buffered_messages': 3, 'buffered_bytes': 21,
+        })
+
+        await self.drain(buffer)
+        self.assertEqual(self.sent, ['frame 2', 'frame 3', 'frame 4'])
+        self.assertEqual(self.changes(), {'dropped_messages': 2, 'sent_messages': 3})
+
+    async def test_drop_oldest_by_bytes(self):
+        buffer = self.make_buffer(send_buffer.DROP_OLDEST, max_messages=100, max_bytes=20)
+        for frame in ('a' * 8, 'b' * 8, 'c' * 8):
+            buffer.put(frame)
+        self.assertEqual(list(buffer.queue), ['b' * 8, 'c' * 8])
+        self.assertEqual(buffer.buffered_bytes, 16)
+        buffer.close()
+
+    async def test_disconnect(self):
+        buffer = self.make_buffer(send_buffer.DISCONNECT)
+        for n in range(4):
+            buffer.put(f'frame {n}')
+        await asyncio.sleep(0)
+
+        self.assertTrue(buffer.closed)
+        self.assertEqual(self.close_codes, [send_buffer.SLOW_CONSUMER_CLOSE_CODE])
+        buffer.put('after close')
+        self.assertEqual(list(buffer.queue), [])
+        self.assertEqual(self.changes(), {'disconnects': 1})
+
+    async def test_resync(self):
+        buffer = self.make_buffer(send_buffer.RESYNC)
+        for n in range(4):
+            buffer.put(f'frame {n}')
+        self.assertEqual(list(buffer.queue), [send_buffer.RESYNC_NOTICE])
+
+        await self.drain(buffer)
+        self.assertEqual(self.sent, [send_buffer.RESYNC_NOTICE])
+        self.assertEqual(self.changes(), {'dropped_messages': 3, 'resyncs': 1, 'sent_messages': 1})
+
+    async def test_oversized_frame_becomes_resync_notice(self):
+        for policy in send_buffer.POLICIES:
+            with self.subTest(policy=policy):
+                self.before = send_buffer.stats()
+                buffer = self.make_buffer(policy, max_messages=10, max_bytes=50)
+                buffer.put('a' * 10)
+                buffer.put('x' * 100)
+                buffer.put('b' * 10)
+
+                # What was already queued survives, and the big frame can't push the queue past its limit
+                self.assertFalse(buffer.closed)
+                self.assertEqual(list(buffer.queue), ['a' * 10, send_buffer.RESYNC_NOTICE, 'b' * 10])
+                self.assertLessEqual(buffer.buffered_bytes, buffer.max_bytes)
+                self.assertEqual(self.changes(), {
+                    'oversized_messages': 1, 'dropped_messages': 1, 'resyncs': 1,
+                    'buffered_messages': 3, 'buffered_bytes': 20 + len(send_buffer.RESYNC_NOTICE),
+                })
+                buffer.close()
+
+
+class ChatRoomAccessTests(TestCase):
+    """A direct chat room admits only its two participants and only carries messages between them"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('speaker', 'speaker@example.com', 'unused')
+        self.other = User.objects.create_user('listener', 'listener@example.com', 'unused')
+        self.bystander = User.objects.create_user('bystander', 'bystander@example.com', 'unused')
+
+    async def test_unauthorized_rooms_are_closed(self):
+        inactive = await User.objects.acreate(username='gone', is_active=False)
+        for room in ('lobby', str(self.user.id), '999999', str(inactive.id)):
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{room}/')
+            communicator.scope['user'] = self.user
+            communicator.scope['url_route'] = {'args': (), 'kwargs': {'room_name': room}}
+            connected, code = await communicator.connect()
+            self.assertFalse(connected, room)
+            self.assertEqual(code, 4003, room)
+
+    async def test_participants_share_the_room(self):
+        speaker = chat_communicator(self.user, self.other)
+        listener = chat_communicator(self.other, self.user)
+        bystander = chat_communicator(self.bystander, self.other)
+        for communicator in (speaker, listener, bystander):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+        await speaker.send_json_to({'message': 'just us', 'receiver_id': self.other.id})
+        expected = {'message': 'just us', 'sender_username': self.user.username}
+        self.assertEqual(await listener.receive_json_from(), expected)
+        self.assertEqual(await speaker.receive_json_from(), expected)
+        self.assertTrue(await bystander.receive_nothing(0.1))
+        for communicator in (speaker, listener, bystander):
+            await communicator.disconnect()
+
+    async def test_blocked_sender_cannot_redirect_to_the_room(self):
+        await UserBlock.objects.acreate(blocker=self.other, blocked=self.user)
+        speaker = chat_communicator(self.user, self.other)
+        listener = chat_communicator(self.other, self.user)
+        for communicator in (speaker, listener):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+        # Naming someone else as the receiver used to skip the block check and reach the whole room
+        await speaker.send_json_to({'message': 'sneaky', 'receiver_id': self.bystander.id})
+        self.assertIn('error', await speaker.receive_json_from())
+
+        # Addressed properly, the message is only echoed back and stored as blocked
+        await speaker.send_json_to({'message': 'hello?', 'receiver_id': self.other.id})
+        response = await speaker.receive_json_from()
+        self.assertNotIn('error', response)
+        self.assertTrue(await listener.receive_nothing(0.2))
+        self.assertTrue(await Message.objects.filter(sender=self.user, receiver=self.other, blocked=True).aexists())
+        for communicator in (speaker, listener):
+            await communicator.disconnect()
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import send_message, send_message_with_media, get_messages, delete_message
+from .views import send_message, send_message_with_media, get_messages, delete_message, get_friends_presence
 from .media_views import serve_media
 
 urlpatterns = [
@@ -8,4 +8,5 @@ urlpatterns = [
     path("<int:receiver_id>/", get_messages, name="get_messages"),
     path("media/<int:attachment_id>/", serve_media, name="serve_media"),
     path("delete/<int:message_id>/", delete_message, name="delete_message"),
+    path("presence/", get_friends_presence, name="get_friends_presence"),
 ]
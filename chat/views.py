@@ -6,11 +6,12 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from django.contrib.auth.models import User
 from .models import Message, MediaAttachment
 from .serializers import MessageSerializer, MediaAttachmentSerializer
+from . import archive, block_cache, presence
+from .media_views import detect_file_type
 from django.db import models
 from django.conf import settings
-from cryptography.fernet import Fernet
-
-cipher = Fernet(settings.ENCRYPTION_KEY)
+from .encryption import encrypt_text
+from backend.pagination import parse_limit
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -30,13 +31,15 @@ def send_message(request):
         return Response({"error": "Receiver not found."}, status=404)
 
     # ✅ 2️⃣ Encrypt Message
-    encrypted_text = cipher.encrypt(text.encode())
+    encrypted_text = encrypt_text(text)
 
-    # ✅ 3️⃣ Save Message
+    # ✅ 3️⃣ Save Message, flagged if the receiver has blocked the sender
+    _, receiver_blocked_sender = block_cache.block_status(sender.id, receiver.id)
     message = Message.objects.create(
         sender=sender,
         receiver=receiver,
-        encrypted_text=encrypted_text
+        encrypted_text=encrypted_text,
+        blocked=receiver_blocked_sender
     )
 
     # ✅ 4️⃣ Return Response
@@ -46,28 +49,61 @@ def send_message(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_messages(request, receiver_id):
-    """Get chat messages with a specific user"""
+    """
+    Get chat messages with a specific user. Without paging parameters this returns the
+    recent (hot) history as a list; with ?limit= and/or ?before=<cursor> it returns one
+    page of {"results", "before"}, reaching into the archive for older messages.
+    """
     user = request.user
     try:
         receiver = User.objects.get(id=receiver_id)
     except User.DoesNotExist:
         return Response({"error": "Receiver not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    # Check if the current user has blocked the receiver
-    from authentication.models import UserBlock
-    user_blocked_receiver = UserBlock.objects.filter(
-        blocker=user,
-        blocked=receiver
-    ).exists()
+    # Check if the current user has blocked the receiver (served from the block cache)
+    user_blocked_receiver, _ = block_cache.block_status(user.id, receiver.id)
 
     # Get all messages between these users
     messages = Message.objects.filter(
         (models.Q(sender=user, receiver=receiver) | models.Q(sender=receiver, receiver=user))
-    ).order_by('timestamp')
+    ).select_related('sender').prefetch_related('attachments').order_by('timestamp')
 
-    # Filter out messages from blocked users
+    # Block state is applied here at read time rather than by rewriting rows when a block is created.
+    # Only messages sent during a block carry the flag, so history from before the block
+    # shows again once it is lifted; the sender always sees their own messages.
     if user_blocked_receiver:
+        # Hide everything from a user we currently block
         messages = messages.filter(~models.Q(sender=receiver))
+    else:
+        # Messages sent to us while we had them blocked stay hidden after unblocking
+        messages = messages.exclude(sender=receiver, blocked=True)
+
+    if 'before' in request.query_params or 'limit' in request.query_params:
+        limit = parse_limit(
+            request.query_params.get('limit'),
+            getattr(settings, 'CHAT_MESSAGES_PAGE_SIZE', 50),
+            getattr(settings, 'CHAT_MESSAGES_MAX_PAGE_SIZE', 200)
+        )
+
+        def keep(row):
+            # Same visibility rules as above, for archived rows
+            if row['sender_id'] != receiver.id:
+                return True
+            return not user_blocked_receiver and not row.get('blocked')
+
+        try:
+            page, before = archive.page_with_archive(
+                messages, archive.direct_archives(user.id, receiver.id),
+                request.query_params.get('before'), limit,
+                lambda row: archive.build_direct_message(row, user.id, receiver.id), keep
+            )
+        except ValueError:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Pages are fetched newest first but returned in reading order
+        page.reverse()
+        serializer = MessageSerializer(page, many=True, context={"request": request})
+        return Response({"results": serializer.data, "before": before})
 
     # Use the serializer to format the response
     serializer = MessageSerializer(messages, many=True, context={"request": request})
@@ -97,30 +133,20 @@ def send_message_with_media(request):
         return Response({"error": "Receiver not found."}, status=404)
 
     # Encrypt Message Text - ensure we never try to encrypt an empty string
-    encrypted_text = cipher.encrypt(text.encode()) if text.strip() else cipher.encrypt(b' ')  # Send a space if text is empty
+    encrypted_text = encrypt_text(text) if text.strip() else encrypt_text(' ')  # Send a space if text is empty
 
-    # Create Message
+    # Create Message, flagged if the receiver has blocked the sender
+    _, receiver_blocked_sender = block_cache.block_status(sender.id, receiver.id)
     message = Message.objects.create(
         sender=sender,
         receiver=receiver,
-        encrypted_text=encrypted_text  # Always have some encrypted text
+        encrypted_text=encrypted_text,  # Always have some encrypted text
+        blocked=receiver_blocked_sender
     )
 
     # Handle Media Attachment
     if media_file:
-        content_type = media_file.content_type.lower()
-
-        # Determine file type
-        if 'image/svg+xml' in content_type:
-            file_type = 'svg'
-        elif 'image/gif' in content_type:
-            file_type = 'gif'
-        elif 'image' in content_type:
-            file_type = 'image'
-        elif 'video' in content_type:
-            file_type = 'video'
-        else:
-            file_type = 'file'  # Generic file type for other files
+        file_type = detect_file_type(media_file)
 
         try:
             # Create media attachment
@@ -172,3 +198,17 @@ def delete_message(request, message_id):
             {"error": f"Error deleting message: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_friends_presence(request):
+    """Get online state and last seen time for the current user's friends"""
+    from authentication.friends import get_friend_ids
+
+    friend_ids = list(get_friend_ids(request.user.id))
+
+    return Response([
+        {"user_id": friend_id, **state}
+        for friend_id, state in presence.get_presence(friend_ids).items()
+    ])
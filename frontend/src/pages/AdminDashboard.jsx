@@ -72,7 +72,7 @@ export default function AdminDashboard() {
       if (!response.ok) throw new Error("Failed to fetch pending verifications");
 
       const data = await response.json();
-      setPendingVerifications(data);
+      setPendingVerifications(data.results);
       setLoading(false);
     } catch (err) {
       console.error(err);
@@ -91,7 +91,7 @@ export default function AdminDashboard() {
       if (!response.ok) throw new Error("Failed to fetch suspicious activity");
 
       const data = await response.json();
-      setSuspiciousActivity(data);
+      setSuspiciousActivity(data.results);
       setLoading(false);
     } catch (err) {
       console.error(err);
@@ -115,7 +115,7 @@ export default function AdminDashboard() {
       if (!response.ok) throw new Error("Failed to fetch reports");
 
       const data = await response.json();
-      setReports(data);
+      setReports(data.results);
       setLoading(false);
     } catch (err) {
       console.error(err);
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import { useParams } from "react-router-dom";
+import { startHeartbeat } from "../utils/websocketHelpers";
 
 export default function Chat() {
   const { receiverId } = useParams();
@@ -55,18 +56,9 @@ export default function Chat() {
 
         const data = await response.json();
 
-        // The backend now filters out messages from blocked users where the current user is the blocker
-        // We only need to filter out messages where the current user is blocked by the receiver
-        const filteredMessages = data.filter(msg => {
-          // If this message is blocked and I am the sender, don't show it
-          // (this means the receiver blocked me)
-          if (msg.blocked && msg.is_sender) {
-            return false;
-          }
-          return true;
-        });
-
-        setMessages(filteredMessages);
+        // Block visibility is decided by the backend: it leaves out messages from a user we block,
+        // and messages they sent while blocked; our own messages are always returned
+        setMessages(data);
       } catch (err) {
         console.error(err);
       }
@@ -161,8 +153,7 @@ export default function Chat() {
           }
 
           const data = await response.json();
-          const filteredMessages = data.filter(msg => !msg.blocked || msg.is_sender);
-          setMessages(filteredMessages);
+          setMessages(data);
         } catch (err) {
           console.error(err);
         }
@@ -259,14 +250,28 @@ export default function Chat() {
 
   useEffect(() => {
     const chatSocket = new WebSocket(
-      `${window.location.protocol === 'https:' ? 'wss' : 'ws'}://${window.location.host}/ws/chat/${receiverId}/`
+      `${window.location.protocol === 'https:' ? 'wss' : 'ws'}://${window.location.host}/ws/chat/${receiverId}/?token=${encodeURIComponent(localStorage.getItem("access_token"))}`
     );
 
-    const currentUserId = JSON.parse(localStorage.getItem("user"))?.id;
+    const stopHeartbeat = startHeartbeat(chatSocket);
 
     chatSocket.onmessage = function(e) {
       const data = JSON.parse(e.data);
 
+      if (data.resync) {
+        // The server dropped frames it couldn't deliver; reload the conversation over HTTP
+        fetch(`/api/chat/${receiverId}/`, {
+          headers: { "Authorization": `Bearer ${localStorage.getItem("access_token")}` },
+        })
+          .then(response => {
+            if (!response.ok) throw new Error("Failed to fetch messages.");
+            return response.json();
+          })
+          .then(history => setMessages(history))
+          .catch(err => console.error(err));
+        return;
+      }
+
       if (data.error) {
         setMessages(prevMessages => [...prevMessages, {
           id: Date.now(),
@@ -291,15 +296,14 @@ export default function Chat() {
       if (chatSocket.readyState === WebSocket.OPEN) {
         chatSocket.send(JSON.stringify({
           'message': text,
-          'sender_username': receiverName,
           'receiver_id': receiverId,
-          'sender_id': currentUserId,
           'timestamp': new Date().toISOString()
         }));
       }
     };
 
     return () => {
+      stopHeartbeat();
       chatSocket.close();
     };
   }, [receiverId]);
@@ -17,6 +17,10 @@ export default function GroupChat() {
   const [inviteMessage, setInviteMessage] = useState("");
   const messagesEndRef = useRef(null);
   const [isCreator, setIsCreator] = useState(false);
+  // Cursor for the next older page; null once the start of the history is reached
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const prependingRef = useRef(false);
 
   useEffect(() => {
     fetchGroupDetails();
@@ -25,7 +29,11 @@ export default function GroupChat() {
   }, [groupId]);
 
   useEffect(() => {
-    // Scroll to bottom whenever messages change
+    // Scroll to bottom whenever messages change, except when older ones are prepended
+    if (prependingRef.current) {
+      prependingRef.current = false;
+      return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages]);
 
@@ -60,13 +68,45 @@ export default function GroupChat() {
       }
 
       const data = await res.json();
-      setMessages(data);
+      setMessages(data.results);
+      setOlderCursor(data.before);
+
+      // Everything on the newest page has now been seen
+      fetch(`/api/groupchat/groups/${groupId}/read/`, {
+        method: "POST",
+        headers: { "Authorization": `Bearer ${localStorage.getItem("access_token")}` },
+      });
     } catch (err) {
       console.error("Error fetching messages:", err);
       setError("Failed to load messages");
     }
   };
 
+  const fetchOlderMessages = async () => {
+    if (!olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+
+    try {
+      const res = await fetch(`/api/groupchat/groups/${groupId}/messages/?before=${encodeURIComponent(olderCursor)}`, {
+        headers: { "Authorization": `Bearer ${localStorage.getItem("access_token")}` },
+      });
+
+      if (!res.ok) {
+        throw new Error("Failed to fetch older messages");
+      }
+
+      const data = await res.json();
+      prependingRef.current = true;
+      setMessages(prevMessages => [...data.results, ...prevMessages]);
+      setOlderCursor(data.before);
+    } catch (err) {
+      console.error("Error fetching older messages:", err);
+      setError("Failed to load older messages");
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const fetchMembers = async () => {
     try {
       const res = await fetch(`/api/groupchat/groups/${groupId}/members/`, {
@@ -300,6 +340,17 @@ export default function GroupChat() {
 
       {/* Chat Messages */}
       <div className="flex-1 overflow-y-auto p-4">
+        {olderCursor && (
+          <div className="text-center mb-2">
+            <button
+              onClick={fetchOlderMessages}
+              disabled={loadingOlder}
+              className="text-sm text-blue-600 hover:underline disabled:text-gray-400"
+            >
+              {loadingOlder ? "Loading..." : "Load older messages"}
+            </button>
+          </div>
+        )}
         {Object.entries(groupedMessages).length === 0 ? (
           <div className="text-center text-gray-500 mt-10">
             No messages yet. Be the first to send a message!
@@ -1,3 +1,20 @@
+// Under half of PRESENCE_TTL_SECONDS (60s) so one lost heartbeat doesn't show the user offline
+export const HEARTBEAT_INTERVAL_MS = 25000;
+
+/**
+ * Keep an open chat socket's presence alive while the user is idle
+ * @param {WebSocket} socket - The chat WebSocket
+ * @returns {function} Stops the heartbeat
+ */
+export const startHeartbeat = (socket) => {
+  const timer = setInterval(() => {
+    if (socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify({ 'type': 'heartbeat' }));
+    }
+  }, HEARTBEAT_INTERVAL_MS);
+  return () => clearInterval(timer);
+};
+
 /**
  * Set up a WebSocket connection for a chat with proper message handling
  * @param {string} roomName - The chat room name
@@ -8,12 +25,17 @@
  */
 export const setupChatWebSocket = (roomName, senderUsername, receiverId, senderId, onMessageReceived, onError) => {
   const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-  const wsUrl = `${wsProtocol}//${window.location.host}/ws/chat/${roomName}/`;
+  // The server resolves the sender from this token, so frames don't carry identity fields
+  const accessToken = localStorage.getItem("access_token");
+  const wsUrl = `${wsProtocol}//${window.location.host}/ws/chat/${roomName}/?token=${encodeURIComponent(accessToken)}`;
 
   const chatSocket = new WebSocket(wsUrl);
 
+  let stopHeartbeat = null;
+
   chatSocket.onopen = function() {
     console.log('WebSocket connection established');
+    stopHeartbeat = startHeartbeat(chatSocket);
   };
 
   chatSocket.onmessage = function(e) {
@@ -30,6 +52,7 @@ export const setupChatWebSocket = (roomName, senderUsername, receiverId, senderI
 
   chatSocket.onclose = function(e) {
     console.log('WebSocket connection closed');
+    stopHeartbeat && stopHeartbeat();
   };
 
   chatSocket.onerror = function(err) {
@@ -42,9 +65,7 @@ export const setupChatWebSocket = (roomName, senderUsername, receiverId, senderI
     if (chatSocket.readyState === WebSocket.OPEN) {
       chatSocket.send(JSON.stringify({
         'message': messageText,
-        'sender_username': senderUsername,
-        'receiver_id': receiverId,
-        'sender_id': senderId
+        'receiver_id': receiverId
       }));
     } else {
       onError && onError({ error: 'Chat connection not available' });
@@ -0,0 +1,8 @@
+def is_member(group_id, user_id):
+    """
+    Check group membership against the database, so a removed member loses access
+    at once on every worker. One lookup on the (group, user) unique index.
+    """
+    from .models import Group
+
+    return Group.members.through.objects.filter(group_id=group_id, user_id=user_id).exists()
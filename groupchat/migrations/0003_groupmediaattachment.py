@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groupchat', '0002_groupmessage_index_groupreadcursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupMediaAttachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_type', models.CharField(max_length=20)),
+                ('encrypted_data', models.BinaryField(blank=True, null=True)),
+                ('original_filename', models.CharField(blank=True, max_length=255)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('file', models.FileField(upload_to='group_attachments/')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='groupchat.groupmessage')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
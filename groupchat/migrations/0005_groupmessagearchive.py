@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groupchat', '0004_group_deleted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupMessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('message_count', models.IntegerField(default=0)),
+                ('payload', models.BinaryField()),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='groupchat.group')),
+            ],
+            options={
+                'unique_together': {('group', 'month')},
+            },
+        ),
+    ]
@@ -1,9 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from cryptography.fernet import Fernet
-from django.conf import settings
-
-cipher = Fernet(settings.ENCRYPTION_KEY)
+from chat.models import EncryptedAttachment
+from chat.encryption import encrypt_text, decrypt_text
 
 class Group(models.Model):
     name = models.CharField(max_length=255)
@@ -11,6 +9,7 @@ class Group(models.Model):
     members = models.ManyToManyField(User, related_name="group_memberships")
     created_at = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True, null=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)  # Set when deletion is queued, rows purged later
 
     def __str__(self):
         return self.name
@@ -24,17 +23,51 @@ class GroupMessage(models.Model):
     def save(self, *args, **kwargs):
         """Encrypt message before saving"""
         if isinstance(self.encrypted_text, str):
-            self.encrypted_text = cipher.encrypt(self.encrypted_text.encode())
+            self.encrypted_text = encrypt_text(self.encrypted_text)
         super().save(*args, **kwargs)
 
     def get_decrypted_message(self):
         """Decrypt message"""
-        if isinstance(self.encrypted_text, memoryview):
-            encrypted_data = bytes(self.encrypted_text)
-        else:
-            encrypted_data = self.encrypted_text
+        decrypted = decrypt_text(self.encrypted_text)
+        # A single space is the placeholder for media-only messages
+        return "" if decrypted == " " else decrypted
 
-        return cipher.decrypt(encrypted_data).decode()
+    class Meta:
+        indexes = [
+            # Keyset pagination and unread counts walk a group's history in (timestamp, id) order
+            models.Index(fields=['group', 'timestamp', 'id'], name='groupmsg_group_ts_id_idx'),
+        ]
 
     def __str__(self):
         return f"Message in {self.group.name} by {self.sender.username}"
+
+class GroupMediaAttachment(EncryptedAttachment):
+    """File shared with a whole group: stored and encrypted once, authorized by membership"""
+    message = models.ForeignKey(GroupMessage, on_delete=models.CASCADE, related_name="attachments")
+    file = models.FileField(upload_to='group_attachments/')
+
+class GroupMessageArchive(models.Model):
+    """Cold tier for old group messages: one compressed row per group per month (see chat/archive.py)"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="archives")
+    month = models.DateField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.IntegerField(default=0)
+    payload = models.BinaryField()
+
+    class Meta:
+        unique_together = ('group', 'month')
+
+class GroupReadCursor(models.Model):
+    """Position of the newest message a member has read in a group"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="read_cursors")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="group_read_cursors")
+    last_read_timestamp = models.DateTimeField(null=True, blank=True)
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('group', 'user')
+
+    def __str__(self):
+        return f"{self.user.username} read {self.group.name} up to {self.last_read_message_id}"
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Group, GroupMessage
+from backend.profiling import TimedSerializerMixin
+from .models import Group, GroupMessage, GroupMediaAttachment
 from django.contrib.auth.models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -7,7 +8,7 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username']
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     creator_username = serializers.ReadOnlyField(source='creator.username')
     members_count = serializers.SerializerMethodField()
 
@@ -16,24 +17,39 @@ class GroupSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'creator', 'creator_username', 'description', 'created_at', 'members_count']
 
     def get_members_count(self, obj):
+        # Listing views annotate the count to avoid a query per group
+        if hasattr(obj, 'num_members'):
+            return obj.num_members
         return obj.members.count()
 
-class GroupMemberSerializer(serializers.ModelSerializer):
+class GroupMemberSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     members = UserSerializer(many=True, read_only=True)
 
     class Meta:
         model = Group
         fields = ['members']
 
-class GroupMessageSerializer(serializers.ModelSerializer):
+class GroupMediaAttachmentSerializer(serializers.ModelSerializer):
+    file_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GroupMediaAttachment
+        fields = ['id', 'file_type', 'file_url', 'timestamp']
+
+    def get_file_url(self, obj):
+        # Served through the authenticated media endpoint, like chat attachments
+        return f"/api/groupchat/media/{obj.id}/"
+
+class GroupMessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     sender_username = serializers.CharField(source="sender.username", read_only=True)
     timestamp = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
     decrypted_text = serializers.SerializerMethodField()
     is_sender = serializers.SerializerMethodField()
+    attachments = GroupMediaAttachmentSerializer(many=True, read_only=True)
 
     class Meta:
         model = GroupMessage
-        fields = ["id", "sender", "sender_username", "group", "decrypted_text", "timestamp", "is_sender"]
+        fields = ["id", "sender", "sender_username", "group", "decrypted_text", "timestamp", "is_sender", "attachments"]
 
     def get_decrypted_text(self, obj):
         try:
@@ -43,4 +59,4 @@ class GroupMessageSerializer(serializers.ModelSerializer):
 
     def get_is_sender(self, obj):
         request = self.context.get("request")
-        return request and obj.sender == request.user
+        return request and obj.sender_id == request.user.id
@@ -1,3 +1,156 @@
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from rest_framework.test import APIClient
+from backend.testing import QueryScalingTestCase, make_users
+from chat.encryption import cipher, encrypt_text
+from . import membership
+from .models import Group, GroupMessage, GroupMediaAttachment
 
-# Create your tests here.
+PNG = b'\x89PNG\r\n\x1a\n scaling test'
+
+
+class GroupChatEndpointScalingTests(QueryScalingTestCase):
+    """Every URL in groupchat/urls.py keeps a flat query count as groups, members and messages grow"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'unused')
+        self.group = Group.objects.create(name='scaling', creator=self.user)
+        self.group.members.add(self.user)
+        self.members, self.outsiders, self.doomed_groups = [], [], []
+
+    def grow(self, count):
+        """Add members, outsiders, other groups of the owner and messages from every member"""
+        members = make_users('member', count)
+        self.members += members
+        self.outsiders += make_users('outsider', count)
+        self.group.members.add(*members)
+
+        groups = Group.objects.bulk_create([Group(name=f'extra{index}', creator=self.user) for index in range(count)])
+        groups = list(Group.objects.filter(name__startswith='extra').order_by('-id')[:len(groups)])
+        Group.members.through.objects.bulk_create([
+            Group.members.through(group_id=group.id, user_id=user.id) for group in groups for user in [self.user, *members[:2]]
+        ])
+        self.doomed_groups = sorted(groups, key=lambda group: group.id)
+
+        payload = encrypt_text('scaling test message')
+        messages = GroupMessage.objects.bulk_create([
+            GroupMessage(group=self.group, sender=sender, encrypted_text=payload) for sender in [self.user, *members]
+        ])
+        messages = list(GroupMessage.objects.filter(group=self.group).order_by('-id')[:len(messages)])
+        media = cipher.encrypt(PNG)
+        GroupMediaAttachment.objects.bulk_create([
+            GroupMediaAttachment(message=message, file='group_attachments/scaling.png', file_type='image',
+                                 encrypted_data=media, original_filename='scaling.png')
+            for message in messages[::3]
+        ])
+
+    def test_get_user_groups(self):
+        self.assertScales(lambda run: self.client_for(self.user).get('/api/groupchat/groups/'))
+
+    def test_create_group(self):
+        self.assertScales(lambda run: self.client_for(self.user).post(
+            '/api/groupchat/groups/create/', {'name': f'new{run}'}, format='json'), status=201)
+
+    def test_get_group_details(self):
+        self.assertScales(lambda run: self.client_for(self.user).get(f'/api/groupchat/groups/{self.group.id}/'))
+
+    def test_get_group_members(self):
+        self.assertScales(lambda run: self.client_for(self.user).get(f'/api/groupchat/groups/{self.group.id}/members/'))
+
+    def test_add_group_member(self):
+        self.assertScales(lambda run: self.client_for(self.user).post(
+            f'/api/groupchat/groups/{self.group.id}/members/add/', {'user_id': self.outsiders[run].id}, format='json'))
+
+    def test_remove_group_member(self):
+        self.assertScales(lambda run: self.client_for(self.user).delete(
+            f'/api/groupchat/groups/{self.group.id}/members/{self.members[run].id}/remove/'))
+
+    def test_delete_group(self):
+        self.assertScales(lambda run: self.client_for(self.user).delete(
+            f'/api/groupchat/groups/{self.doomed_groups[run].id}/delete/'), status=202)
+
+    def test_send_group_message(self):
+        self.assertScales(lambda run: self.client_for(self.user).post(
+            '/api/groupchat/messages/send/', {'group': self.group.id, 'text': f'hello {run}'}, format='json'),
+            status=201)
+
+    def test_send_group_message_with_media(self):
+        self.assertScales(lambda run: self.client_for(self.user).post('/api/groupchat/messages/send-with-media/', {
+            'group': self.group.id, 'text': f'photo {run}', 'media': SimpleUploadedFile('photo.png', PNG, 'image/png')
+        }, format='multipart'), status=201)
+
+    def test_serve_group_media(self):
+        def call(run):
+            attachment = GroupMediaAttachment.objects.filter(message__group=self.group).order_by('id').first()
+            return self.client_for().get(
+                f'/api/groupchat/media/{attachment.id}/?auth_token={self.token_for(self.user)}')
+        self.assertScales(call)
+
+    def test_get_group_messages(self):
+        self.assertScales(lambda run: self.client_for(self.user).get(f'/api/groupchat/groups/{self.group.id}/messages/'))
+
+    def test_mark_group_read(self):
+        self.assertScales(lambda run: self.client_for(self.user).post(f'/api/groupchat/groups/{self.group.id}/read/'))
+
+    def test_get_group_unread_count(self):
+        self.assertScales(lambda run: self.client_for(self.user).get(f'/api/groupchat/groups/{self.group.id}/unread/'))
+
+
+class GroupMembershipAccessTests(TestCase):
+    """Removing a member takes effect at once, on every worker"""
+
+    def setUp(self):
+        self.owner, self.member = make_users('access', 2)
+        self.group = Group.objects.create(name='access', creator=self.owner)
+        self.group.members.add(self.owner, self.member)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_removed_member_loses_access_immediately(self):
+        messages_url = f'/api/groupchat/groups/{self.group.id}/messages/'
+        self.assertEqual(self.client_for(self.member).get(messages_url).status_code, 200)
+        self.assertTrue(membership.is_member(self.group.id, self.member.id))
+
+        response = self.client_for(self.owner).delete(
+            f'/api/groupchat/groups/{self.group.id}/members/{self.member.id}/remove/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(membership.is_member(self.group.id, self.member.id))
+
+        self.assertEqual(self.client_for(self.member).get(messages_url).status_code, 404)
+        response = self.client_for(self.member).post(
+            '/api/groupchat/messages/send/', {'group': self.group.id, 'text': 'still here?'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class GroupReadCursorTests(TestCase):
+    """mark_group_read only moves forward and rejects malformed message ids"""
+
+    def setUp(self):
+        self.owner, self.member = make_users('reader', 2)
+        self.group = Group.objects.create(name='reader', creator=self.owner)
+        self.group.members.add(self.owner, self.member)
+        self.messages = [
+            GroupMessage.objects.create(group=self.group, sender=self.owner, encrypted_text=f'message {n}')
+            for n in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+
+    def mark_read(self, data):
+        return self.client.post(f'/api/groupchat/groups/{self.group.id}/read/', data, format='json')
+
+    def test_invalid_message_id_is_rejected(self):
+        for message_id in ('abc', '1.5', [1]):
+            response = self.mark_read({'message_id': message_id})
+            self.assertEqual(response.status_code, 400, message_id)
+
+    def test_cursor_never_moves_backwards(self):
+        newest = self.messages[-1]
+        self.assertEqual(self.mark_read({'message_id': str(newest.id)}).data['last_read_message_id'], newest.id)
+        self.assertEqual(self.mark_read({'message_id': self.messages[0].id}).data['last_read_message_id'], newest.id)
+        self.assertEqual(self.mark_read({'message_id': 10 ** 9}).status_code, 404)
+        self.assertEqual(self.mark_read({}).data['last_read_message_id'], newest.id)
@@ -10,5 +10,9 @@ urlpatterns = [
     path('groups/<int:group_id>/members/<int:user_id>/remove/', views.remove_group_member, name='remove_group_member'),
     path('groups/<int:group_id>/delete/', views.delete_group, name='delete_group'),
     path('messages/send/', views.send_group_message, name='send_group_message'),
+    path('messages/send-with-media/', views.send_group_message_with_media, name='send_group_message_with_media'),
+    path('media/<int:attachment_id>/', views.serve_group_media, name='serve_group_media'),
     path('groups/<int:group_id>/messages/', views.get_group_messages, name='get_group_messages'),
+    path('groups/<int:group_id>/read/', views.mark_group_read, name='mark_group_read'),
+    path('groups/<int:group_id>/unread/', views.get_group_unread_count, name='get_group_unread_count'),
 ]
@@ -1,18 +1,37 @@
+import logging
 from django.shortcuts import render
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes, authentication_classes
+from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.models import User
-from .models import Group, GroupMessage
+from django.conf import settings
+from django.db.models import Q, Count
+from django.http import HttpResponse, Http404
+from .models import Group, GroupMessage, GroupReadCursor, GroupMediaAttachment, GroupMessageArchive
 from .serializers import GroupSerializer, GroupMessageSerializer, GroupMemberSerializer
+from .membership import is_member
+from authentication.deletion import schedule_group_deletion
+from chat import archive
+from chat.media_views import detect_file_type, authenticate_media_request, build_media_response
 from django.shortcuts import get_object_or_404
+from backend.pagination import parse_limit
+
+# Set up logging
+logger = logging.getLogger(__name__)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_user_groups(request):
     """Get all groups the current user is a member of"""
-    groups = Group.objects.filter(members=request.user)
+    # Annotate before filtering so the count isn't limited to the filter's join
+    groups = (
+        Group.objects
+        .annotate(num_members=Count('members', distinct=True))
+        .filter(members=request.user)
+        .select_related('creator')
+    )
     serializer = GroupSerializer(groups, many=True)
     return Response(serializer.data)
 
@@ -35,8 +54,16 @@ def create_group(request):
 @permission_classes([IsAuthenticated])
 def get_group_details(request, group_id):
     """Get details of a specific group"""
+    if not is_member(group_id, request.user.id):
+        return Response({"detail": "Group not found or you're not a member"}, status=status.HTTP_404_NOT_FOUND)
+
     try:
-        group = Group.objects.get(id=group_id, members=request.user)
+        group = (
+            Group.objects
+            .annotate(num_members=Count('members', distinct=True))
+            .select_related('creator')
+            .get(id=group_id)
+        )
     except Group.DoesNotExist:
         return Response({"detail": "Group not found or you're not a member"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -60,7 +87,7 @@ def get_group_members(request, group_id):
 def add_group_member(request, group_id):
     """Add a member to the group"""
     try:
-        group = Group.objects.get(id=group_id)
+        group = Group.objects.get(id=group_id, deleted_at__isnull=True)
         # Only creator can add members
         if group.creator != request.user:
             return Response({"detail": "Only the creator can add members"}, status=status.HTTP_403_FORBIDDEN)
@@ -83,7 +110,7 @@ def add_group_member(request, group_id):
 @permission_classes([IsAuthenticated])
 def remove_group_member(request, group_id, user_id):
     """Remove a member from the group"""
-    group = get_object_or_404(Group, id=group_id)
+    group = get_object_or_404(Group, id=group_id, deleted_at__isnull=True)
 
     # Only creator can remove members, or users can remove themselves
     if group.creator != request.user and int(user_id) != request.user.id:
@@ -103,13 +130,15 @@ def remove_group_member(request, group_id, user_id):
 @permission_classes([IsAuthenticated])
 def delete_group(request, group_id):
     """Delete a group (creator only)"""
-    group = get_object_or_404(Group, id=group_id)
+    group = get_object_or_404(Group, id=group_id, deleted_at__isnull=True)
 
     if group.creator != request.user:
         return Response({"detail": "Only the creator can delete the group"}, status=status.HTTP_403_FORBIDDEN)
 
-    group.delete()
-    return Response({"detail": "Group deleted successfully"})
+    # Hide the group now; its messages are purged in the background (manage.py purge_deletions)
+    job = schedule_group_deletion(group, requested_by=request.user)
+    return Response({"detail": "Group deleted successfully", "deletion_job_id": job.id},
+                    status=status.HTTP_202_ACCEPTED)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -123,12 +152,15 @@ def send_group_message(request):
         return Response({"detail": "Group ID and message text are required"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        group = Group.objects.get(id=group_id, members=request.user)
-    except Group.DoesNotExist:
+        group_id = int(group_id)
+    except (TypeError, ValueError):
+        return Response({"detail": "Invalid group ID"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not is_member(group_id, request.user.id):
         return Response({"detail": "Group not found or you're not a member"}, status=status.HTTP_404_NOT_FOUND)
 
     message = GroupMessage.objects.create(
-        group=group,
+        group_id=group_id,
         sender=request.user,
         encrypted_text=text
     )
@@ -136,15 +168,150 @@ def send_group_message(request):
     serializer = GroupMessageSerializer(message, context={"request": request})
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser])
+def send_group_message_with_media(request):
+    """Send a message with an attachment to a group; the file is stored and encrypted once for all members"""
+    data = request.data
+    group_id = data.get('group')
+    text = data.get('text', '')
+    media_file = request.FILES.get('media')
+
+    if not group_id:
+        return Response({"detail": "Group ID is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not text and not media_file:
+        return Response({"detail": "Either message text or media is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        group_id = int(group_id)
+    except (TypeError, ValueError):
+        return Response({"detail": "Invalid group ID"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not is_member(group_id, request.user.id):
+        return Response({"detail": "Group not found or you're not a member"}, status=status.HTTP_404_NOT_FOUND)
+
+    message = GroupMessage.objects.create(
+        group_id=group_id,
+        sender=request.user,
+        encrypted_text=text if text.strip() else ' '  # Placeholder for media-only messages
+    )
+
+    if media_file:
+        try:
+            GroupMediaAttachment.objects.create(
+                message=message,
+                file=media_file,
+                file_type=detect_file_type(media_file)
+            )
+        except ValueError as e:
+            message.delete()
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = GroupMessageSerializer(message, context={"request": request})
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+@api_view(["GET"])
+@authentication_classes([])  # Authenticated by ?auth_token=, like chat media
+@permission_classes([])
+def serve_group_media(request, attachment_id):
+    """Serve a decrypted group attachment to members of the group"""
+    user, error_response = authenticate_media_request(request)
+    if error_response:
+        return error_response
+
+    try:
+        attachment = get_object_or_404(GroupMediaAttachment.objects.select_related('message'), id=attachment_id)
+
+        if not is_member(attachment.message.group_id, user.id):
+            return HttpResponse("Access denied", status=403)
+
+        return build_media_response(attachment)
+
+    except Http404:
+        raise
+    except Exception as e:
+        logger.exception(f"Group media serving error: {str(e)}", extra={'sample_key': 'media.serve_error'})
+        return HttpResponse("Error serving media", status=500)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_group_messages(request, group_id):
-    """Get all messages in a group"""
+    """
+    Get a page of messages in a group, newest page first; pass ?before=<cursor> for older pages.
+    Once the hot table runs out, older pages come from the monthly archive.
+    """
+    if not is_member(group_id, request.user.id):
+        return Response({"detail": "Group not found or you're not a member"}, status=status.HTTP_404_NOT_FOUND)
+
+    limit = parse_limit(
+        request.query_params.get('limit'),
+        getattr(settings, 'GROUP_MESSAGES_PAGE_SIZE', 50),
+        getattr(settings, 'GROUP_MESSAGES_MAX_PAGE_SIZE', 200)
+    )
+
+    messages = GroupMessage.objects.filter(group_id=group_id).select_related('sender').prefetch_related('attachments')
     try:
-        group = Group.objects.get(id=group_id, members=request.user)
-    except Group.DoesNotExist:
+        page, before = archive.page_with_archive(
+            messages, GroupMessageArchive.objects.filter(group_id=group_id),
+            request.query_params.get('before'), limit,
+            lambda row: archive.build_group_message(row, group_id)
+        )
+    except ValueError:
+        return Response({"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Pages are fetched newest first but returned in reading order
+    page.reverse()
+    serializer = GroupMessageSerializer(page, many=True, context={"request": request})
+    return Response({"results": serializer.data, "before": before})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_group_read(request, group_id):
+    """Move the current user's read cursor forward to a message (defaults to the newest one)"""
+    if not is_member(group_id, request.user.id):
         return Response({"detail": "Group not found or you're not a member"}, status=status.HTTP_404_NOT_FOUND)
 
-    messages = GroupMessage.objects.filter(group=group).order_by('timestamp')
-    serializer = GroupMessageSerializer(messages, many=True, context={"request": request})
-    return Response(serializer.data)
+    messages = GroupMessage.objects.filter(group_id=group_id)
+    message_id = request.data.get('message_id')
+    if message_id is not None:
+        try:
+            message_id = int(message_id)
+        except (TypeError, ValueError):
+            return Response({"detail": "Invalid message ID"}, status=status.HTTP_400_BAD_REQUEST)
+        message = messages.filter(id=message_id).only('id', 'timestamp').first()
+    else:
+        message = messages.order_by('-timestamp', '-id').only('id', 'timestamp').first()
+
+    if not message:
+        return Response({"detail": "Message not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    cursor, _ = GroupReadCursor.objects.get_or_create(group_id=group_id, user=request.user)
+
+    # Never move the cursor backwards
+    if cursor.last_read_timestamp is None or (message.timestamp, message.id) > (cursor.last_read_timestamp, cursor.last_read_message_id):
+        cursor.last_read_timestamp = message.timestamp
+        cursor.last_read_message_id = message.id
+        cursor.save()
+
+    return Response({"last_read_message_id": cursor.last_read_message_id})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_group_unread_count(request, group_id):
+    """Count messages from other members after the current user's read cursor"""
+    if not is_member(group_id, request.user.id):
+        return Response({"detail": "Group not found or you're not a member"}, status=status.HTTP_404_NOT_FOUND)
+
+    unread = GroupMessage.objects.filter(group_id=group_id).exclude(sender=request.user)
+
+    cursor = GroupReadCursor.objects.filter(group_id=group_id, user=request.user).first()
+    if cursor and cursor.last_read_timestamp:
+        # Same (group, timestamp, id) range scan as the message pages
+        unread = unread.filter(
+            Q(timestamp__gt=cursor.last_read_timestamp) |
+            Q(timestamp=cursor.last_read_timestamp, id__gt=cursor.last_read_message_id)
+        )
+
+    return Response({"unread_count": unread.count()})